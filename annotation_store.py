@@ -0,0 +1,181 @@
+import csv
+import os
+import re
+from collections import defaultdict
+from datetime import datetime
+
+# 支持的日期格式，按优先级排列（parse_date也按这个顺序尝试）
+DATE_FORMATS = [
+    "%Y/%m/%d", "%Y-%m-%d", "%Y.%m.%d",
+    "%Y年%m月%d日", "%m/%d/%Y", "%d/%m/%Y",
+    "%m-%d-%Y", "%d-%m-%Y"
+]
+
+# 按日期命名的注释文件 annotations-YYYYMMDD.csv
+_DAY_FILE = re.compile(r'^annotations-(\d{8})\.csv$')
+
+# 注释文件名中的日期，不是按日期命名的注释文件时返回None
+def _day_file_date(name):
+    match = _DAY_FILE.match(name)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), '%Y%m%d').date()
+    except ValueError:
+        return None
+
+# 推断一列日期文本的格式: 返回能解析所有值的第一个格式，没有时返回None
+def infer_date_format(values):
+    for fmt in DATE_FORMATS:
+        try:
+            for value in values:
+                datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+# 解析一列日期文本，返回 {文本: date}
+# 每个文件只推断一次格式，每个不同的值只解析一次；没有统一格式时逐个值回退到dateutil，无法解析的值不在结果中
+def parse_date_column(values):
+    unique = sorted(set(values))
+    fmt = infer_date_format(unique)
+    if fmt is not None:
+        return {value: datetime.strptime(value, fmt).date() for value in unique}
+
+    from dateutil import parser as date_parser
+    parsed = {}
+    for value in unique:
+        for candidate in DATE_FORMATS:
+            try:
+                parsed[value] = datetime.strptime(value, candidate).date()
+                break
+            except ValueError:
+                continue
+        else:
+            try:
+                parsed[value] = date_parser.parse(value).date()
+            except (ValueError, OverflowError):
+                print(f"警告: 无法解析注释日期 '{value}'，忽略该行")
+    return parsed
+
+# 读取一个注释CSV，返回 [(时间文本, 描述, y偏移量, date或None)]
+# 列: 时间, 活动描述, Y偏移量(可选), 日期(可选)
+def read_annotation_rows(csv_file):
+    rows = []
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # 跳过标题行
+        for row in reader:
+            if len(row) < 2:
+                continue
+
+            # 可选的第三列作为y偏移量
+            y_offset = 0
+            if len(row) > 2 and row[2].strip():
+                try:
+                    y_offset = float(row[2])
+                except ValueError:
+                    pass
+
+            date_text = row[3].strip() if len(row) > 3 else ''
+            rows.append((row[0].strip(), row[1].strip(), y_offset, date_text))
+
+    dates = parse_date_column([date_text for *_, date_text in rows if date_text])
+    result = []
+    for time_str, text, y_offset, date_text in rows:
+        if date_text and date_text not in dates:
+            continue
+        result.append((time_str, text, y_offset, dates.get(date_text)))
+    return result
+
+class AnnotationStore:
+    """
+    所有注释的内存索引
+
+    一次读取注释目录中全部的 annotations-YYYYMMDD.csv 和/或一个多日合并的注释CSV，按日期建立索引，
+    之后查询任意一天都是一次字典查找，不再逐天打开和解析文件
+    - 目录中某天的文件: 没有日期列的行属于该天，日期列为其他日期的行被忽略
+    - 合并文件（fallback）: 有日期列的行属于该日期，没有日期列的行适用于每一天
+    某天有自己的注释文件时只使用该文件，否则使用合并文件，与逐天查找注释文件的规则一致
+    """
+
+    def __init__(self, directory=None, fallback_file=None):
+        self.directory = directory
+        self.fallback_file = fallback_file
+        self.day_entries = {}
+        self.fallback_entries = defaultdict(list)
+        self.fallback_undated = []
+        if directory and os.path.isdir(directory):
+            self.add_directory(directory)
+        if fallback_file:
+            self.add_fallback_file(fallback_file)
+
+    def add_directory(self, directory):
+        for name in sorted(os.listdir(directory)):
+            file_date = _day_file_date(name)
+            if file_date is not None:
+                self._add_day_file(os.path.join(directory, name), file_date)
+
+    def _add_day_file(self, csv_file, file_date):
+        rows = read_annotation_rows(csv_file)
+        self.day_entries[file_date] = [(time_str, text, y_offset)
+                                       for time_str, text, y_offset, date in rows
+                                       if date is None or date == file_date]
+
+    # 合并文件中的行记录行号，有日期和无日期的行交错时仍按文件中的顺序返回
+    def add_fallback_file(self, csv_file):
+        for position, (time_str, text, y_offset, date) in enumerate(read_annotation_rows(csv_file)):
+            if date is None:
+                self.fallback_undated.append((position, (time_str, text, y_offset)))
+            else:
+                self.fallback_entries[date].append((position, (time_str, text, y_offset)))
+
+    # 重新读取一个变化了的注释文件（注释目录中某天的文件或合并文件），文件已删除时移除其中的注释
+    # 返回受影响的日期集合，合并文件中有无日期的行（适用于每一天）时集合中包含None；与注释无关的文件返回空集合
+    def reload_file(self, path):
+        path = os.path.abspath(path)
+        file_date = _day_file_date(os.path.basename(path))
+        if (file_date is not None and self.directory
+                and os.path.dirname(path) == os.path.abspath(self.directory)):
+            self.day_entries.pop(file_date, None)
+            if os.path.exists(path):
+                self._add_day_file(path, file_date)
+            return {file_date}
+
+        if self.fallback_file and path == os.path.abspath(self.fallback_file):
+            affected = set(self.fallback_entries) | ({None} if self.fallback_undated else set())
+            self.fallback_entries = defaultdict(list)
+            self.fallback_undated = []
+            if os.path.exists(path):
+                self.add_fallback_file(path)
+            return affected | set(self.fallback_entries) | ({None} if self.fallback_undated else set())
+        return set()
+
+    # 某天有自己的注释文件
+    def has_day_file(self, date):
+        return date in self.day_entries
+
+    # 所有有注释的日期（不含只有无日期行的合并文件）
+    def dates(self):
+        return sorted(set(self.day_entries) | set(self.fallback_entries))
+
+    # 某天的注释 [(时间文本, 描述, y偏移量)]，按文件中的顺序
+    def entries(self, date):
+        if date in self.day_entries:
+            return list(self.day_entries[date])
+        dated = self.fallback_entries.get(date, [])
+        if not self.fallback_undated:
+            return [entry for _, entry in dated]
+        return [entry for _, entry in sorted(dated + self.fallback_undated)]
+
+    # 某天的注释 [(datetime, 描述, y偏移量)]，可直接传给绘图函数
+    def annotations(self, date):
+        result = []
+        for time_str, text, y_offset in self.entries(date):
+            try:
+                time = datetime.strptime(time_str, "%H:%M").time()
+                result.append((datetime.combine(date, time), text, y_offset))
+            except ValueError:
+                print(f"警告: 无法解析时间 '{time_str}'，忽略此注释")
+        return result
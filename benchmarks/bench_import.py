@@ -0,0 +1,63 @@
+# 启动导入时间检查: 用 python -X importtime 运行不需要绘图的命令，
+# 确认它们没有导入pandas、matplotlib或scipy，并报告导入总耗时
+# 用法: python benchmarks/bench_import.py [-f 数据文件]
+# 有命令导入了不应导入的模块时以状态码1退出，可用于防止启动时间回退
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VISUALIZER = os.path.join(ROOT, 'visualizer.py')
+
+HEAVY = ('pandas', 'matplotlib', 'scipy')
+
+# 运行一条命令，返回 (导入总耗时秒数, 导入的顶层模块集合)
+def measure(args, cwd):
+    result = subprocess.run([sys.executable, '-X', 'importtime', VISUALIZER] + args,
+                            cwd=cwd, capture_output=True, text=True)
+    total_us = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        total_us += int(self_us)
+        modules.add(name.strip().split('.')[0])
+    return total_us / 1e6, modules
+
+def main():
+    parser = argparse.ArgumentParser(description='启动导入时间检查')
+    parser.add_argument('-f', '--file', type=str, default=os.path.join(ROOT, 'data', 'OttaiCGM_20250320.xlsx'),
+                        help='用于测试的数据文件')
+    args = parser.parse_args()
+    data_file = os.path.abspath(args.file)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 预先建立缓存，使 --list-dates 走缓存路径
+        subprocess.run([sys.executable, VISUALIZER, '-f', data_file, '--list-dates'],
+                       cwd=tmp, capture_output=True)
+
+        # (名称, 参数, 不允许导入的模块)
+        checks = [
+            ('--help', ['--help'], HEAVY),
+            ('--create-sample', ['--create-sample', '-f', os.path.join(tmp, 'missing.xlsx')], HEAVY),
+            ('日期校验', ['-d', '2025/13/45', '-f', data_file], HEAVY),
+            ('--list-dates', ['-f', data_file, '--list-dates'], HEAVY),
+            ('无数据日期', ['-f', data_file, '-d', '1999/1/1'], ('matplotlib', 'scipy')),
+            ('绘图(无峰值)', ['-f', data_file, '--image-dir', tmp], ('scipy',)),
+        ]
+
+        failed = False
+        for name, command, forbidden in checks:
+            seconds, modules = measure(command, tmp)
+            loaded = [module for module in forbidden if module in modules]
+            status = '通过' if not loaded else f"失败: 导入了 {', '.join(loaded)}"
+            failed = failed or bool(loaded)
+            print(f"{name:<16} 导入耗时 {seconds * 1000:8.1f} ms  {status}")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
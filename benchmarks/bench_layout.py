@@ -0,0 +1,81 @@
+# 标注布局基准测试: 在一张日图上放置1000个标注
+# 用法: python benchmarks/bench_layout.py [-n 1000]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from layout import LABEL_MARGIN, LabelPlacer, renderer_text_measurer
+
+# 旧实现: 线性扫描已使用区域，最多尝试8次
+def place_linear(points, labels, measure):
+    used_regions = []
+    overlaps = 0
+    for (x, y), text in zip(points, labels):
+        width, height = measure(text)
+        original_y = y
+        attempt = 0
+        box = (x - width / 2 - LABEL_MARGIN, x + width / 2 + LABEL_MARGIN,
+               y - height / 2 - LABEL_MARGIN, y + height / 2 + LABEL_MARGIN)
+
+        def has_overlap(region):
+            x1_min, x1_max, y1_min, y1_max = region
+            return any(x1_min < x2_max and x1_max > x2_min and y1_min < y2_max and y1_max > y2_min
+                       for x2_min, x2_max, y2_min, y2_max in used_regions)
+
+        while attempt < 8 and has_overlap(box):
+            attempt += 1
+            offset_sign = 1 if attempt % 2 == 0 else -1
+            y = original_y + offset_sign * (attempt // 2 + 1) * 15
+            box = (box[0], box[1], y - height / 2 - LABEL_MARGIN, y + height / 2 + LABEL_MARGIN)
+        overlaps += has_overlap(box)
+        used_regions.append(box)
+    return overlaps
+
+def main():
+    parser = argparse.ArgumentParser(description='标注布局基准测试')
+    parser.add_argument('-n', type=int, default=1000, help='标注数量 (默认: 1000)')
+    args = parser.parse_args()
+
+    # 与日图相同尺寸的画布，标注放大到多天视图的密度
+    fig = plt.figure(figsize=(14 * 4, 6 * 4))
+    measure = renderer_text_measurer(fig)
+    rng = random.Random(0)
+    words = ['吃饭', '散步20min', '胰岛素 4U', '二甲双胍', '一根玉米肠', '椭圆机半小时', '水果']
+    width, height = fig.bbox.width, fig.bbox.height
+    points = [(rng.uniform(0, width), rng.uniform(height * 0.2, height * 0.8)) for _ in range(args.n)]
+    labels = [f"{rng.randrange(24):02d}:{rng.randrange(60):02d} {rng.choice(words)}" for _ in range(args.n)]
+
+    start = time.perf_counter()
+    overlaps = place_linear(points, labels, measure)
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    placer = LabelPlacer(measure, bounds=fig.bbox.extents)
+    positions = [placer.place(x, y, text) for (x, y), text in zip(points, labels)]
+    grid_time = time.perf_counter() - start
+
+    # 检查新布局中仍然重叠的标注数量
+    remaining = 0
+    for i, ((x, y), text) in enumerate(zip(positions, labels)):
+        w, h = measure(text)
+        box = (x - w / 2, x + w / 2, y - h / 2, y + h / 2)
+        for (x2, y2), text2 in zip(positions[:i], labels[:i]):
+            w2, h2 = measure(text2)
+            if box[0] < x2 + w2 / 2 and box[1] > x2 - w2 / 2 and box[2] < y2 + h2 / 2 and box[3] > y2 - h2 / 2:
+                remaining += 1
+                break
+
+    print(f"标注数量: {args.n}")
+    print(f"线性扫描 (旧): {linear_time * 1000:.1f} ms, 重叠 {overlaps} 个")
+    print(f"空间索引 (新): {grid_time * 1000:.1f} ms, 重叠 {remaining} 个")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# 流水线基准测试: 用合成数据测量各阶段在不同数据规模下的耗时和内存峰值
+# 阶段: load_glucose_data、find_local_peaks、create_annotations、plot_glucose_curve、savefig
+# 用法: python benchmarks/bench_pipeline.py [--scales 1,14,90,365] [--interval 5] [-o results.json] [--compare old.json]
+# 结果保存为JSON，在不同提交上分别运行后用 --compare 对比
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matplotlib
+matplotlib.use('Agg')
+
+import synthetic
+import visualizer
+
+# 先运行一次预热（导入延迟加载的模块），再多次运行取最短耗时，
+# 最后单独运行一次用tracemalloc测量内存峰值（tracemalloc会拖慢运行，不计入耗时）
+def measure(func, repeat):
+    func()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak / 2**20
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# 在一个规模上运行所有阶段
+def run_scale(days, interval, directory, repeat, dpi):
+    data_file = os.path.join(directory, f"cgm_{days}d_{interval}min.xlsx")
+    annotations_dir = os.path.join(directory, f"annotations_{days}d_{interval}min")
+    times, values, events = synthetic.generate_series(days, interval, seed=days)
+    synthetic.write_export(data_file, times, values)
+    files = synthetic.write_annotations(annotations_dir, events)
+
+    # 最早的一天: 欧态导出为倒序，读取这一天需要扫描整个文件；绘图使用最后一天
+    first_day = times[0].astype('datetime64[D]').item()
+    last_day = times[-1].astype('datetime64[D]').item()
+    last_str = last_day.strftime('%Y/%m/%d')
+    last_file = visualizer.find_annotations_file(annotations_dir, last_day)
+    plt = visualizer.load_pyplot()
+
+    results = []
+
+    def record(stage, seconds, memory):
+        results.append({'days': days, 'interval': interval, 'samples': len(times), 'stage': stage,
+                        'seconds': round(seconds, 6), 'peak_memory_mb': round(memory, 3)})
+        print(f"{days:>4}天 {interval:>2}分钟  {stage:<20} {seconds * 1000:>10.1f} ms  {memory:>8.1f} MB")
+
+    _, seconds, memory = measure(lambda: visualizer.load_glucose_data(data_file, first_day, use_cache=False), repeat)
+    record('load_glucose_data', seconds, memory)
+
+    df = visualizer.read_glucose_export(data_file, use_cache=False)
+    _, seconds, memory = measure(lambda: visualizer.find_local_peaks(df), repeat)
+    record('find_local_peaks', seconds, memory)
+
+    # 每个注释文件对应的日期 annotations-YYYYMMDD.csv -> YYYY/MM/DD
+    dated_files = [(f"{name[12:16]}/{name[16:18]}/{name[18:20]}", path)
+                   for path, name in ((f, os.path.basename(f)) for f in files)]
+
+    def load_annotations():
+        return [visualizer.create_annotations(date_str, annotations_file=path) for date_str, path in dated_files]
+    _, seconds, memory = measure(load_annotations, repeat)
+    record('create_annotations', seconds, memory)
+
+    day_df = visualizer.select_day(df, last_day)
+    annotations = visualizer.create_annotations(last_str, annotations_file=last_file) if last_file else []
+
+    def plot():
+        fig = visualizer.plot_glucose_curve(day_df, list(annotations), last_str, show_peaks=True)
+        plt.close(fig)
+    _, seconds, memory = measure(plot, repeat)
+    record('plot_glucose_curve', seconds, memory)
+
+    fig = visualizer.plot_glucose_curve(day_df, list(annotations), last_str, show_peaks=True)
+    _, seconds, memory = measure(lambda: fig.savefig(io.BytesIO(), format='png', dpi=dpi, bbox_inches='tight'),
+                                 repeat)
+    plt.close(fig)
+    record('savefig', seconds, memory)
+    return results
+
+# 与之前保存的结果对比，输出耗时比值
+def compare(results, baseline_file):
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(r['days'], r['interval'], r['stage']): r for r in baseline['results']}
+    print(f"\n与 {baseline_file} ({baseline['meta'].get('commit')}) 对比:")
+    for r in results:
+        old = previous.get((r['days'], r['interval'], r['stage']))
+        if old is None:
+            continue
+        ratio = r['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        print(f"{r['days']:>4}天 {r['stage']:<20} {old['seconds'] * 1000:>10.1f} -> {r['seconds'] * 1000:>10.1f} ms"
+              f"  x{ratio:.2f}  内存 {old['peak_memory_mb']:.1f} -> {r['peak_memory_mb']:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='流水线各阶段基准测试')
+    parser.add_argument('--scales', type=str, default='1,14,90,365',
+                        help='数据天数，逗号分隔 (默认: 1,14,90,365)')
+    parser.add_argument('--interval', type=int, choices=[1, 5, 15], default=5,
+                        help='采样间隔(分钟) (默认: 5)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='每个阶段运行次数，取最短耗时 (默认: 3)')
+    parser.add_argument('--dpi', type=int, default=300,
+                        help='savefig的分辨率 (默认: 300)')
+    parser.add_argument('--data-dir', type=str, default=None,
+                        help='保存合成数据的目录 (默认: 临时目录，结束后删除)')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='结果JSON文件 (默认: 不保存)')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='与之前保存的结果JSON对比')
+    args = parser.parse_args()
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.data_dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        results = []
+        for days in scales:
+            results.extend(run_scale(days, args.interval, directory, args.repeat, args.dpi))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'dpi': args.dpi,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"结果已保存为: {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+
+# 缓存格式版本，格式变化时递增以使旧缓存失效
+CACHE_VERSION = 1
+
+# 缓存文件与导出文件放在同一目录: .<文件名>.cache.npz
+def cache_path_for(file_path):
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, f".{name}.cache.npz")
+
+# 计算文件内容的SHA-256
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# 导出文件的标识: 路径、大小、修改时间
+def _file_key(file_path):
+    stat = os.stat(file_path)
+    return {
+        'path': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+def _write(file_path, times, values, meta):
+    cache_path = cache_path_for(file_path)
+    buffer = io.BytesIO()
+    np.savez(buffer, times=times, values=values,
+             meta=np.array(json.dumps(meta, ensure_ascii=False)))
+
+    # 先写临时文件再替换，避免中断时留下损坏的缓存
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, cache_path)
+
+def _to_frame(times, values):
+    import pandas as pd
+
+    return pd.DataFrame({
+        '时刻': times.view('datetime64[ns]'),
+        '血糖值mmol/L': values,
+    })
+
+# 读取缓存为DataFrame，缓存不存在或已失效时返回None
+def load_cache(file_path):
+    arrays = load_cache_arrays(file_path)
+    if arrays is None:
+        return None
+    return _to_frame(*arrays)
+
+# 读取缓存为 (int64纳秒时间数组, float64血糖值数组)，不需要导入pandas
+# 缓存不存在或已失效时返回None
+def load_cache_arrays(file_path):
+    cache_path = cache_path_for(file_path)
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path) as cache:
+            meta = json.loads(str(cache['meta']))
+            times = cache['times']
+            values = cache['values']
+    except Exception:
+        return None
+
+    key = _file_key(file_path)
+    if meta.get('version') != CACHE_VERSION or meta.get('path') != key['path']:
+        return None
+
+    # 大小和修改时间都没变，直接使用缓存
+    if meta.get('size') == key['size'] and meta.get('mtime_ns') == key['mtime_ns']:
+        return times, values
+
+    # 文件被touch或复制过但内容相同，更新标识后继续使用缓存
+    if meta.get('sha256') == file_digest(file_path):
+        meta.update(key)
+        try:
+            _write(file_path, times, values, meta)
+        except OSError:
+            pass
+        return times, values
+
+    return None
+
+# 将解析好的数据写入缓存，写入失败时只给出警告
+def save_cache(file_path, df):
+    save_cache_arrays(file_path,
+                      df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+                      df['血糖值mmol/L'].to_numpy(dtype=np.float64))
+
+# 将 (int64纳秒时间数组, float64血糖值数组) 写入缓存
+def save_cache_arrays(file_path, times, values):
+    meta = dict(_file_key(file_path), version=CACHE_VERSION, sha256=file_digest(file_path))
+    try:
+        _write(file_path, times, values, meta)
+    except OSError as e:
+        print(f"警告: 无法写入缓存文件 '{cache_path_for(file_path)}': {e}")
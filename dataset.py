@@ -0,0 +1,149 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+import cgm_cache
+from series import GlucoseSeries
+
+# 欧态导出文件: OttaiCGM_<传感器ID>.xlsx 或 OttaiCGM_<YYYYMMDD>.xlsx
+_EXPORT_NAME = re.compile(r'^OttaiCGM_(.+)\.(xlsx|xlsm|xls)$', re.IGNORECASE)
+_DATE_ID = re.compile(r'^\d{8}$')
+
+# 扫描导出目录
+# 目录下直接存放的文件属于以目录名命名的患者，一级子目录中的文件属于以子目录名命名的患者（更深的子目录也归到该患者）
+# 返回 [{'path', 'patient', 'sensor'}]，文件名为日期时sensor为None
+def scan_exports(directory):
+    directory = os.path.abspath(directory)
+    root_patient = os.path.basename(directory.rstrip(os.sep)) or 'default'
+    exports = []
+    for current, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        relative = os.path.relpath(current, directory)
+        patient = root_patient if relative == '.' else relative.split(os.sep)[0]
+        for name in sorted(filenames):
+            match = _EXPORT_NAME.match(name)
+            if not match:
+                continue
+            identifier = match.group(1)
+            exports.append({
+                'path': os.path.join(current, name),
+                'patient': patient,
+                'sensor': None if _DATE_ID.match(identifier) else identifier,
+            })
+    return exports
+
+# 按患者或传感器分组，返回 {分组名: [文件路径]}
+# 按传感器分组时，文件名不含传感器ID的导出归到所属患者
+def group_exports(exports, by='patient'):
+    groups = {}
+    for export in exports:
+        key = export['patient']
+        if by == 'sensor' and export['sensor']:
+            key = export['sensor']
+        groups.setdefault(key, []).append(export['path'])
+    return groups
+
+# 读取一个导出文件为 (int64纳秒时间数组, float64血糖值数组)，时间升序
+# 优先使用列式缓存，缓存无效时解析并重建缓存；rebuild_cache为True时忽略已有缓存
+def read_glucose_arrays(file_path, use_cache=True, rebuild_cache=False):
+    if use_cache and not rebuild_cache:
+        arrays = cgm_cache.load_cache_arrays(file_path)
+        if arrays is not None:
+            return arrays
+
+    if os.path.splitext(file_path)[1].lower() in ('.xlsx', '.xlsm'):
+        from xlsx_reader import read_glucose_columns
+        times, values = read_glucose_columns(file_path)
+    else:
+        from visualizer import parse_glucose_export
+        df = parse_glucose_export(file_path)
+        times = df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        values = df['血糖值mmol/L'].to_numpy(dtype=np.float64)
+    if use_cache:
+        cgm_cache.save_cache_arrays(file_path, times, values)
+    return times, values
+
+# 去掉有序时间数组中重复的时刻，保留最后一个
+def _unique_sorted(times, values):
+    if len(times) < 2:
+        return times, values
+    keep = np.append(times[1:] != times[:-1], True)
+    if keep.all():
+        return times, values
+    return times[keep], values[keep]
+
+# 有序合并两段数据: 新数据中已有的时刻用新值覆盖，其余按位置插入
+# 新数据在已有数据末尾之后的部分直接追加（每次导出只多出最近几天，这是大部分数据），
+# 重叠部分用searchsorted定位，np.insert一次线性合并，不需要拼接后对整个历史重新排序去重
+def merge_sorted(times, values, new_times, new_values):
+    new_times, new_values = _unique_sorted(new_times, new_values)
+    if len(times) == 0:
+        return new_times, new_values
+    if len(new_times) == 0:
+        return times, values
+
+    split = np.searchsorted(new_times, times[-1], side='right')
+    head_times, head_values = new_times[:split], new_values[:split]
+    if split:
+        # 重叠部分的时刻都不晚于已有数据的最后一个时刻，positions都是有效下标
+        positions = np.searchsorted(times, head_times)
+        duplicate = times[positions] == head_times
+        changed = duplicate & (values[positions] != head_values)
+        if changed.any():
+            values = values.copy()
+            values[positions[changed]] = head_values[changed]
+        fresh = ~duplicate
+        if fresh.any():
+            times = np.insert(times, positions[fresh], head_times[fresh])
+            values = np.insert(values, positions[fresh], head_values[fresh])
+
+    if split < len(new_times):
+        times = np.concatenate([times, new_times[split:]])
+        values = np.concatenate([values, new_values[split:]])
+    return times, values
+
+# 合并同一分组的多个导出文件
+# 按每个文件最后一个时刻排序后依次合并，同一时刻以较新导出中的值为准
+def merge_exports(series):
+    series = sorted((s for s in series if len(s[0])), key=lambda s: (s[0][-1], s[0][0]))
+    times = np.empty(0, dtype=np.int64)
+    values = np.empty(0, dtype=np.float64)
+    for new_times, new_values in series:
+        times, values = merge_sorted(times, values, new_times, new_values)
+    return times, values
+
+# 并行读取文件列表，返回与paths顺序一致的 [(时间数组, 血糖值数组)]
+# 先用线程池读取列式缓存（主要是文件IO，不受GIL限制），缓存无效的文件再用进程池解析（解析xlsx受GIL限制）
+def load_files(paths, jobs=None, use_cache=True, rebuild_cache=False):
+    jobs = jobs or os.cpu_count() or 1
+    arrays = [None] * len(paths)
+    if use_cache and not rebuild_cache:
+        with ThreadPoolExecutor(max_workers=min(jobs, max(len(paths), 1))) as executor:
+            arrays = list(executor.map(cgm_cache.load_cache_arrays, paths))
+
+    missing = [i for i, a in enumerate(arrays) if a is None]
+    workers = min(jobs, len(missing))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = executor.map(read_glucose_arrays, [paths[i] for i in missing],
+                                  [use_cache] * len(missing), [rebuild_cache] * len(missing))
+            for i, result in zip(missing, parsed):
+                arrays[i] = result
+    else:
+        for i in missing:
+            arrays[i] = read_glucose_arrays(paths[i], use_cache, rebuild_cache)
+    return arrays
+
+# 读取导出目录: 扫描、分组、并行读取所有文件并按分组合并去重
+# 返回 {分组名: GlucoseSeries}，分组名排序；每个文件读取后的数组在合并完成后即释放，只保留紧凑的序列
+def load_directory(directory, by='patient', jobs=None, use_cache=True, rebuild_cache=False):
+    groups = group_exports(scan_exports(directory), by)
+    paths = [path for name in sorted(groups) for path in groups[name]]
+    loaded = dict(zip(paths, load_files(paths, jobs, use_cache, rebuild_cache)))
+    result = {}
+    for name in sorted(groups):
+        times, values = merge_exports([loaded.pop(path) for path in groups[name]])
+        result[name] = GlucoseSeries.from_arrays(times, values)
+    return result
@@ -0,0 +1,328 @@
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+
+SECONDS_PER_DAY = 24 * 3600
+
+# 画布的逻辑尺寸（像素）和绘图区 (左, 上, 右, 下)，与PNG图表（14x6英寸）的比例一致
+# 标注位置在Python中按这个尺寸计算，浏览器按实际显示大小和屏幕像素比缩放
+CANVAS_SIZE = (1400, 600)
+PLOT_AREA = (60, 48, 1380, 560)
+
+# 血糖值编码为整数时的最大小数位数
+MAX_DECIMALS = 4
+
+# 能把所有血糖值无损表示为整数的最小倍数（10的幂），读数通常为一位小数，即10
+def value_scale(values):
+    values = np.asarray(values, dtype=float)
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10 ** decimals
+        if np.allclose(values * scale, np.round(values * scale), rtol=0, atol=1e-6):
+            return scale
+    return 10 ** MAX_DECIMALS
+
+# 游程编码 [a, a, a, b] -> [[a, 3], [b, 1]]，采样间隔几乎总是相同的，一天的时间通常只有几组
+def run_lengths(items):
+    items = np.asarray(items)
+    if len(items) == 0:
+        return []
+    starts = np.flatnonzero(np.diff(items, prepend=items[0] - 1))
+    counts = np.diff(np.append(starts, len(items)))
+    return [[int(v), int(c)] for v, c in zip(items[starts], counts)]
+
+# 曲线穿过参考线的位置（线性插值），浏览器在这些点处拆分曲线并分别着色，与PNG的 split_segments_at_thresholds 一致
+# 返回 [[当天的秒数, 参考线血糖值]]，按时间排序
+def threshold_crossings(seconds, values, normal_min, normal_max):
+    seconds = np.asarray(seconds, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return []
+    y1, y2 = values[:-1], values[1:]
+    found = []
+    for level, crosses in ((normal_min, (y1 < normal_min) != (y2 < normal_min)),
+                           (normal_max, (y1 <= normal_max) != (y2 <= normal_max))):
+        rows = np.flatnonzero(crosses)
+        t = (level - y1[rows]) / (y2[rows] - y1[rows])
+        x = seconds[rows] + t * (seconds[rows + 1] - seconds[rows])
+        found.extend((round(float(xi), 1), level) for xi in x)
+    return sorted(found)
+
+# 一天图表的紧凑JSON数据
+# times为升序的datetime64[ns]数组，values为血糖值，annotations为 (datetime, 文本, y偏移量) 列表
+# 时间编码为当天零点起的秒数: 第一个采样点的秒数t0加上相邻间隔的游程编码dt；
+# 血糖值乘以scale后取整，再对相邻差值编码v（第一个为绝对值）
+# 标注位置与PNG使用相同的规则（visualizer.place_labels）计算，以数据坐标保存
+def day_payload(date, times, values, annotations, time_index, scale,
+                show_peaks=False, peak_distance=30, peak_prominence=0.3):
+    import visualizer
+    from layout import LabelPlacer, estimate_text_extent
+    from peaks import peaks_between
+
+    day_start = datetime.combine(date, datetime.min.time())
+    epoch_start = np.datetime64(day_start, 's').astype(np.int64)
+    seconds = np.asarray(times, dtype='datetime64[s]').view(np.int64) - epoch_start
+    scaled = np.round(np.asarray(values, dtype=float) * scale).astype(np.int64)
+
+    # 坐标范围与PNG一致
+    y_min = max(0, min(3.5, float(values.min()) - 0.5))
+    y_max = float(values.max()) + 3.5
+
+    # 标注布局在与画布相同尺寸的像素坐标中进行（y轴向上，与matplotlib一致）
+    width, height = CANVAS_SIZE
+    left, top, right, bottom = PLOT_AREA
+    x_scale = (right - left) / SECONDS_PER_DAY
+    y_scale = (bottom - top) / (y_max - y_min)
+
+    def to_display(dt, value):
+        return (left + (dt - day_start).total_seconds() * x_scale,
+                height - bottom + (value - y_min) * y_scale)
+
+    labels = visualizer.collect_labels(date, annotations, show_peaks, peak_distance, peak_prominence,
+                                       time_index)
+    placer = LabelPlacer(estimate_text_extent, bounds=(0, 0, width, height))
+    placed = []
+    for dt, label, value, (text_x, text_y), is_peak in visualizer.place_labels(labels, to_display, placer):
+        placed.append([
+            round((dt - day_start).total_seconds()), round(float(value), 2),
+            round((text_x - left) / x_scale), round((text_y - height + bottom) / y_scale + y_min, 2),
+            label, int(is_peak),
+        ])
+
+    payload = {
+        'date': date.isoformat(),
+        'title': f"每日血糖曲线({date.strftime('%Y年%m月%d日')})",
+        't0': int(seconds[0]),
+        'dt': run_lengths(np.diff(seconds)),
+        'v': np.diff(scaled, prepend=0).tolist(),
+        'y': [round(y_min, 2), round(y_max, 2)],
+        'cross': threshold_crossings(seconds, values, visualizer.NORMAL_MIN, visualizer.NORMAL_MAX),
+        'labels': placed,
+    }
+    if show_peaks:
+        peaks = peaks_between(time_index.peaks(peak_distance, peak_prominence),
+                              day_start, day_start + timedelta(days=1))
+        # 与PNG（visualizer.collect_labels）一致，只标记超过正常上限的峰值
+        peaks = peaks[peaks['value'] > visualizer.NORMAL_MAX]
+        peak_seconds = peaks['time'].astype('datetime64[s]').view(np.int64) - epoch_start
+        payload['peaks'] = [[int(s), round(float(v), 2)] for s, v in zip(peak_seconds, peaks['value'])]
+    return payload
+
+# 页面使用的颜色和参考范围，与PNG图表一致
+def page_style():
+    import visualizer
+
+    return {
+        'normal': [visualizer.NORMAL_MIN, visualizer.NORMAL_MAX],
+        'normalColor': visualizer.NORMAL_COLOR,
+        'warningColor': visualizer.WARNING_COLOR,
+        'fillColor': visualizer.FILL_COLOR,
+        'annotationColor': visualizer.ANNOTATION_COLOR,
+        'peakColor': visualizer.PEAK_COLOR,
+        'gridColor': visualizer.GRID_COLOR,
+        'canvas': list(CANVAS_SIZE),
+        'plot': list(PLOT_AREA),
+    }
+
+# 将多天的数据写为一个离线HTML文件: 数据以JSON嵌入页面，由内置的canvas脚本绘制，不引用任何外部资源
+def write_html(output, title, days, scale):
+    data = json.dumps({'scale': scale, 'style': page_style(), 'days': days},
+                      ensure_ascii=False, separators=(',', ':'))
+    # 防止数据中的 "</" 提前结束script标签
+    data = data.replace('</', '<\\/')
+    page = (PAGE_TEMPLATE.replace('__TITLE__', _escape(title))
+            .replace('__DATA__', data)
+            .replace('__SCRIPT__', PAGE_SCRIPT))
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write(page)
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>__TITLE__</title>
+<style>
+body{margin:0;padding:16px;background:#fff;color:#333;font-family:"PingFang SC","Microsoft YaHei","Noto Sans CJK SC",sans-serif}
+h1{font-size:18px;margin:0 0 8px}
+nav{margin-bottom:12px;font-size:13px;line-height:1.8}
+nav a{color:#4a86e8;margin-right:10px;text-decoration:none}
+section{position:relative;max-width:1400px;margin-bottom:16px}
+canvas{display:block;width:100%;height:auto}
+.tip{position:absolute;pointer-events:none;background:rgba(255,255,255,.95);border:1px solid #ddd;
+border-radius:3px;padding:2px 6px;font-size:12px;display:none;white-space:nowrap}
+</style>
+</head>
+<body>
+<h1>__TITLE__</h1>
+<nav id="nav"></nav>
+<div id="days"></div>
+<script id="glucose-data" type="application/json">__DATA__</script>
+<script>
+__SCRIPT__
+</script>
+</body>
+</html>
+'''
+
+PAGE_SCRIPT = r'''(function () {
+  var DATA = JSON.parse(document.getElementById('glucose-data').textContent);
+  var S = DATA.style, W = S.canvas[0], H = S.canvas[1];
+  var L = S.plot[0], T = S.plot[1], R = S.plot[2], B = S.plot[3];
+  var LO = S.normal[0], HI = S.normal[1];
+
+  // 解码: 时间为当天零点起的秒数，血糖值为相邻差值
+  function decode(day) {
+    var t = [day.t0], v = [], acc = 0, i, j;
+    for (i = 0; i < day.dt.length; i++)
+      for (j = 0; j < day.dt[i][1]; j++) t.push(t[t.length - 1] + day.dt[i][0]);
+    for (i = 0; i < day.v.length; i++) { acc += day.v[i]; v.push(acc / DATA.scale); }
+    return {t: t, v: v};
+  }
+
+  function zoneColor(y) { return y > HI || y < LO ? S.warningColor : S.normalColor; }
+  function pad(n) { return (n < 10 ? '0' : '') + n; }
+  function clock(s) { return pad(Math.floor(s / 3600) % 24) + ':' + pad(Math.floor(s % 3600 / 60)); }
+
+  function niceStep(range) {
+    var steps = [0.5, 1, 2, 2.5, 5, 10], i;
+    for (i = 0; i < steps.length; i++) if (range / steps[i] <= 10) return steps[i];
+    return 20;
+  }
+
+  function draw(canvas, day, series) {
+    var ratio = window.devicePixelRatio || 1;
+    canvas.width = W * ratio; canvas.height = H * ratio;
+    var c = canvas.getContext('2d');
+    c.scale(ratio, ratio);
+    var y0 = day.y[0], y1 = day.y[1];
+    var X = function (s) { return L + s / 86400 * (R - L); };
+    var Y = function (v) { return B - (v - y0) / (y1 - y0) * (B - T); };
+
+    c.fillStyle = '#fff'; c.fillRect(0, 0, W, H);
+    c.fillStyle = '#F9FBFF'; c.fillRect(L, T, R - L, B - T);
+
+    // 网格和刻度
+    c.strokeStyle = S.gridColor; c.lineWidth = 0.5; c.setLineDash([4, 3]);
+    c.fillStyle = '#999'; c.font = '12px sans-serif';
+    var h, v, step = niceStep(y1 - y0);
+    c.textAlign = 'center'; c.textBaseline = 'top';
+    for (h = 0; h <= 24; h += 6) {
+      c.beginPath(); c.moveTo(X(h * 3600), T); c.lineTo(X(h * 3600), B); c.stroke();
+      c.fillText(pad(h % 24) + ':00', X(h * 3600), B + 6);
+    }
+    c.textAlign = 'right'; c.textBaseline = 'middle';
+    for (v = Math.ceil(y0 / step) * step; v <= y1; v += step) {
+      c.beginPath(); c.moveTo(L, Y(v)); c.lineTo(R, Y(v)); c.stroke();
+      c.fillText(String(+v.toFixed(1)), L - 6, Y(v));
+    }
+    c.strokeStyle = '#DDD'; c.setLineDash([]); c.strokeRect(L, T, R - L, B - T);
+
+    c.save();
+    c.beginPath(); c.rect(L, T, R - L, B - T); c.clip();
+
+    // 填充
+    var t = series.t, g = series.v, i, n = t.length;
+    c.fillStyle = S.fillColor; c.globalAlpha = 0.65;
+    c.beginPath(); c.moveTo(X(t[0]), Y(0));
+    for (i = 0; i < n; i++) c.lineTo(X(t[i]), Y(g[i]));
+    c.lineTo(X(t[n - 1]), Y(0)); c.closePath(); c.fill();
+    c.globalAlpha = 1;
+
+    // 参考线
+    c.lineWidth = 1.2; c.setLineDash([6, 4]);
+    [[LO, '#95a5a6'], [HI, S.warningColor]].forEach(function (ref) {
+      c.strokeStyle = ref[1]; c.globalAlpha = 0.8;
+      c.beginPath(); c.moveTo(L, Y(ref[0])); c.lineTo(R, Y(ref[0])); c.stroke();
+    });
+    c.globalAlpha = 1; c.setLineDash([]);
+
+    // 曲线: 在参考线交点处拆分，每段按中点所在区间着色
+    var pts = [], k = 0;
+    for (i = 0; i < n; i++) {
+      while (k < day.cross.length && day.cross[k][0] < t[i]) { pts.push(day.cross[k]); k++; }
+      pts.push([t[i], g[i]]);
+    }
+    c.lineCap = 'round';
+    for (i = 1; i < pts.length; i++) {
+      var mid = (pts[i - 1][1] + pts[i][1]) / 2, color = zoneColor(mid);
+      c.strokeStyle = color; c.lineWidth = color === S.normalColor ? 2 : 2.5;
+      c.beginPath(); c.moveTo(X(pts[i - 1][0]), Y(pts[i - 1][1])); c.lineTo(X(pts[i][0]), Y(pts[i][1])); c.stroke();
+    }
+
+    // 峰值
+    c.fillStyle = S.peakColor;
+    (day.peaks || []).forEach(function (p) {
+      c.beginPath(); c.arc(X(p[0]), Y(p[1]), 3, 0, 2 * Math.PI); c.fill();
+    });
+    c.restore();
+
+    // 参考范围文字
+    c.font = '12px sans-serif'; c.textAlign = 'right';
+    c.fillStyle = '#555'; c.textBaseline = 'top'; c.fillText(LO + ' mmol/L (下限)', X(85500), Y(LO - 0.2));
+    c.fillStyle = S.warningColor; c.textBaseline = 'bottom'; c.fillText(HI + ' mmol/L (上限)', X(85500), Y(HI + 0.2));
+
+    // 标注: [采样时刻, 血糖值, 文本时刻, 文本血糖值, 文本, 是否峰值]
+    c.font = '12px sans-serif'; c.textAlign = 'center'; c.textBaseline = 'middle';
+    day.labels.forEach(function (a) {
+      var color = a[5] ? S.peakColor : S.annotationColor;
+      var px = X(a[0]), py = Y(a[1]), tx = X(a[2]), ty = Y(a[3]);
+      var w = c.measureText(a[4]).width + 8, hh = 18;
+      c.strokeStyle = color; c.fillStyle = color; c.lineWidth = 1.2;
+      // 弧形箭头，与PNG的 arc3,rad=0.15 相同
+      var mx = (tx + px) / 2, my = (ty + py) / 2, qx = mx + 0.15 * (py - ty), qy = my - 0.15 * (px - tx);
+      c.beginPath(); c.moveTo(tx, ty); c.quadraticCurveTo(qx, qy, px, py); c.stroke();
+      var ang = Math.atan2(py - qy, px - qx);
+      c.beginPath(); c.moveTo(px, py);
+      c.lineTo(px - 8 * Math.cos(ang - 0.35), py - 8 * Math.sin(ang - 0.35));
+      c.lineTo(px - 8 * Math.cos(ang + 0.35), py - 8 * Math.sin(ang + 0.35));
+      c.closePath(); c.fill();
+      c.fillStyle = 'rgba(255,255,255,0.95)';
+      c.beginPath(); c.rect(tx - w / 2, ty - hh / 2, w, hh); c.fill();
+      c.fillStyle = color; c.fillText(a[4], tx, ty);
+    });
+
+    // 图例和标题
+    c.textAlign = 'left'; c.textBaseline = 'middle'; c.lineWidth = 2;
+    [[S.normalColor, '正常范围'], [S.warningColor, '超出正常范围']].forEach(function (item, j) {
+      var ly = T + 16 + j * 18;
+      c.strokeStyle = item[0]; c.beginPath(); c.moveTo(L + 10, ly); c.lineTo(L + 34, ly); c.stroke();
+      c.fillStyle = '#333'; c.fillText(item[1], L + 40, ly);
+    });
+    c.fillStyle = '#333'; c.font = 'bold 18px sans-serif'; c.textAlign = 'center'; c.textBaseline = 'bottom';
+    c.fillText(day.title, (L + R) / 2, T - 12);
+  }
+
+  // 鼠标悬停时显示最近采样点的时间和血糖值
+  function attachTip(section, canvas, series) {
+    var tip = document.createElement('div');
+    tip.className = 'tip'; section.appendChild(tip);
+    canvas.addEventListener('mousemove', function (e) {
+      var box = canvas.getBoundingClientRect(), x = (e.clientX - box.left) * W / box.width;
+      var s = (x - L) / (R - L) * 86400, t = series.t, lo = 0, hi = t.length - 1;
+      if (s < 0 || s > 86400) { tip.style.display = 'none'; return; }
+      while (hi - lo > 1) { var m = (lo + hi) >> 1; if (t[m] < s) lo = m; else hi = m; }
+      var i = s - t[lo] <= t[hi] - s ? lo : hi;
+      tip.textContent = clock(t[i]) + '  ' + series.v[i].toFixed(1) + ' mmol/L';
+      tip.style.left = (e.clientX - box.left + 12) + 'px'; tip.style.top = (e.clientY - box.top + 12) + 'px';
+      tip.style.display = 'block';
+    });
+    canvas.addEventListener('mouseleave', function () { tip.style.display = 'none'; });
+  }
+
+  var nav = document.getElementById('nav'), container = document.getElementById('days');
+  DATA.days.forEach(function (day) {
+    var id = 'd' + day.date.replace(/-/g, '');
+    var link = document.createElement('a');
+    link.href = '#' + id; link.textContent = day.date; nav.appendChild(link);
+    var section = document.createElement('section'), canvas = document.createElement('canvas');
+    section.id = id; section.appendChild(canvas); container.appendChild(section);
+    var series = decode(day);
+    draw(canvas, day, series);
+    attachTip(section, canvas, series);
+  });
+})();
+'''
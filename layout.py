@@ -0,0 +1,160 @@
+import math
+from collections import defaultdict
+
+# 标注文本框与已占用区域之间的最小间距（像素）
+LABEL_MARGIN = 5
+
+# 估计文本的像素尺寸（无法获取渲染器时的后备方案）
+# 中文字符通常比英文宽，约为英文的1.7倍
+def estimate_text_extent(text, fontsize=9):
+    chinese_chars = sum(1 for c in text if ord(c) > 256)
+    english_chars = len(text) - chinese_chars
+    scale = fontsize / 9
+    return (chinese_chars * 10 + english_chars * 6) * 0.9 * scale, 20 * scale
+
+# 返回一个使用图表渲染器测量文本尺寸的函数 text -> (宽, 高)
+# pad与标注文本框的 boxstyle='round,pad=...' 一致，单位为字号
+def renderer_text_measurer(fig, fontsize=9, pad=0.3):
+    from matplotlib.font_manager import FontProperties
+
+    get_renderer = getattr(fig.canvas, 'get_renderer', None)
+    if get_renderer is None:
+        return lambda text: estimate_text_extent(text, fontsize)
+
+    renderer = get_renderer()
+    prop = FontProperties(size=fontsize)
+    pad_px = pad * fontsize * fig.dpi / 72
+    cache = {}
+
+    def measure(text):
+        if text not in cache:
+            width, height, _ = renderer.get_text_width_height_descent(text, prop, ismath=False)
+            cache[text] = (width + 2 * pad_px, height + 2 * pad_px)
+        return cache[text]
+
+    return measure
+
+class SpatialGrid:
+    """
+    按固定大小网格划分的矩形空间索引
+
+    每个矩形 (x_min, x_max, y_min, y_max) 登记到它覆盖的所有网格中，
+    重叠检查只需比较相同网格中的矩形，而不是所有已放置的矩形
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.boxes = []
+
+    def _cell_range(self, box):
+        x_min, x_max, y_min, y_max = box
+        size = self.cell_size
+        return (range(math.floor(x_min / size), math.floor(x_max / size) + 1),
+                range(math.floor(y_min / size), math.floor(y_max / size) + 1))
+
+    def insert(self, box):
+        index = len(self.boxes)
+        self.boxes.append(box)
+        xs, ys = self._cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                self.cells[(cx, cy)].append(index)
+
+    def overlaps(self, box):
+        x1_min, x1_max, y1_min, y1_max = box
+        xs, ys = self._cell_range(box)
+        for cx in xs:
+            for cy in ys:
+                for index in self.cells.get((cx, cy), ()):
+                    x2_min, x2_max, y2_min, y2_max = self.boxes[index]
+                    # 检查两个矩形是否重叠
+                    if (x1_min < x2_max and x1_max > x2_min and
+                            y1_min < y2_max and y1_max > y2_min):
+                        return True
+        return False
+
+class LabelPlacer:
+    """
+    标注位置搜索
+
+    从期望位置开始，先上下交替移动，再逐步向左右两侧扩展，
+    直到找到不与已放置标注重叠的位置；搜索次数和范围都有上限
+    """
+
+    def __init__(self, measure=estimate_text_extent, bounds=None, step=15, max_attempts=400, contain=False):
+        # measure: text -> (宽, 高)，单位为像素
+        # bounds: 标注中心允许的范围 (x_min, y_min, x_max, y_max)，None表示不限制
+        # contain: 为True时整个文本框都必须在bounds内，期望位置先移入范围再搜索，
+        #          找不到位置时place返回None（由调用方省略该标注），而不是退回到可能超出范围的期望位置
+        self.measure = measure
+        self.bounds = bounds
+        self.step = step
+        self.max_attempts = max_attempts
+        self.contain = contain
+        self.index = SpatialGrid()
+
+    def _box(self, x, y, width, height):
+        return (x - width / 2 - LABEL_MARGIN, x + width / 2 + LABEL_MARGIN,
+                y - height / 2 - LABEL_MARGIN, y + height / 2 + LABEL_MARGIN)
+
+    # 文本中心允许的范围，contain为True时按文本框尺寸向内收缩
+    def _center_bounds(self, width, height):
+        x_min, y_min, x_max, y_max = self.bounds
+        if self.contain:
+            x_min, x_max = x_min + width / 2, x_max - width / 2
+            y_min, y_max = y_min + height / 2, y_max - height / 2
+        return x_min, y_min, x_max, y_max
+
+    def _in_bounds(self, x, y, width, height):
+        if self.bounds is None:
+            return True
+        x_min, y_min, x_max, y_max = self._center_bounds(width, height)
+        return x_min <= x <= x_max and y_min <= y <= y_max
+
+    def _candidates(self, x, y, width):
+        # 每一列中上下交替尝试，偏移量逐步增加
+        vertical = [0]
+        for attempt in range(1, self.max_attempts):
+            offset_sign = 1 if attempt % 2 == 0 else -1
+            vertical.append(offset_sign * (attempt // 2 + 1) * self.step)
+
+        column = 0
+        attempts = 0
+        while attempts < self.max_attempts:
+            # 列的顺序: 原位置、右、左、更右、更左...
+            shift = (column + 1) // 2 * (1 if column % 2 else -1) * (width / 2 + LABEL_MARGIN)
+            for dy in vertical:
+                if attempts >= self.max_attempts:
+                    return
+                attempts += 1
+                yield x + shift, y + dy
+                if self.bounds is not None and abs(dy) > self.bounds[3] - self.bounds[1]:
+                    break
+            column += 1
+
+    # 登记已被其他元素（如子图标题）占用的矩形区域，之后的标注不会与它重叠
+    def reserve(self, x_min, y_min, x_max, y_max):
+        self.index.insert((x_min, x_max, y_min, y_max))
+
+    # 放置一个标注，返回文本中心的像素坐标；contain为True且放不下时返回None
+    def place(self, x, y, text):
+        width, height = self.measure(text)
+        if self.contain and self.bounds is not None:
+            x_min, y_min, x_max, y_max = self._center_bounds(width, height)
+            if x_min > x_max or y_min > y_max:
+                return None
+            x, y = min(max(x, x_min), x_max), min(max(y, y_min), y_max)
+        for cx, cy in self._candidates(x, y, width):
+            if not self._in_bounds(cx, cy, width, height):
+                continue
+            box = self._box(cx, cy, width, height)
+            if not self.index.overlaps(box):
+                self.index.insert(box)
+                return cx, cy
+
+        if self.contain:
+            return None
+        # 找不到空闲位置时保留期望位置
+        self.index.insert(self._box(x, y, width, height))
+        return x, y
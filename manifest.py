@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# 清单文件名，保存在图像目录中
+MANIFEST_NAME = '.render_manifest.json'
+
+# 渲染结果格式变化时递增，使所有已有记录失效
+MANIFEST_VERSION = 3
+
+# 血糖数据（int64纳秒时间数组和血糖值数组）的哈希
+def arrays_digest(times_ns, values):
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(times_ns, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+# 当天血糖数据（DataFrame或GlucoseSeries）的哈希
+def readings_digest(data):
+    if hasattr(data, 'times_ns'):
+        return arrays_digest(data.times_ns(), data.values64())
+    return arrays_digest(data['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+                         data['血糖值mmol/L'].to_numpy(dtype=np.float64))
+
+# 注释文件内容的哈希，没有注释文件时为None
+def annotations_digest(annotations_file):
+    if not annotations_file or not os.path.exists(annotations_file):
+        return None
+    with open(annotations_file, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# 当天峰值（peaks.PEAK_DTYPE结构化数组）的哈希，未启用峰值时为None
+def peaks_digest(peaks):
+    if peaks is None:
+        return None
+    return hashlib.sha256(np.ascontiguousarray(peaks).tobytes()).hexdigest()
+
+# 渲染一天图表的全部输入
+# 峰值在整个数据集上检测，跨过午夜的峰值取决于相邻日期的数据，因此单独记录当天的峰值
+# context为当天以外还会用到的读数 (int64纳秒时间数组, 血糖值数组)，如血糖反应标注跨过午夜的窗口，为None时不记录
+def render_fingerprint(df, annotations_file, options, peaks=None, context=None):
+    fingerprint = {
+        'readings': readings_digest(df),
+        'annotations': annotations_digest(annotations_file),
+        'peaks': peaks_digest(peaks),
+        'options': dict(options, version=MANIFEST_VERSION),
+    }
+    if context is not None:
+        fingerprint['context'] = arrays_digest(*context)
+    return fingerprint
+
+class RenderManifest:
+    """
+    图像目录中的渲染清单
+
+    按输出文件名记录生成该文件时的输入哈希，输入没有变化且文件仍然存在时可以跳过渲染
+    """
+
+    def __init__(self, image_dir):
+        self.path = os.path.join(image_dir, MANIFEST_NAME)
+        self.image_dir = image_dir
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def is_current(self, output_path, fingerprint):
+        name = os.path.relpath(output_path, self.image_dir)
+        return os.path.exists(output_path) and self.entries.get(name) == fingerprint
+
+    def record(self, output_path, fingerprint):
+        self.entries[os.path.relpath(output_path, self.image_dir)] = fingerprint
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,175 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+NS_PER_MINUTE = 60 * 10**9
+NS_PER_DAY = 24 * 60 * NS_PER_MINUTE
+
+# mmol/L 转换为 mg/dL
+MGDL_PER_MMOL = 18.018
+
+# 指标列（按输出顺序）
+METRIC_COLUMNS = ['date', 'samples', 'hours', 'mean', 'sd', 'cv', 'gmi',
+                  'tir', 'tar', 'tbr', 'mage']
+
+# 每个采样点代表的时长（分钟）: 到下一个采样点的间隔
+# 间隔超过max_gap_minutes视为传感器断开，此时只计一个常规采样间隔，不把缺口算进去
+def sample_weights(times_ns, max_gap_minutes=15):
+    if len(times_ns) < 2:
+        return np.ones(len(times_ns))
+    intervals = np.diff(times_ns) / NS_PER_MINUTE
+    step = np.median(intervals[intervals > 0]) if np.any(intervals > 0) else 1.0
+    intervals = np.where(intervals > max_gap_minutes, step, intervals)
+    return np.append(intervals, step)
+
+# 序列的转折点: 去掉连续相等的读数后，相邻差值符号变化的位置（局部极大值和极小值交替出现），首尾两点也算作转折点
+def _turning_points(values):
+    if len(values) < 3:
+        return values
+    values = values[np.append(True, np.diff(values) != 0)]
+    slope = np.sign(np.diff(values))
+    turns = np.flatnonzero(slope[1:] != slope[:-1]) + 1
+    return values[np.concatenate([[0], turns, [len(values) - 1]])]
+
+# 幅度超过threshold的波动（波谷到波峰或波峰到波谷），返回带符号的幅度列表（上升为正）
+# 沿转折点前进，反向移动超过threshold时才确认当前波动的终点，小于threshold的噪声波动不会把一次大的波动截断；
+# 只计两端都是已确认转折点的波动: 从序列第一个读数开始的波动和最后一次尚未回落的波动都不完整，不计入
+def _excursions(points, threshold):
+    swings = []
+    trend = 0
+    low = high = extreme = points[0]
+    low_first = high_first = True  # 目前的最低（最高）点是否为序列的第一个读数
+    for x in points[1:]:
+        if trend == 0:
+            if x < low:
+                low, low_first = x, False
+            if x > high:
+                high, high_first = x, False
+            if x - low > threshold:
+                trend, pivot, extreme, complete = 1, low, x, not low_first
+            elif high - x > threshold:
+                trend, pivot, extreme, complete = -1, high, x, not high_first
+        elif (x - extreme) * trend > 0:
+            extreme = x
+        elif (extreme - x) * trend > threshold:
+            if complete:
+                swings.append(extreme - pivot)
+            trend, pivot, extreme, complete = -trend, extreme, x, True
+    return swings
+
+# 一段读数的MAGE: 超过sd的波动中，与第一次波动方向相同的波动（全部为上升或全部为下降）幅度的平均值
+# 每次波动只计一次，幅度为波峰与波谷之差
+def _mage_of(values, sd):
+    if len(values) < 2 or not sd > 0:
+        return np.nan
+    swings = np.asarray(_excursions(_turning_points(values), sd))
+    if len(swings) == 0:
+        return np.nan
+    return np.abs(swings[np.sign(swings) == np.sign(swings[0])]).mean()
+
+# MAGE（平均血糖波动幅度）: 每天按当天的标准差，整个范围按整体的标准差
+# 数据按时间排序，每天是连续的一段
+def _mage(values, day_codes, day_sd, overall_sd, n_days):
+    bounds = np.searchsorted(day_codes, np.arange(n_days + 1))
+    daily = np.array([_mage_of(values[first:last], day_sd[day])
+                      for day, (first, last) in enumerate(zip(bounds[:-1], bounds[1:]))])
+    return daily, _mage_of(values, overall_sd)
+
+def _summary(weight_sum, mean, var, low, high, samples):
+    sd = np.sqrt(np.maximum(var, 0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            'samples': samples,
+            'hours': weight_sum / 60,
+            'mean': mean,
+            'sd': sd,
+            'cv': sd / mean * 100,
+            'gmi': 3.31 + 0.02392 * mean * MGDL_PER_MMOL,
+            'tir': (1 - (low + high) / weight_sum) * 100,
+            'tar': high / weight_sum * 100,
+            'tbr': low / weight_sum * 100,
+        }
+
+# 计算每天及整个范围的血糖指标
+# 返回DataFrame，每天一行，最后一行date为'all'表示整个范围
+# 时间占比（TIR/TAR/TBR）、均值和标准差都按采样点代表的时长加权，采样不规则时也能正确计算
+def compute_metrics(df, normal_min=3.9, normal_max=7.8, max_gap_minutes=15):
+    times = df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    values = df['血糖值mmol/L'].to_numpy(dtype=float)
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+    if len(times) == 0:
+        return pd.DataFrame(columns=METRIC_COLUMNS)
+
+    weights = sample_weights(times, max_gap_minutes)
+    days, day_codes = np.unique(times // NS_PER_DAY, return_inverse=True)
+    n_days = len(days)
+
+    # 一次bincount得到每天的加权和
+    def per_day(w):
+        return np.bincount(day_codes, weights=w, minlength=n_days)
+
+    weight_sum = per_day(weights)
+    mean = per_day(weights * values) / weight_sum
+    var = per_day(weights * values ** 2) / weight_sum - mean ** 2
+    low = per_day(weights * (values < normal_min))
+    high = per_day(weights * (values > normal_max))
+    samples = np.bincount(day_codes, minlength=n_days)
+    daily = _summary(weight_sum, mean, var, low, high, samples)
+
+    total = weights.sum()
+    overall_mean = (weights * values).sum() / total
+    overall_var = (weights * values ** 2).sum() / total - overall_mean ** 2
+    overall = _summary(total, overall_mean, overall_var, low.sum(), high.sum(), len(values))
+
+    daily['mage'], overall['mage'] = _mage(values, day_codes, daily['sd'], overall['sd'], n_days)
+
+    result = pd.DataFrame(daily)
+    result.insert(0, 'date', (days * NS_PER_DAY).astype('datetime64[ns]').astype('datetime64[D]').astype(str))
+    overall['date'] = 'all'
+    result.loc[len(result)] = overall
+    return result[METRIC_COLUMNS]
+
+# 将指标写为CSV或JSON，output为None时输出到标准输出
+def write_metrics(result, fmt='csv', output=None):
+    result = result.round(2)
+    if fmt == 'json':
+        records = json.loads(result.to_json(orient='records', force_ascii=False))
+        text = json.dumps({'days': records[:-1], 'overall': records[-1]}, ensure_ascii=False, indent=2) + '\n'
+    else:
+        text = result.to_csv(index=False)
+
+    if output:
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        print(f"指标已保存为: {output}")
+    else:
+        print(text, end='')
+
+# AGP（动态血糖图谱）百分位数
+# 将多天数据折叠到24小时轴上: 先构建 天×时间段 的矩阵（每格为该时间段内的平均值），
+# 再沿天的方向一次性计算百分位数
+# 返回 (每个时间段起点距午夜的分钟数, 百分位数组[len(percentiles), 时间段数], 天数)
+def agp_percentiles(df, bin_minutes=15, percentiles=(5, 25, 50, 75, 95)):
+    import warnings
+
+    times = df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    values = df['血糖值mmol/L'].to_numpy(dtype=float)
+    n_bins = int(np.ceil(24 * 60 / bin_minutes))
+
+    _, day_codes = np.unique(times // NS_PER_DAY, return_inverse=True)
+    n_days = int(day_codes.max()) + 1 if len(day_codes) else 0
+    bins = (times % NS_PER_DAY) // (bin_minutes * NS_PER_MINUTE)
+
+    cell = day_codes * n_bins + bins
+    sums = np.bincount(cell, weights=values, minlength=n_days * n_bins)
+    counts = np.bincount(cell, minlength=n_days * n_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        matrix = (sums / counts).reshape(n_days, n_bins)
+
+    # 没有任何数据的时间段结果为NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        result = np.nanpercentile(matrix, percentiles, axis=0)
+    return np.arange(n_bins) * bin_minutes, result, n_days
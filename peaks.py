@@ -0,0 +1,94 @@
+import numpy as np
+
+from timeline import NS_PER_MINUTE, gap_starts
+
+# 峰值检测结果的结构化数组类型
+# index: 峰值在原始数据中的下标; time/value: 峰值时刻和血糖值; prominence: 突出度(mmol/L);
+# width: 半突出度处的宽度(分钟); onset: 上升起点（峰值左侧的基底）时刻
+PEAK_DTYPE = np.dtype([
+    ('index', np.int64),
+    ('time', 'datetime64[ns]'),
+    ('value', np.float64),
+    ('prominence', np.float64),
+    ('width', np.float64),
+    ('onset', 'datetime64[ns]'),
+])
+
+# 采样间隔(分钟): 相邻采样点间隔的中位数（不含缺口），至少1分钟
+def sampling_step(times_ns, max_gap_minutes=15):
+    diffs = np.diff(np.asarray(times_ns, dtype=np.int64))
+    diffs = diffs[(diffs > 0) & (diffs <= max_gap_minutes * NS_PER_MINUTE)]
+    if len(diffs) == 0:
+        return 1.0
+    return max(float(np.median(diffs)) / NS_PER_MINUTE, 1.0)
+
+# 在整个数据集上检测峰值
+# times_ns为升序的int64纳秒时间，values为对应的血糖值
+# 数据在传感器断开（间隔超过max_gap_minutes）处分段，每段按step_minutes重采样为等间隔序列后检测，
+# 峰值间隔min_distance_minutes按实际时间换算，不依赖采样间隔，也不会跨过缺口比较
+# 返回按时间排序的PEAK_DTYPE结构化数组
+def detect_peaks(times_ns, values, min_distance_minutes=30, prominence=0.3,
+                 step_minutes=None, max_gap_minutes=15):
+    from scipy.signal import find_peaks
+
+    times_ns = np.asarray(times_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    if step_minutes is None:
+        step_minutes = sampling_step(times_ns, max_gap_minutes)
+    step_ns = int(step_minutes * NS_PER_MINUTE)
+    distance = max(int(round(min_distance_minutes / step_minutes)), 1)
+
+    bounds = np.concatenate([[0], gap_starts(times_ns, max_gap_minutes) + 1, [len(times_ns)]])
+    results = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end - start < 3:
+            continue
+        seg_times, seg_values = times_ns[start:end], values[start:end]
+        grid = np.arange(seg_times[0], seg_times[-1] + 1, step_ns, dtype=np.int64)
+        resampled = np.interp(grid, seg_times, seg_values)
+
+        positions, props = find_peaks(resampled, distance=distance, prominence=prominence, width=0)
+        if len(positions) == 0:
+            continue
+
+        # 重采样后的峰值对应到最近的原始采样点
+        nearest = np.clip(np.searchsorted(seg_times, grid[positions]), 1, len(seg_times) - 1)
+        use_left = grid[positions] - seg_times[nearest - 1] <= seg_times[nearest] - grid[positions]
+        indices = start + np.where(use_left, nearest - 1, nearest)
+        # 采样不均匀时两个重采样峰值可能对应同一个采样点，只保留一个
+        _, unique = np.unique(indices, return_index=True)
+        positions, indices = positions[unique], indices[unique]
+        props = {key: props[key][unique] for key in ('prominences', 'widths', 'left_bases')}
+
+        peaks = np.empty(len(positions), dtype=PEAK_DTYPE)
+        peaks['index'] = indices
+        peaks['time'] = times_ns[indices].view('datetime64[ns]')
+        peaks['value'] = values[indices]
+        peaks['prominence'] = props['prominences']
+        peaks['width'] = props['widths'] * step_minutes
+        peaks['onset'] = grid[props['left_bases']].view('datetime64[ns]')
+        results.append(peaks)
+
+    if not results:
+        return np.empty(0, dtype=PEAK_DTYPE)
+    return np.concatenate(results)
+
+# 下标index所在分段（在传感器断开处分段，与detect_peaks一致）的第一个采样点下标
+# 从index向前分块查找最近的缺口，代价与该分段的长度成正比，而不是整个数据集
+def segment_start(times_ns, index, max_gap_minutes=15, block=4096):
+    times_ns = np.asarray(times_ns, dtype=np.int64)
+    end = index + 1
+    while end > 1:
+        begin = max(end - block, 0)
+        gaps = gap_starts(times_ns[begin:end], max_gap_minutes)
+        if len(gaps):
+            return begin + int(gaps[-1]) + 1
+        end = begin + 1
+    return 0
+
+# 取出时间在 [start, end) 范围内的峰值，start/end为datetime、Timestamp或datetime64
+def peaks_between(peaks, start, end):
+    times = peaks['time'].view(np.int64)
+    bounds = np.asarray([start, end], dtype='datetime64[ns]').view(np.int64)
+    first, last = np.searchsorted(times, bounds)
+    return peaks[first:last]
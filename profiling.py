@@ -0,0 +1,170 @@
+import contextlib
+import csv
+import json
+import os
+import time
+
+# 当前进程中启用的Profiler，为None时所有计时点都是空操作
+_active = None
+
+# 未启用时 stage() 返回的共享空上下文，计时点的开销只有一次函数调用
+_NULL = contextlib.nullcontext()
+
+# 计时点: with profiling.stage('savefig'): ...
+# 嵌套的计时点记录为 '外层/内层'
+def stage(name):
+    if _active is None:
+        return _NULL
+    return _active.stage(name)
+
+# 作用域: with profiling.scope('2025/03/17'): ...，期间的阶段记录在该作用域下
+def scope(name):
+    if _active is None:
+        return _NULL
+    return _active.scope_of(name)
+
+# 当前进程中启用的Profiler，未启用时为None
+def active():
+    return _active
+
+def enable(profiler):
+    global _active
+    _active = profiler
+
+def disable():
+    global _active
+    _active = None
+
+class Profiler:
+    """
+    分阶段计时器
+
+    按作用域（渲染的日期，或非单日阶段的 'main'）记录每个阶段的耗时和调用次数，
+    trace_memory为True时用tracemalloc记录每个阶段的内存峰值（相对阶段开始时），
+    cprofile_dir不为None时每个作用域的cProfile结果保存为 <cprofile_dir>/<作用域>.prof
+    """
+
+    def __init__(self, trace_memory=False, cprofile_dir=None):
+        self.trace_memory = trace_memory
+        self.cprofile_dir = cprofile_dir
+        self.scope = 'main'
+        self.records = {}
+        self._stack = []
+        if trace_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        import tracemalloc
+
+        path = '/'.join([frame['name'] for frame in self._stack] + [name])
+        frame = {'name': name, 'peak': 0}
+        if self.trace_memory:
+            # 重置峰值前先把当前峰值记到外层阶段上，嵌套阶段不会丢失外层的峰值
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start'] = current
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            memory = None
+            if self.trace_memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+                memory = (peak - frame['start']) / 2**20
+            self._record(path, seconds, memory)
+
+    def _record(self, path, seconds, memory):
+        entry = self.records.setdefault(self.scope, {}).setdefault(
+            path, {'seconds': 0.0, 'calls': 0, 'peak_memory_mb': None})
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        if memory is not None:
+            entry['peak_memory_mb'] = max(entry['peak_memory_mb'] or 0.0, memory)
+
+    # 切换作用域，期间的阶段都记录在该作用域下；启用cProfile时同时采集该作用域的调用信息
+    @contextlib.contextmanager
+    def scope_of(self, scope):
+        previous, self.scope = self.scope, scope
+        profile = None
+        if self.cprofile_dir:
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                name = str(scope).replace('/', '')
+                profile.dump_stats(os.path.join(self.cprofile_dir, f"{name}.prof"))
+            self.scope = previous
+
+    # 返回某个作用域的记录（可跨进程传递的普通字典），用于批量模式的工作进程
+    def scope_records(self, scope):
+        return self.records.get(scope, {})
+
+    def merge(self, scope, records):
+        self.records[scope] = records
+
+# 汇总所有日期: 每个阶段的总耗时、调用次数、平均/最长单日耗时和最大内存峰值
+def aggregate(records):
+    totals = {}
+    for scope, stages in records.items():
+        if scope == 'main':
+            continue
+        for path, entry in stages.items():
+            total = totals.setdefault(path, {'seconds': 0.0, 'calls': 0, 'days': 0,
+                                             'max_seconds': 0.0, 'peak_memory_mb': None})
+            total['seconds'] += entry['seconds']
+            total['calls'] += entry['calls']
+            total['days'] += 1
+            total['max_seconds'] = max(total['max_seconds'], entry['seconds'])
+            if entry['peak_memory_mb'] is not None:
+                total['peak_memory_mb'] = max(total['peak_memory_mb'] or 0.0, entry['peak_memory_mb'])
+    for total in totals.values():
+        total['mean_seconds'] = total['seconds'] / total['days']
+    return totals
+
+# 写出报告，按扩展名选择JSON或CSV；同时在标准输出打印汇总
+def write_report(profiler, output):
+    records = profiler.records
+    totals = aggregate(records)
+
+    if output.lower().endswith('.csv'):
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['scope', 'stage', 'seconds', 'calls', 'peak_memory_mb'])
+            for scope, stages in records.items():
+                for path, entry in stages.items():
+                    writer.writerow([scope, path, round(entry['seconds'], 6), entry['calls'],
+                                     _round(entry['peak_memory_mb'])])
+            for path, total in totals.items():
+                writer.writerow(['all', path, round(total['seconds'], 6), total['calls'],
+                                 _round(total['peak_memory_mb'])])
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'scopes': records, 'total': totals}, f, ensure_ascii=False, indent=1)
+
+    print("\n各阶段耗时:")
+    rows = totals if totals else records.get('main', {})
+    for path, entry in sorted(rows.items(), key=lambda item: -item[1]['seconds']):
+        memory = '' if entry['peak_memory_mb'] is None else f"  峰值 {entry['peak_memory_mb']:.1f} MB"
+        print(f"  {path:<28} {entry['seconds'] * 1000:>10.1f} ms  {entry['calls']:>5} 次{memory}")
+    if totals and 'main' in records:
+        for path, entry in records['main'].items():
+            print(f"  {path + ' (main)':<28} {entry['seconds'] * 1000:>10.1f} ms  {entry['calls']:>5} 次")
+    print(f"性能报告已保存为: {output}")
+
+def _round(value):
+    return None if value is None else round(value, 3)
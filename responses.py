@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+NS_PER_MINUTE = 60 * 10**9
+
+# 事件后观察血糖反应的时长和事件前计算基线的时长（分钟）
+WINDOW_MINUTES = 120
+BASELINE_MINUTES = 30
+
+# 输出列（按输出顺序）
+RESPONSE_COLUMNS = ['date', 'time', 'description', 'baseline', 'peak', 'delta',
+                    'time_to_peak', 'iauc', 'return_minutes', 'samples']
+
+# 计算每个事件（进食、活动等注释）之后的血糖反应
+# times_ns: 升序的int64纳秒时间; values: 血糖值; events_ns: 事件时刻（int64纳秒，顺序任意）
+# - baseline: 事件前baseline_minutes分钟内（含事件时刻）的平均血糖，用累积和一次求出所有事件的区间均值
+# - peak/delta/time_to_peak: 事件后window_minutes分钟内的最高血糖、相对基线的升幅和达到峰值的分钟数
+# - iauc: 窗口内高于基线部分的增量曲线下面积（梯形法，mmol/L·分钟），跨过传感器断开的区间不计入
+# - return_minutes: 峰值之后血糖第一次回到基线以下的时刻距事件的分钟数，return_minutes_max分钟内没有回落时为NaN
+# 所有事件的窗口边界用searchsorted一次确定，再取出为 事件×采样点 的矩阵整体计算，不逐个事件筛选数据
+# 返回 {列名: 数组}，没有基线或窗口内没有数据的事件对应NaN
+def compute_responses(times_ns, values, events_ns, window_minutes=WINDOW_MINUTES, baseline_minutes=BASELINE_MINUTES,
+                      return_minutes_max=240, max_gap_minutes=15):
+    times_ns = np.asarray(times_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    events = np.atleast_1d(np.asarray(events_ns, dtype=np.int64))
+    n = len(events)
+    result = {key: np.full(n, np.nan) for key in
+              ('baseline', 'peak', 'delta', 'time_to_peak', 'iauc', 'return_minutes')}
+    result['samples'] = np.zeros(n, dtype=np.int64)
+    if n == 0 or len(times_ns) == 0:
+        return result
+
+    # 基线: 区间和 = 累积和之差
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    base_lo = np.searchsorted(times_ns, events - baseline_minutes * NS_PER_MINUTE, side='left')
+    base_hi = np.searchsorted(times_ns, events, side='right')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        baseline = (cumulative[base_hi] - cumulative[base_lo]) / (base_hi - base_lo)
+
+    # 事件后的窗口矩阵，覆盖峰值窗口和回落判断的时长，较短的行用掩码补齐
+    horizon = max(window_minutes, return_minutes_max)
+    lo = np.searchsorted(times_ns, events, side='left')
+    hi = np.searchsorted(times_ns, events + horizon * NS_PER_MINUTE, side='right')
+    width = int((hi - lo).max())
+    if width == 0:
+        result['baseline'] = baseline
+        return result
+    columns = np.arange(width)
+    indices = lo[:, None] + columns
+    valid = indices < hi[:, None]
+    indices = np.minimum(indices, len(times_ns) - 1)
+    window_values = values[indices]
+    offset = (times_ns[indices] - events[:, None]) / NS_PER_MINUTE
+    in_window = valid & (offset <= window_minutes)
+
+    rows = np.arange(n)
+    has_data = in_window.any(axis=1)
+    peak_column = np.argmax(np.where(in_window, window_values, -np.inf), axis=1)
+    peak = np.where(has_data, window_values[rows, peak_column], np.nan)
+
+    # 增量面积: 低于基线的部分记为0
+    increment = np.maximum(window_values - baseline[:, None], 0)
+    step = np.diff(offset, axis=1)
+    pairs = in_window[:, 1:] & in_window[:, :-1] & (step <= max_gap_minutes)
+    iauc = np.where(pairs, (increment[:, 1:] + increment[:, :-1]) / 2 * step, 0).sum(axis=1)
+
+    # 回到基线: 峰值之后第一个不高于基线的采样点
+    # 累积和求出的基线有约1e-12的舍入误差，比较时留出容差，等于基线的读数也算回到基线
+    returned = valid & (columns > peak_column[:, None]) & (window_values <= baseline[:, None] + 1e-9)
+    return_column = np.argmax(returned, axis=1)
+
+    usable = has_data & ~np.isnan(baseline)
+    result['baseline'] = baseline
+    result['peak'] = peak
+    result['delta'] = peak - baseline
+    result['time_to_peak'] = np.where(has_data, offset[rows, peak_column], np.nan)
+    result['iauc'] = np.where(usable, iauc, np.nan)
+    result['return_minutes'] = np.where(usable & returned.any(axis=1), offset[rows, return_column], np.nan)
+    result['samples'] = in_window.sum(axis=1)
+    return result
+
+# 注释列表 [(datetime, 描述, y偏移量)] 的血糖反应表，每个注释一行
+# time_index为整个数据集的TimeIndex，窗口可以跨过午夜
+def response_table(time_index, annotations, **options):
+    annotations = sorted(annotations, key=lambda a: a[0])
+    events = np.asarray([dt for dt, _, _ in annotations], dtype='datetime64[ns]').view(np.int64)
+    result = compute_responses(time_index.times, time_index.values, events, **options)
+    table = pd.DataFrame(result)
+    table.insert(0, 'date', [dt.strftime('%Y-%m-%d') for dt, _, _ in annotations])
+    table.insert(1, 'time', [dt.strftime('%H:%M') for dt, _, _ in annotations])
+    table.insert(2, 'description', [text for _, text, _ in annotations])
+    return table[RESPONSE_COLUMNS]
+
+# 在注释文本后加上血糖升幅，如 "午餐 (+2.3)"，没有数据的注释保持不变
+def label_responses(annotations, time_index, **options):
+    if not annotations:
+        return annotations
+    events = np.asarray([dt for dt, _, _ in annotations], dtype='datetime64[ns]').view(np.int64)
+    delta = compute_responses(time_index.times, time_index.values, events, **options)['delta']
+    return [(dt, text if np.isnan(d) else f"{text} ({d:+.1f})", y_offset)
+            for (dt, text, y_offset), d in zip(annotations, delta)]
+
+# 将反应表写为CSV，output为None时输出到标准输出
+def write_responses(table, output=None):
+    text = table.round(2).to_csv(index=False)
+    if output:
+        with open(output, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        print(f"血糖反应已保存为: {output}")
+    else:
+        print(text, end='')
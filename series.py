@@ -0,0 +1,157 @@
+import os
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+SECONDS_PER_DAY = 24 * 3600
+NS_PER_SECOND = 10**9
+
+# float32只有约7位有效数字，转换回float64时按此位数舍入，读数（一位或两位小数）可以完全还原，
+# 与参考线(7.8)等比较的结果与原始数据一致
+VALUE_DECIMALS = 4
+
+# 转换为距1970-01-01的秒数（不含时区，与导出文件中的本地时间一致）
+# 支持datetime、date、Timestamp、datetime64及它们的数组
+def to_epoch_seconds(value):
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+    return np.asarray(value, dtype='datetime64[s]').view(np.int64)
+
+class GlucoseSeries:
+    """
+    紧凑的血糖时间序列
+
+    时间为int64秒（升序），血糖值为float32，都保存在连续的NumPy数组中，可以从磁盘内存映射；
+    按日期或时间范围切片时用二分查找确定边界，返回共享同一块内存的视图，不复制数据。
+    批量模式和单日模式按天切片、峰值检测和每天渲染用的时间索引窗口都直接从这两个数组取得，不构建整个数据集的TimeIndex。
+    每个采样点12字节，pandas DataFrame（datetime64[ns] + float64，再加上按天分组时的副本）的几分之一
+    """
+
+    def __init__(self, times, values):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float32)
+        if len(self.times) != len(self.values):
+            raise ValueError("times与values长度不一致")
+        self._peaks = {}
+
+    # 从int64纳秒时间数组和血糖值数组创建，时间无序时先排序
+    @classmethod
+    def from_arrays(cls, times_ns, values):
+        times = np.asarray(times_ns, dtype=np.int64) // NS_PER_SECOND
+        values = np.asarray(values)
+        if len(times) > 1 and np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        return cls(times, values)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls.from_arrays(df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+                               df['血糖值mmol/L'].to_numpy())
+
+    # 读取save()保存的序列，mmap为True时内存映射，只在访问时从磁盘读取需要的部分
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = 'r' if mmap else None
+        return cls(np.load(f"{path}.times.npy", mmap_mode=mode),
+                   np.load(f"{path}.values.npy", mmap_mode=mode))
+
+    # 保存为 <path>.times.npy 和 <path>.values.npy 两个可以内存映射的文件
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.save(f"{path}.times.npy", self.times)
+        np.save(f"{path}.values.npy", self.values)
+
+    def __len__(self):
+        return len(self.times)
+
+    # 时间为datetime64[ns]数组（matplotlib和pandas可以直接使用）
+    def datetimes(self):
+        return self.times.astype('datetime64[s]').astype('datetime64[ns]')
+
+    # 时间为int64纳秒数组
+    def times_ns(self):
+        return self.times * NS_PER_SECOND
+
+    # 血糖值为float64数组，舍入到VALUE_DECIMALS位小数以还原原始读数
+    def values64(self):
+        return np.round(self.values.astype(np.float64), VALUE_DECIMALS)
+
+    # 时间在 [start, end) 范围内的部分，返回共享内存的视图
+    def range(self, start, end):
+        first, last = np.searchsorted(self.times, to_epoch_seconds([start, end]))
+        return GlucoseSeries(self.times[first:last], self.values[first:last])
+
+    # 某一天（date、datetime或日期字符串已解析的结果）的数据
+    def day(self, day):
+        if isinstance(day, datetime):
+            day = day.date()
+        return self.range(day, day + timedelta(days=1))
+
+    # 所有有数据的日期
+    def dates(self):
+        days = np.unique(self.times // SECONDS_PER_DAY)
+        return [date(1970, 1, 1) + timedelta(days=int(d)) for d in days]
+
+    # 依次返回 (date, 当天的视图)
+    # 时间有序，每天的起止位置由一次searchsorted得到
+    def iter_days(self):
+        if len(self.times) == 0:
+            return
+        days = np.unique(self.times // SECONDS_PER_DAY)
+        bounds = np.searchsorted(self.times, np.append(days, days[-1] + 1) * SECONDS_PER_DAY)
+        for d, first, last in zip(days, bounds[:-1], bounds[1:]):
+            yield (date(1970, 1, 1) + timedelta(days=int(d)),
+                   GlucoseSeries(self.times[first:last], self.values[first:last]))
+
+    # 按step_minutes分钟的时间段取平均，返回新的序列（时间为每个时间段的起点），没有数据的时间段不输出
+    def resample(self, step_minutes):
+        step = int(step_minutes * 60)
+        if len(self.times) == 0:
+            return GlucoseSeries(self.times, self.values)
+        buckets = self.times // step
+        starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+        counts = np.diff(np.append(starts, len(buckets)))
+        sums = np.add.reduceat(self.values.astype(np.float64), starts)
+        return GlucoseSeries(buckets[starts] * step, sums / counts)
+
+    # 转换为visualizer使用的DataFrame（时刻、血糖值mmol/L两列）
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame({'时刻': self.datetimes(), '血糖值mmol/L': self.values64()})
+
+    # 转换为TimeIndex（注释定位和峰值检测）
+    def time_index(self):
+        from timeindex import TimeIndex
+
+        return TimeIndex(self.datetimes(), self.values64())
+
+    # 整个序列的峰值（peaks.detect_peaks），按参数缓存，与TimeIndex.peaks的结果相同
+    # 检测时临时转换为float64，检测完只保留峰值数组，不常驻整个数据集的TimeIndex
+    def peaks(self, min_distance_minutes=30, prominence=0.3):
+        from peaks import detect_peaks
+
+        key = (min_distance_minutes, prominence)
+        if key not in self._peaks:
+            self._peaks[key] = detect_peaks(self.times_ns(), self.values64(), min_distance_minutes, prominence)
+        return self._peaks[key]
+
+    # 时间在 [start, end) 范围内的TimeIndex（与TimeIndex.window相同），已缓存的峰值一并截取
+    # 只转换这一段数据，批量模式中每天的渲染和渲染指纹都使用它
+    def window(self, start, end):
+        from peaks import peaks_between
+
+        first, last = np.searchsorted(self.times, to_epoch_seconds([start, end]))
+        sub = GlucoseSeries(self.times[first:last], self.values[first:last]).time_index()
+        for key, peaks in self._peaks.items():
+            peaks = peaks_between(peaks, start, end).copy()
+            peaks['index'] -= first
+            sub._peaks[key] = peaks
+        return sub
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + self.values.nbytes
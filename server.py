@@ -0,0 +1,358 @@
+import json
+import os
+import socketserver
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import visualizer
+
+# 支持的输出格式及对应的Content-Type
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+    'jpg': 'image/jpeg',
+}
+
+class RenderError(Exception):
+    """请求无法完成，status为返回的HTTP状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+# 请求中的数值参数（查询字符串中为文本），省略时为default，无法转换或不在 [low, high] 范围内时返回400
+def _number_param(request, name, convert, default, low, high):
+    value = request.get(name, default)
+    try:
+        number = convert(value)
+    except (TypeError, ValueError, OverflowError):
+        raise RenderError(f"参数 {name} 应为数字，收到 '{value}'")
+    if not low <= number <= high:
+        raise RenderError(f"参数 {name} 应在 {low} 到 {high} 之间")
+    return number
+
+# 请求中的开关参数: JSON布尔值或数字；文本（查询字符串或JSON中的字符串）只有 1/true/yes 为真，其他类型返回400
+def _bool_param(request, name, default=False):
+    value = request.get(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    if isinstance(value, (bool, int, float)) or value is None:
+        return bool(value)
+    raise RenderError(f"参数 {name} 应为 true 或 false，收到 '{value}'")
+
+# path（解析符号链接后）是否在目录directory之中
+def _inside(path, directory):
+    path, directory = os.path.realpath(path), os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+# 工作进程初始化: 用一小段数据完整渲染一次，提前导入matplotlib/scipy并填充字体和刻度缓存
+# Ctrl+C由主进程处理，工作进程忽略SIGINT
+def _warm_worker():
+    import signal
+    import numpy as np
+    import pandas as pd
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    times = pd.date_range('2000-01-01', periods=288, freq='5min')
+    df = pd.DataFrame({'时刻': times, '血糖值mmol/L': 6 + 3 * np.sin(np.arange(288) / 20)})
+    visualizer.render_image(df, [(times[100].to_pydatetime(), '血糖', 0.5)], '2000/01/01',
+                            show_peaks=True)
+
+class ImageCache:
+    """最近渲染图像的LRU缓存"""
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+class Dataset:
+    """常驻内存的一个导出文件: 按天分组的数据和整个文件的时间索引，文件变化时自动重新加载"""
+
+    def __init__(self, file_path, use_cache=True):
+        self.file_path = file_path
+        self.use_cache = use_cache
+        self.key = None
+        self.days = {}
+        self.time_index = None
+        self.lock = threading.Lock()
+
+    def _file_key(self):
+        stat = os.stat(self.file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    # 文件大小或修改时间变化时重新加载，调用方需持有self.lock
+    def _refresh(self):
+        from timeindex import TimeIndex
+
+        try:
+            key = self._file_key()
+        except OSError:
+            raise RenderError(f"找不到文件 '{self.file_path}'", 404)
+        if key != self.key:
+            df = visualizer.read_glucose_export(self.file_path, use_cache=self.use_cache)
+            self.days = visualizer.group_by_day(df)
+            self.time_index = TimeIndex.from_frame(df)
+            self.key = key
+
+    # 返回 (文件标识, 当天数据, 时间索引)
+    def day(self, date):
+        with self.lock:
+            self._refresh()
+            if date not in self.days:
+                available = ', '.join(str(d) for d in sorted(self.days))
+                raise RenderError(f"没有找到 {date} 的数据，可用日期: {available}", 404)
+            return self.key, self.days[date], self.time_index
+
+    def dates(self):
+        with self.lock:
+            self._refresh()
+            return sorted(self.days)
+
+class RenderService:
+    """
+    常驻渲染服务
+
+    解析后的导出文件保存在内存中，图表在预热过的进程池中渲染，最近的结果保存在LRU缓存中。
+    请求只能读取启动时指定的导出文件和data_dir中的导出文件，以及注释目录中的注释文件
+    """
+
+    def __init__(self, file_path, annotations_dir='annotations', jobs=None,
+                 cache_size=64, use_cache=True, data_dir=None):
+        self.default_file = file_path
+        self.data_dir = data_dir
+        self.annotations_dir = annotations_dir
+        self.use_cache = use_cache
+        self.datasets = {}
+        self.datasets_lock = threading.Lock()
+        self.images = ImageCache(cache_size)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_warm_worker)
+
+    # 进程池按需启动工作进程，启动时提交空任务让所有工作进程提前完成初始化
+    def warm(self):
+        for future in [self.pool.submit(int) for _ in range(self.jobs)]:
+            future.result()
+
+    # 请求中的 file 只能是启动时指定的导出文件或data_dir中的 OttaiCGM_*.xlsx 导出文件，其他路径返回403
+    # （读取导出文件时会在旁边写入列式缓存，不能由请求指定任意路径）
+    def dataset(self, file_path):
+        from dataset import _EXPORT_NAME
+
+        if file_path:
+            file_path = str(file_path)
+            allowed = os.path.realpath(file_path) == os.path.realpath(self.default_file) or (
+                self.data_dir is not None and _inside(file_path, self.data_dir)
+                and _EXPORT_NAME.match(os.path.basename(file_path)))
+            if not allowed:
+                raise RenderError(f"不允许读取文件 '{file_path}'，只能使用 -f 指定的导出文件或 --data-dir 中的导出文件", 403)
+        file_path = os.path.abspath(file_path or self.default_file)
+        with self.datasets_lock:
+            if file_path not in self.datasets:
+                self.datasets[file_path] = Dataset(file_path, self.use_cache)
+            return self.datasets[file_path]
+
+    # 将请求中的注释转换为 (datetime, 文本, y偏移量) 列表
+    # 支持列表 [["12:10", "午餐", 0.8], {"time": "18:20", "text": "晚餐"}] 或CSV文件路径
+    # 未提供时使用注释目录中当天的 annotations-YYYYMMDD.csv
+    def annotations(self, request, date, date_str):
+        annotations = request.get('annotations')
+        if annotations is None:
+            annotations_file = visualizer.find_annotations_file(self.annotations_dir, date)
+            if annotations_file is None:
+                return [], None
+            return visualizer.create_annotations(date_str, annotations_file=annotations_file), annotations_file
+
+        if isinstance(annotations, str):
+            if not _inside(annotations, self.annotations_dir):
+                raise RenderError(f"不允许读取注释文件 '{annotations}'，只能使用注释目录 '{self.annotations_dir}' 中的文件", 403)
+            if not os.path.exists(annotations):
+                raise RenderError(f"找不到注释文件 '{annotations}'", 404)
+            return visualizer.create_annotations(date_str, annotations_file=annotations), annotations
+
+        if not isinstance(annotations, list):
+            raise RenderError("annotations 应为注释列表或注释CSV文件路径")
+        result = []
+        for item in annotations:
+            if isinstance(item, dict):
+                time_str, text, y_offset = item.get('time'), item.get('text', ''), item.get('offset', 0)
+            elif isinstance(item, (list, tuple)) and 2 <= len(item) <= 3:
+                time_str, text, y_offset = (list(item) + [0])[:3]
+            else:
+                raise RenderError(f"无法解析注释 {json.dumps(item, ensure_ascii=False)}，"
+                                  f"应为 [时间, 文本, y偏移量] 或包含 time、text、offset 的对象")
+            try:
+                time = datetime.strptime(str(time_str), "%H:%M").time()
+            except ValueError:
+                raise RenderError(f"无法解析注释时间 '{time_str}'")
+            try:
+                y_offset = float(y_offset or 0)
+            except (TypeError, ValueError):
+                raise RenderError(f"注释 '{text}' 的y偏移量应为数字，收到 '{y_offset}'")
+            result.append((datetime.combine(date, time), str(text), y_offset))
+        return result, None
+
+    def render(self, request):
+        from manifest import annotations_digest
+
+        if 'date' not in request:
+            raise RenderError("缺少参数 date")
+        try:
+            target_date = visualizer.parse_date(str(request['date'])).date()
+        except SystemExit:
+            raise RenderError(f"无法解析日期 '{request['date']}'")
+        date_str = target_date.strftime("%Y/%m/%d")
+
+        fmt = str(request.get('format', 'png')).lower()
+        if fmt not in CONTENT_TYPES:
+            raise RenderError(f"不支持的格式 '{fmt}'，可选: {', '.join(CONTENT_TYPES)}")
+        dpi = _number_param(request, 'dpi', int, 100, 10, 600)
+        show_peaks = _bool_param(request, 'peaks')
+        peak_distance = _number_param(request, 'peak_distance', int, 30, 1, 24 * 60)
+        peak_prominence = _number_param(request, 'peak_prominence', float, 0.3, 0, 30)
+
+        dataset = self.dataset(request.get('file'))
+        file_key, df, time_index = dataset.day(target_date)
+        annotations, annotations_file = self.annotations(request, target_date, date_str)
+
+        cache_key = json.dumps([
+            dataset.file_path, file_key, date_str, fmt, dpi, show_peaks, peak_distance, peak_prominence,
+            [(dt.isoformat(), text, y) for dt, text, y in annotations],
+            annotations_digest(annotations_file),
+        ], ensure_ascii=False, default=str)
+        image = self.images.get(cache_key)
+        if image is None:
+            # 峰值在整个数据集上检测一次并缓存在时间索引上，工作进程只收到当天前后的一段索引和其中的峰值
+            if show_peaks:
+                time_index.peaks(peak_distance, peak_prominence)
+            future = self.pool.submit(visualizer.render_image, df, annotations, date_str, fmt, dpi,
+                                      show_peaks, peak_distance, peak_prominence,
+                                      visualizer.day_context(time_index, target_date))
+            image = future.result()
+            self.images.put(cache_key, image)
+        return image, CONTENT_TYPES[fmt]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """
+    HTTP接口
+    - POST /render  JSON: {date, annotations, peaks, peak_distance, peak_prominence, format, dpi, file}
+    - GET  /render?date=2025-03-17&peaks=1&format=png&dpi=100
+    - GET  /dates   可用日期
+    - GET  /health
+    """
+
+    server_version = 'OttaiGCMRender/1.0'
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                   'application/json; charset=utf-8')
+
+    def _render(self, request):
+        try:
+            image, content_type = self.server.service.render(request)
+        except RenderError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': f"渲染失败: {e}"})
+        else:
+            self._send(200, image, content_type)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif url.path == '/dates':
+            query = parse_qs(url.query)
+            try:
+                dates = self.server.service.dataset(query.get('file', [None])[0]).dates()
+            except RenderError as e:
+                self._send_json(e.status, {'error': str(e)})
+                return
+            self._send_json(200, {'dates': [d.isoformat() for d in dates]})
+        elif url.path == '/render':
+            request = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            self._render(request)
+        else:
+            self._send_json(404, {'error': f"未知路径 '{url.path}'"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/render':
+            self._send_json(404, {'error': f"未知路径 '{self.path}'"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': '请求体不是有效的JSON'})
+            return
+        if not isinstance(request, dict):
+            self._send_json(400, {'error': '请求体应为JSON对象'})
+            return
+        self._render(request)
+
+    def address_string(self):
+        # Unix套接字没有客户端地址
+        return self.client_address[0] if self.client_address else 'unix'
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+# 启动服务，socket_path不为None时监听Unix套接字，否则监听host:port
+def serve(service, host='127.0.0.1', port=8765, socket_path=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        httpd = ThreadingUnixHTTPServer(socket_path, RenderHandler)
+        address = socket_path
+    else:
+        httpd = ThreadingHTTPServer((host, port), RenderHandler)
+        address = f"http://{host}:{httpd.server_address[1]}"
+    httpd.service = service
+
+    print(f"渲染服务已启动: {address}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        print("渲染服务已停止")
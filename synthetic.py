@@ -0,0 +1,148 @@
+# 合成CGM数据生成器
+# 按固定随机种子生成可复现的血糖序列，写成与欧态导出相同格式的xlsx（时间倒序、"2025.3.20 01:45"格式的时间文本）
+# 以及每天对应的 annotations-YYYYMMDD.csv，用于基准测试和在没有真实数据时试用
+# 用法: python synthetic.py --days 14 --interval 5 -o data/synthetic.xlsx --annotations-dir annotations_synthetic
+import argparse
+import csv
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# 三餐时间（距午夜的分钟数）和描述
+MEALS = [
+    (7 * 60 + 30, ["早餐：燕麦粥", "早餐：包子+豆浆", "早餐：鸡蛋+全麦面包"]),
+    (12 * 60 + 10, ["午餐：米饭+炒青菜+鱼", "吃饭15分钟，紫米+香干炒肉+番茄炒蛋", "午餐：牛肉面"]),
+    (18 * 60 + 30, ["晚餐：面条+豆腐", "吃饭10分钟，杂粮米+清炒莴笋+葱油手撕鸡", "晚餐：饺子"]),
+]
+SNACKS = ["一根玉米肠", "水果：一个苹果", "一包肉松饼干", "酸奶一杯"]
+ACTIVITIES = ["散步20min", "椭圆机半小时", "快走15min", "打哈欠，很困"]
+
+# 进食/活动对血糖影响的持续时间（分钟）
+RESPONSE_MINUTES = 6 * 60
+
+# 进食后的血糖反应曲线: 伽马型，约45分钟达到峰值，2-3小时回落，峰值为1
+def _meal_response(minutes, peak_minutes=45.0):
+    t = np.maximum(minutes, 0) / peak_minutes
+    return np.where(minutes > 0, t ** 2 * np.exp(2 * (1 - t)), 0.0)
+
+# 生成合成血糖序列
+# days: 天数; interval: 采样间隔(分钟, 1/5/15); gaps_per_day: 平均每天传感器断开次数;
+# meals_per_day: 每天进食次数（三餐之外为加餐）
+# 返回 (datetime64[ns]时间数组, 血糖值数组, 事件列表[(datetime, 描述, 类型)])，时间升序
+def generate_series(days=14, interval=5, start=datetime(2025, 1, 1), seed=0,
+                    gaps_per_day=0.3, meals_per_day=3, activities_per_day=1):
+    rng = np.random.default_rng(seed)
+    per_day = 24 * 60 // interval
+    minutes = np.arange(days * per_day, dtype=np.int64) * interval
+    minute_of_day = minutes % (24 * 60)
+
+    # 基线: 个体水平 + 日内节律（黎明现象）+ 缓慢漂移
+    values = 5.4 + 0.5 * np.sin(2 * np.pi * (minute_of_day - 5 * 60) / (24 * 60))
+    drift = np.cumsum(rng.normal(0, 0.02 * np.sqrt(interval), len(minutes)))
+    values += drift - np.convolve(drift, np.ones(per_day) / per_day, mode='same')
+
+    events = []
+    for day in range(days):
+        day_start = day * 24 * 60
+        meal_times = [(m + rng.normal(0, 25), rng.choice(texts), 'meal') for m, texts in MEALS[:meals_per_day]]
+        for _ in range(max(meals_per_day - len(MEALS), 0)):
+            meal_times.append((rng.uniform(9 * 60, 23 * 60), rng.choice(SNACKS), 'meal'))
+        for _ in range(rng.poisson(activities_per_day)):
+            meal_times.append((rng.uniform(8 * 60, 22 * 60), rng.choice(ACTIVITIES), 'activity'))
+
+        for minute, text, kind in meal_times:
+            minute = int(np.clip(minute, 0, 24 * 60 - 1))
+            # 反应在6小时后可以忽略，只计算这一段
+            first = (day_start + minute) // interval
+            window = slice(first, first + RESPONSE_MINUTES // interval)
+            offset = minutes[window] - (day_start + minute)
+            if kind == 'meal':
+                values[window] += rng.uniform(1.5, 5.0) * _meal_response(offset, rng.uniform(35, 60))
+            else:
+                values[window] -= rng.uniform(0.3, 1.2) * _meal_response(offset, 30.0)
+            events.append((start + timedelta(minutes=day_start + minute), str(text), kind))
+
+    # 传感器噪声，按欧态导出保留一位小数
+    values = np.round(np.clip(values + rng.normal(0, 0.1, len(minutes)), 2.2, 22.2), 1)
+
+    # 传感器断开: 随机位置删除15分钟到3小时的数据
+    keep = np.ones(len(minutes), dtype=bool)
+    for _ in range(rng.poisson(gaps_per_day * days)):
+        gap_start = rng.integers(0, len(minutes))
+        keep[gap_start:gap_start + int(rng.uniform(15, 180)) // interval + 1] = False
+
+    times = np.datetime64(start, 'ns') + minutes[keep].astype('timedelta64[m]')
+    events.sort(key=lambda e: e[0])
+    return times, values[keep], events
+
+# 写入欧态格式的xlsx: 时刻、血糖值mmol/L两列，时间倒序，值为文本
+def write_export(file_path, times, values):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(['时刻', '血糖值mmol/L'])
+    for t, value in zip(times[::-1].astype('datetime64[m]').tolist(), values[::-1]):
+        sheet.append([f"{t.year}.{t.month}.{t.day} {t:%H:%M}", f"{value:.1f}"])
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    workbook.save(file_path)
+
+# 按天写入注释文件 annotations-YYYYMMDD.csv
+# density: 每个事件写入注释的概率 (0~1)，返回写入的文件列表
+def write_annotations(directory, events, density=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    by_day = {}
+    for dt, text, kind in events:
+        if rng.random() < density:
+            offset = rng.choice([0.3, 0.5, 0.8]) if kind == 'meal' else -rng.choice([0.4, 0.7])
+            by_day.setdefault(dt.date(), []).append((dt, text, offset))
+
+    files = []
+    for date, rows in sorted(by_day.items()):
+        path = os.path.join(directory, f"annotations-{date.strftime('%Y%m%d')}.csv")
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["时间", "活动描述", "Y偏移量", "日期(可选)"])
+            for dt, text, offset in rows:
+                writer.writerow([dt.strftime("%H:%M"), text, offset, dt.strftime("%Y/%m/%d")])
+        files.append(path)
+    return files
+
+def main():
+    parser = argparse.ArgumentParser(description='生成欧态格式的合成血糖数据和注释文件')
+    parser.add_argument('--days', type=int, default=14,
+                        help='天数 (默认: 14)')
+    parser.add_argument('--interval', type=int, choices=[1, 5, 15], default=5,
+                        help='采样间隔(分钟) (默认: 5)')
+    parser.add_argument('--start', type=str, default='2025-01-01',
+                        help='第一天的日期 (默认: 2025-01-01)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='随机种子，相同参数和种子生成相同的数据 (默认: 0)')
+    parser.add_argument('--gaps', type=float, default=0.3,
+                        help='平均每天传感器断开次数 (默认: 0.3)')
+    parser.add_argument('--meals', type=int, default=3,
+                        help='每天进食次数，超过3次的部分为加餐 (默认: 3)')
+    parser.add_argument('--annotation-density', type=float, default=1.0,
+                        help='每个进食/活动事件写入注释的概率 (默认: 1.0)')
+    parser.add_argument('-o', '--output', type=str, default='data/synthetic.xlsx',
+                        help='输出xlsx文件 (默认: data/synthetic.xlsx)')
+    parser.add_argument('--annotations-dir', type=str, default=None,
+                        help='注释文件输出目录 (默认: 不生成注释)')
+    args = parser.parse_args()
+
+    times, values, events = generate_series(args.days, args.interval,
+                                            start=datetime.strptime(args.start, '%Y-%m-%d'),
+                                            seed=args.seed, gaps_per_day=args.gaps,
+                                            meals_per_day=args.meals)
+    write_export(args.output, times, values)
+    print(f"已生成 {len(times)} 条数据: {args.output}")
+    if args.annotations_dir:
+        files = write_annotations(args.annotations_dir, events, args.annotation_density, seed=args.seed)
+        print(f"已生成 {len(files)} 个注释文件: {args.annotations_dir}")
+
+if __name__ == "__main__":
+    main()
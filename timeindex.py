@@ -0,0 +1,100 @@
+import numpy as np
+
+# 将时间（datetime、Timestamp、datetime64或它们的列表）转换为int64纳秒数组
+def to_epoch_ns(times):
+    return np.asarray(times, dtype='datetime64[ns]').view(np.int64)
+
+class TimeIndex:
+    """
+    血糖数据的时间索引
+
+    时间保存为排序后的int64纳秒数组，每次查询通过np.searchsorted二分查找，
+    支持一次查询多个时间点
+    """
+
+    def __init__(self, times, values):
+        times = to_epoch_ns(times)
+        values = np.asarray(values, dtype=float)
+        if len(times) > 1 and np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind='stable')
+            times, values = times[order], values[order]
+        self.times = times
+        self.values = values
+        self._peaks = {}
+        self._step_minutes = None
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df['时刻'].values, df['血糖值mmol/L'].values)
+
+    def __len__(self):
+        return len(self.times)
+
+    # 最近的采样点，返回 (采样点下标数组, 血糖值数组)
+    # 与前后两个采样点距离相等时取较早的一个
+    def nearest(self, query):
+        query = np.atleast_1d(to_epoch_ns(query))
+        right = np.clip(np.searchsorted(self.times, query), 1, len(self.times) - 1)
+        left = right - 1
+        use_left = (query - self.times[left]) <= (self.times[right] - query)
+        indices = np.where(use_left, left, right)
+        if len(self.times) == 1:
+            indices = np.zeros_like(query)
+        return indices, self.values[indices]
+
+    # 线性插值的血糖值，超出数据范围时使用两端的值
+    def interpolate(self, query):
+        query = np.atleast_1d(to_epoch_ns(query))
+        return np.interp(query, self.times, self.values)
+
+    # 峰值检测使用的采样间隔(分钟)，第一次检测时在整个数据集上确定，之后追加数据时保持不变
+    def step_minutes(self):
+        from peaks import sampling_step
+
+        if self._step_minutes is None:
+            self._step_minutes = sampling_step(self.times)
+        return self._step_minutes
+
+    # 整个数据集的峰值（peaks.detect_peaks），按参数缓存在索引上
+    # 时间索引对每个数据集只构建一次，批量模式和渲染服务中各天的图表共用同一份结果
+    def peaks(self, min_distance_minutes=30, prominence=0.3):
+        from peaks import detect_peaks
+
+        key = (min_distance_minutes, prominence)
+        if key not in self._peaks:
+            self._peaks[key] = detect_peaks(self.times, self.values, min_distance_minutes, prominence,
+                                            step_minutes=self.step_minutes())
+        return self._peaks[key]
+
+    # 数据从下标first开始被替换或追加（监视模式），times/values为更新后的完整数组（可以是视图，不复制）
+    # 已缓存的峰值只从first所在分段的起点重新检测，拼接到之前的峰值后面；分段在传感器断开处划分，
+    # 各段独立检测，结果与在整个数据集上重新检测相同
+    def update_tail(self, times, values, first):
+        from peaks import detect_peaks, segment_start
+
+        self.times = to_epoch_ns(times)
+        self.values = np.asarray(values, dtype=float)
+        if not self._peaks:
+            return
+        start = segment_start(self.times, min(first, len(self.times) - 1))
+        boundary = self.times[start:start + 1].view('datetime64[ns]')
+        for (min_distance_minutes, prominence), peaks in self._peaks.items():
+            kept = peaks[:np.searchsorted(peaks['time'], boundary[0])] if len(boundary) else peaks[:0]
+            tail = detect_peaks(self.times[start:], self.values[start:], min_distance_minutes, prominence,
+                                step_minutes=self.step_minutes())
+            tail['index'] += start
+            self._peaks[(min_distance_minutes, prominence)] = np.concatenate([kept, tail])
+
+    # 时间在 [start, end) 范围内的子索引，已缓存的峰值（在整个数据集上检测的结果）一并截取，子索引上不会重新检测
+    # 渲染单日图表的工作进程只需要当天前后的一小段数据，不需要整个数据集的索引
+    def window(self, start, end):
+        from peaks import peaks_between
+
+        first, last = np.searchsorted(self.times, to_epoch_ns([start, end]))
+        sub = TimeIndex(self.times[first:last].view('datetime64[ns]'), self.values[first:last])
+        sub._step_minutes = self._step_minutes
+        for key, peaks in self._peaks.items():
+            peaks = peaks_between(peaks, start, end).copy()
+            peaks['index'] -= first
+            sub._peaks[key] = peaks
+        return sub
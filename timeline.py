@@ -0,0 +1,70 @@
+import numpy as np
+
+NS_PER_MINUTE = 60 * 10**9
+
+# M4降采样: 按x坐标把数据分到n_buckets个等宽的桶中（每个桶对应一列像素），
+# 每个桶只保留第一个点、最后一个点、最小值点和最大值点
+# 以这个分辨率绘制折线时，结果与绘制全部原始数据在像素上一致
+# x必须升序；keep为额外必须保留的索引
+# 返回保留点的索引（升序）
+def m4_indices(x, y, n_buckets, keep=None):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= 4 * n_buckets or x[-1] <= x[0]:
+        return np.arange(n)
+
+    buckets = ((x - x[0]) * (n_buckets / (x[-1] - x[0]))).astype(np.int64)
+    np.minimum(buckets, n_buckets - 1, out=buckets)
+
+    # x有序，每个桶是一段连续的区间
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    counts = np.diff(np.append(starts, n))
+
+    selected = np.zeros(n, dtype=bool)
+    selected[starts] = True
+    selected[starts + counts - 1] = True
+
+    # 每个桶的极值用reduceat一次求出，再找到每个桶中第一个等于极值的点
+    for reduce in (np.minimum, np.maximum):
+        extreme = np.repeat(reduce.reduceat(y, starts), counts)
+        hits = np.flatnonzero(y == extreme)
+        selected[hits[np.diff(buckets[hits], prepend=-1) != 0]] = True
+
+    if keep is not None:
+        selected[np.asarray(keep, dtype=np.int64)] = True
+    return np.flatnonzero(selected)
+
+# 穿过参考线的相邻点对: 保留两端即可让降采样后按参考线着色的结果与原始数据一致
+def threshold_crossings(y, normal_min=3.9, normal_max=7.8):
+    y = np.asarray(y, dtype=float)
+    zone = np.where(y > normal_max, 1, np.where(y < normal_min, -1, 0))
+    change = np.flatnonzero(zone[1:] != zone[:-1])
+    return np.concatenate([change, change + 1])
+
+# 间隔超过max_gap_minutes的相邻点（传感器断开），返回缺口前一个点的索引
+def gap_starts(times_ns, max_gap_minutes=15):
+    return np.flatnonzero(np.diff(np.asarray(times_ns, dtype=np.int64)) > max_gap_minutes * NS_PER_MINUTE)
+
+# 时间线降采样
+# 点数预算由绘图区域的像素宽度决定，参考线穿越点、峰值和缺口两端始终保留
+# 缺口处插入NaN，使曲线和填充在传感器断开处断开
+# 返回 (降采样后的时间数组, 血糖值数组)，时间为int64纳秒（缺口处的NaN点为缺口中点）
+def downsample_timeline(times_ns, values, width_px, peaks=(), normal_min=3.9, normal_max=7.8,
+                        max_gap_minutes=15):
+    times_ns = np.asarray(times_ns, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    gaps = gap_starts(times_ns, max_gap_minutes)
+    keep = np.concatenate([
+        threshold_crossings(values, normal_min, normal_max),
+        np.asarray(peaks, dtype=np.int64),
+        gaps, gaps + 1,
+    ]).astype(np.int64)
+
+    indices = m4_indices(times_ns, values, max(int(width_px), 1), keep)
+    times_out, values_out = times_ns[indices], values[indices]
+
+    # 缺口两端都被保留，在缺口前一个点之后插入NaN
+    positions = np.searchsorted(indices, gaps) + 1
+    midpoints = (times_ns[gaps] + times_ns[gaps + 1]) // 2
+    return np.insert(times_out, positions, midpoints), np.insert(values_out, positions, np.nan)
@@ -1,28 +1,91 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 from datetime import datetime, timedelta
 import argparse
 import os
 import sys
 import csv
-from scipy.signal import find_peaks
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+import profiling
+from annotation_store import DATE_FORMATS, AnnotationStore, read_annotation_rows
 
-# 读取Excel数据
-def load_glucose_data(file_path, target_date):
-    # 读取Excel文件
-    df = pd.read_excel(file_path)
+# pandas、matplotlib和scipy导入较慢，只在实际需要的阶段导入，
+# 这样 --help、--create-sample、--list-dates 和日期校验等不需要为它们付出启动时间
+
+# 血糖参考范围 (mmol/L)
+NORMAL_MIN = 3.9
+NORMAL_MAX = 7.8
+
+# 渲染一天的图表时用到的前后数据范围: 午夜前后的注释定位和进食后2小时的血糖反应都在这个范围内
+DAY_CONTEXT = timedelta(days=1)
+
+# 更接近参考图的配色方案
+NORMAL_COLOR = '#4a86e8'  # 正常范围的蓝色
+WARNING_COLOR = '#f39c12'  # 超标范围的黄色（更鲜明的橙色）
+FILL_COLOR = '#e8f2fe'  # 浅蓝色填充
+ANNOTATION_COLOR = '#e74c3c'  # 鲜红色
+PEAK_COLOR = '#9c27b0'  # 紫色用于峰值标注
+GRID_COLOR = '#e6e6e6'  # 浅灰色网格
+
+# 导入pyplot并设置中文字体，所有绘图函数通过它获取pyplot
+def load_pyplot():
+    import matplotlib.pyplot as plt
+    
+    # 设置中文字体
+    plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei']
+    plt.rcParams['axes.unicode_minus'] = False
+    return plt
+
+# 解析Excel导出文件，只保留时间和血糖值两列
+# start/end (datetime) 限定读取范围 start <= 时刻 < end，xlsx文件流式读取，范围外的行不会进入内存
+def parse_glucose_export(file_path, start=None, end=None):
+    import pandas as pd
+    from xlsx_reader import read_glucose_columns
+    
+    if os.path.splitext(file_path)[1].lower() in ('.xlsx', '.xlsm'):
+        with profiling.stage('parse_excel'):
+            times, values = read_glucose_columns(file_path, start, end)
+        return pd.DataFrame({'时刻': times.view('datetime64[ns]'), '血糖值mmol/L': values})
+    
+    # 其他格式（如.xls）使用pandas读取
+    with profiling.stage('parse_excel'):
+        df = pd.read_excel(file_path)
     
     # 转换时间列为datetime
     df['时刻'] = pd.to_datetime(df['时刻'])
+    if start is not None:
+        df = df[df['时刻'] >= start]
+    if end is not None:
+        df = df[df['时刻'] < end]
+    
+    # 按时间排序
+    df = df.sort_values('时刻', kind='stable').reset_index(drop=True)
+    return df[['时刻', '血糖值mmol/L']]
+
+# 读取完整的Excel导出数据，优先使用列式缓存
+def read_glucose_export(file_path, use_cache=True, rebuild_cache=False):
+    import cgm_cache
     
-    # 筛选指定日期的数据
-    target_date = pd.to_datetime(target_date).date()
-    df_filtered = df[df['时刻'].dt.date == target_date]
+    if use_cache and not rebuild_cache:
+        with profiling.stage('load_cache'):
+            df = cgm_cache.load_cache(file_path)
+        if df is not None:
+            return df
+    
+    df = parse_glucose_export(file_path)
+    if use_cache:
+        with profiling.stage('save_cache'):
+            cgm_cache.save_cache(file_path, df)
+    return df
+
+# 从已加载的数据中筛选指定日期
+# 数据按时间排序，二分查找当天的起止位置后切片，不需要逐行比较日期
+def select_day(df, target_date):
+    target_date = parse_date(target_date).date()
+    with profiling.stage('filter_date'):
+        df = sort_by_time(df)
+        start = datetime.combine(target_date, datetime.min.time())
+        first, last = day_bounds(df, [start, start + timedelta(days=1)])
+        df_filtered = df.iloc[first:last]
     
     if df_filtered.empty:
         available_dates = df['时刻'].dt.date.unique()
@@ -30,51 +93,152 @@ def load_glucose_data(file_path, target_date):
         print(f"可用日期: {', '.join([str(d) for d in available_dates])}")
         sys.exit(1)
     
-    # 按时间排序
-    df_filtered = df_filtered.sort_values('时刻')
-    
     return df_filtered
 
+# 读取Excel数据
+# 不使用缓存时只流式读取目标日期的数据
+def load_glucose_data(file_path, target_date, use_cache=True, rebuild_cache=False):
+    if not use_cache:
+        start = datetime.combine(parse_date(target_date).date(), datetime.min.time())
+        df = parse_glucose_export(file_path, start, start + timedelta(days=1))
+        if not df.empty:
+            return df
+    
+    df = read_glucose_export(file_path, use_cache=use_cache, rebuild_cache=rebuild_cache)
+    return select_day(df, target_date)
+
+# 单日模式的数据: 返回 (当天的GlucoseSeries视图, 时间索引)
+# 与批量模式一样，峰值在整个数据集上检测（-f 使用列式缓存，--data-dir 为合并后的数据），时间索引为当天前后的窗口，结果一致；
+# --no-cache 时只流式读取当天及前后DAY_CONTEXT范围内的数据，跨过午夜的峰值和血糖反应仍然完整
+def load_day_with_context(args, target_date):
+    from series import GlucoseSeries
+    
+    target_date = parse_date(target_date).date()
+    series = None
+    if args.no_cache and not args.data_dir:
+        day_start = datetime.combine(target_date, datetime.min.time())
+        window = parse_glucose_export(args.file, day_start - DAY_CONTEXT, day_start + timedelta(days=1) + DAY_CONTEXT)
+        series = GlucoseSeries.from_frame(window)
+        if len(series.day(target_date)) == 0:
+            # 当天没有数据时读取全部数据，以便列出可用日期
+            series = None
+    if series is None:
+        series = load_series(args)
+    
+    with profiling.stage('filter_date'):
+        day = series.day(target_date)
+    if len(day) == 0:
+        print(f"错误: 没有找到 {target_date} 的数据")
+        print(f"可用日期: {', '.join([str(d) for d in series.dates()])}")
+        sys.exit(1)
+    if args.peaks:
+        series.peaks(args.peak_distance, args.peak_prominence)
+    return day, day_context(series, target_date)
+
+# 读取 --data-dir 目录中的所有导出文件，按患者（或传感器）合并去重
+# 返回 {分组名: GlucoseSeries}，指定 --patient 时只返回该分组；只需要numpy
+def load_groups(args):
+    from dataset import load_directory
+    
+    if not os.path.isdir(args.data_dir):
+        print(f"错误: 找不到目录 '{args.data_dir}'")
+        sys.exit(1)
+    
+    with profiling.stage('load_directory'):
+        groups = load_directory(args.data_dir, by=args.group_by, jobs=args.jobs,
+                                use_cache=not args.no_cache, rebuild_cache=args.rebuild_cache)
+    if not groups:
+        print(f"错误: 目录 '{args.data_dir}' 中没有 OttaiCGM_*.xlsx 导出文件")
+        sys.exit(1)
+    if args.patient:
+        if args.patient not in groups:
+            print(f"错误: 目录 '{args.data_dir}' 中没有 '{args.patient}' 的数据")
+            print(f"可用分组: {', '.join(groups)}")
+            sys.exit(1)
+        groups = {args.patient: groups[args.patient]}
+    return groups
+
+# 读取命令行指定的全部数据，返回GlucoseSeries: -f 的导出文件（优先使用列式缓存），或 --data-dir 中一个患者合并后的数据
+def load_series(args):
+    from dataset import read_glucose_arrays
+    from series import GlucoseSeries
+    
+    if args.data_dir:
+        groups = load_groups(args)
+        if len(groups) > 1:
+            print(f"错误: 目录 '{args.data_dir}' 中有多个分组: {', '.join(groups)}，请用 --patient 指定")
+            sys.exit(1)
+        return next(iter(groups.values()))
+    
+    if not os.path.exists(args.file):
+        print(f"错误: 找不到文件 '{args.file}'")
+        sys.exit(1)
+    with profiling.stage('load_cache'):
+        times, values = read_glucose_arrays(args.file, use_cache=not args.no_cache,
+                                            rebuild_cache=args.rebuild_cache)
+    return GlucoseSeries.from_arrays(times, values)
+
+# 读取命令行指定的全部数据（DataFrame）: -f 的导出文件，或 --data-dir 中一个患者合并后的数据
+def load_export(args):
+    if args.data_dir:
+        return load_series(args).to_frame()
+    
+    if not os.path.exists(args.file):
+        print(f"错误: 找不到文件 '{args.file}'")
+        sys.exit(1)
+    return read_glucose_export(args.file, use_cache=not args.no_cache,
+                               rebuild_cache=args.rebuild_cache)
+
+# 按日期分组，返回 {date: DataFrame}
+# 每天是原数据的一段连续切片，边界由一次二分查找得到
+def group_by_day(df):
+    import numpy as np
+    
+    with profiling.stage('group_by_day'):
+        if df.empty:
+            return {}
+        df = sort_by_time(df)
+        days = np.unique(df['时刻'].to_numpy(dtype='datetime64[D]'))
+        bounds = day_bounds(df, np.append(days, days[-1] + 1))
+        return {day.item(): df.iloc[first:last] for day, first, last in zip(days, bounds[:-1], bounds[1:])}
+
+# 数据未按时间排序时（如 .xls 导出以外的来源）先排序
+def sort_by_time(df):
+    if df['时刻'].is_monotonic_increasing:
+        return df
+    return df.sort_values('时刻', kind='stable').reset_index(drop=True)
+
+# 时刻在按时间排序的数据中的位置（searchsorted），boundaries为datetime或datetime64列表
+def day_bounds(df, boundaries):
+    import numpy as np
+    
+    times = df['时刻'].to_numpy(dtype='datetime64[ns]')
+    return np.searchsorted(times, np.asarray(boundaries, dtype='datetime64[ns]'))
+
+# 血糖数据的 (datetime64[ns]时间数组, float64血糖值数组)
+# data可以是DataFrame或GlucoseSeries，绘图和峰值检测都通过它读取数据
+def glucose_arrays(data):
+    if hasattr(data, 'values64'):
+        return data.datetimes(), data.values64()
+    return data['时刻'].to_numpy(dtype='datetime64[ns]'), data['血糖值mmol/L'].to_numpy(dtype=float)
+
 # 从CSV文件加载活动注释
 def load_annotations_from_csv(csv_file, date_str=None):
     if not os.path.exists(csv_file):
         print(f"错误: 找不到注释文件 '{csv_file}'")
         return None
     
-    annotations = []
-    
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            header = next(reader, None)  # 跳过标题行
-            
-            for row in reader:
-                if len(row) < 2:
-                    continue
-                    
-                time_str = row[0].strip()
-                description = row[1].strip()
-                
-                # 可选的第三列作为y偏移量
-                y_offset = 0
-                if len(row) > 2 and row[2].strip():
-                    try:
-                        y_offset = float(row[2])
-                    except ValueError:
-                        pass
-                
-                # 如果有日期列（第四列），检查是否匹配目标日期
-                if len(row) > 3 and row[3].strip() and date_str:
-                    if parse_date(row[3]).date() != parse_date(date_str).date():
-                        continue
-                
-                # 将时间和描述加入注释列表
-                annotations.append((time_str, description, y_offset))
-        
-        return annotations
+        rows = read_annotation_rows(csv_file)
     except Exception as e:
         print(f"读取CSV文件时出错: {e}")
         return None
+    
+    # 如果有日期列（第四列），只保留匹配目标日期的行；日期列在读取时已按文件统一解析
+    target = parse_date(date_str).date() if date_str else None
+    return [(time_str, description, y_offset)
+            for time_str, description, y_offset, date in rows
+            if date is None or target is None or date == target]
 
 # 创建活动注释列表
 def create_annotations(date_str, custom_annotations=None, annotations_file=None):
@@ -82,11 +246,12 @@ def create_annotations(date_str, custom_annotations=None, annotations_file=None)
     annotations = []
     
     # 解析日期
-    base_date = pd.to_datetime(date_str).date()
+    base_date = parse_date(date_str).date()
     
     # 如果提供了注释文件，从文件加载
     if annotations_file:
-        csv_annotations = load_annotations_from_csv(annotations_file, date_str)
+        with profiling.stage('annotations_csv'):
+            csv_annotations = load_annotations_from_csv(annotations_file, date_str)
         if csv_annotations:
             for time_str, text, y_offset in csv_annotations:
                 try:
@@ -106,7 +271,7 @@ def create_annotations(date_str, custom_annotations=None, annotations_file=None)
         return annotations
     
     # 默认注释 - 2025年3月17日
-    if base_date == pd.to_datetime("2025/3/17").date():
+    if base_date == datetime(2025, 3, 17).date():
         annotations.append((datetime.combine(base_date, datetime.strptime("10:30", "%H:%M").time()), "一根玉米肠", 0))
         annotations.append((datetime.combine(base_date, datetime.strptime("12:10", "%H:%M").time()), "吃饭15分钟，紫米+香干炒肉+番茄炒蛋", 0.8))
         annotations.append((datetime.combine(base_date, datetime.strptime("12:30", "%H:%M").time()), "散步20min", -0.8))
@@ -116,7 +281,7 @@ def create_annotations(date_str, custom_annotations=None, annotations_file=None)
         annotations.append((datetime.combine(base_date, datetime.strptime("18:40", "%H:%M").time()), "散步15min", -0.7))
         annotations.append((datetime.combine(base_date, datetime.strptime("19:05", "%H:%M").time()), "打哈欠，很困", 0.4))
         annotations.append((datetime.combine(base_date, datetime.strptime("21:44", "%H:%M").time()), "椭圆机半小时", -0.4))
-        annotations.append((datetime.combine(base_date, datetime.strptime("23:50", "%H:%M").time()), "两包干脆面+两根玉米肠", 0.3, "2025/3/17"))
+        annotations.append((datetime.combine(base_date, datetime.strptime("23:50", "%H:%M").time()), "两包干脆面+两根玉米肠", 0.3))
     else:
         print(f"注意: 没有为 {base_date} 预设注释，图表将不包含活动标记")
     
@@ -149,24 +314,26 @@ def create_sample_annotations_file():
     print(f"已创建示例注释文件: {filename}")
     return filename
 
-# 解析日期字符串的各种格式
+# 解析日期字符串的各种格式，返回datetime
 def parse_date(date_str):
-    # 尝试各种常见的日期格式
-    formats = [
-        "%Y/%m/%d", "%Y-%m-%d", "%Y.%m.%d",
-        "%Y年%m月%d日", "%m/%d/%Y", "%d/%m/%Y",
-        "%m-%d-%Y", "%d-%m-%Y"
-    ]
+    # 已经是日期对象（datetime、date或pandas Timestamp）
+    if isinstance(date_str, datetime):
+        return date_str
+    if hasattr(date_str, 'timetuple'):
+        return datetime.combine(date_str, datetime.min.time())
     
-    for fmt in formats:
+    # 尝试各种常见的日期格式
+    date_str = str(date_str).strip()
+    for fmt in DATE_FORMATS:
         try:
-            return pd.to_datetime(date_str, format=fmt)
-        except:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
             continue
     
-    # 如果所有格式都失败，使用pandas默认解析
+    # 如果所有格式都失败，使用dateutil通用解析（与pandas默认解析一致，但无需导入pandas）
+    from dateutil import parser as date_parser
     try:
-        return pd.to_datetime(date_str)
+        return date_parser.parse(date_str)
     except:
         print(f"错误: 无法解析日期 '{date_str}'")
         print("请使用以下格式之一: YYYY/MM/DD, YYYY-MM-DD, MM/DD/YYYY, DD/MM/YYYY 等")
@@ -177,176 +344,349 @@ def find_local_peaks(df, min_distance_minutes=30, prominence=0.3):
     找出血糖数据中的局部峰值
     
     参数:
-    - df: 包含血糖数据的DataFrame
-    - min_distance_minutes: 两个峰值之间的最小时间间隔(分钟)
+    - df: 包含血糖数据的DataFrame或GlucoseSeries
+    - min_distance_minutes: 两个峰值之间的最小时间间隔(分钟)，按实际时间计算，与采样间隔无关
     - prominence: 峰值的最小突出度(mmol/L)
     
     返回:
-    - 峰值索引列表
-    """
-    # 获取血糖值序列
-    glucose_values = df['血糖值mmol/L'].values
+    - 峰值在df中的位置下标数组
     
-    # 寻找峰值
-    peaks, _ = find_peaks(glucose_values, distance=min_distance_minutes//5, prominence=prominence)
+    检测在传感器断开处分段进行（见 peaks.detect_peaks），需要突出度、宽度等信息时使用 TimeIndex.peaks
+    """
+    import numpy as np
+    from peaks import detect_peaks
     
-    return peaks
+    times, values = glucose_arrays(df)
+    times = times.view(np.int64)
+    order = np.argsort(times, kind='stable')
+    peaks = detect_peaks(times[order], values[order], min_distance_minutes, prominence)
+    return order[peaks['index']]
 
-# 绘制血糖曲线图
-def plot_glucose_curve(df, annotations, date_str, show_peaks=False, peak_distance=30, peak_prominence=0.3):
-    # 更接近参考图的配色方案
-    normal_color = '#4a86e8'  # 正常范围的蓝色
-    warning_color = '#f39c12'  # 超标范围的黄色（更鲜明的橙色）
-    fill_color = '#e8f2fe'  # 浅蓝色填充
-    annotation_color = '#e74c3c'  # 鲜红色
-    peak_color = '#9c27b0'  # 紫色用于峰值标注
-    grid_color = '#e6e6e6'  # 浅灰色网格
+# 在参考线处拆分血糖曲线
+# 穿过参考线的线段在交点处（线性插值）拆分为多段，一次性向量化计算
+# 返回 (线段数组[N, 2, 2], 每段所属区间)，区间: -1 低于下限, 0 正常范围, 1 高于上限
+def split_segments_at_thresholds(x, y, normal_min=3.9, normal_max=7.8):
+    import numpy as np
     
-    fig, ax = plt.subplots(figsize=(14, 6))
-    fig.patch.set_facecolor('#FFFFFF')  
-    ax.set_facecolor('#F9FBFF')  # 更淡的背景色
-    
-    # 设置临界值
-    normal_max = 7.8
-    normal_min = 3.9
-    
-    # 处理数据，确保颜色分界清晰
-    # 对每个点根据血糖值决定颜色
-    for i in range(1, len(df)):
-        x1, y1 = df['时刻'].iloc[i-1], df['血糖值mmol/L'].iloc[i-1]
-        x2, y2 = df['时刻'].iloc[i], df['血糖值mmol/L'].iloc[i]
-        
-        # 检查线段是否穿过参考线(7.8)
-        if (y1 <= normal_max and y2 > normal_max) or (y1 > normal_max and y2 <= normal_max):
-            # 计算穿过参考线的时间点（线性插值）
-            t = (normal_max - y1) / (y2 - y1)
-            cross_time = x1 + t * (x2 - x1)
-            
-            # 绘制参考线以下部分（蓝色）
-            if y1 <= normal_max:
-                ax.plot([x1, cross_time], [y1, normal_max], color=normal_color, linewidth=2.0, solid_capstyle='round')
-                ax.plot([cross_time, x2], [normal_max, y2], color=warning_color, linewidth=2.5, solid_capstyle='round')
-            else:
-                ax.plot([x1, cross_time], [y1, normal_max], color=warning_color, linewidth=2.5, solid_capstyle='round')
-                ax.plot([cross_time, x2], [normal_max, y2], color=normal_color, linewidth=2.0, solid_capstyle='round')
-        else:
-            # 整个线段使用同一颜色
-            if y1 > normal_max or y2 > normal_max:
-                color = warning_color
-                linewidth = 2.5
-            else:
-                color = normal_color
-                linewidth = 2.0
-            
-            ax.plot([x1, x2], [y1, y2], color=color, linewidth=linewidth, solid_capstyle='round')
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) < 2:
+        return np.empty((0, 2, 2)), np.empty(0, dtype=int)
     
-    # 填充背景颜色 - 使用统一的填充色
-    ax.fill_between(df['时刻'], 0, df['血糖值mmol/L'], color=fill_color, alpha=0.65)
+    x1, y1 = x[:-1], y[:-1]
+    dx, dy = np.diff(x), np.diff(y)
     
-    # 设置坐标轴范围
-    date = pd.to_datetime(date_str).date()
-    ax.set_xlim([datetime.combine(date, datetime.min.time()), 
-                 datetime.combine(date + timedelta(days=1), datetime.min.time())])
+    # 检查线段是否穿过参考线，计算交点在线段上的位置t (0~1)
+    crosses_max = (y1 <= normal_max) != (y[1:] <= normal_max)
+    crosses_min = (y1 < normal_min) != (y[1:] < normal_min)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_max = np.where(crosses_max, (normal_max - y1) / dy, np.nan)
+        t_min = np.where(crosses_min, (normal_min - y1) / dy, np.nan)
     
-    # 设置坐标轴格式
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
-    ax.xaxis.set_major_locator(mdates.HourLocator(interval=6))
-    ax.xaxis.set_minor_locator(mdates.HourLocator())
+    # 每条线段最多被两条参考线拆成三段，NaN排序后位于末尾
+    breaks = np.column_stack([np.zeros_like(x1), t_min, t_max, np.ones_like(x1)])
+    breaks.sort(axis=1)
+    t_start, t_end = breaks[:, :-1], breaks[:, 1:]
+    valid = t_end > t_start  # 与NaN比较为False，同时去掉长度为0的线段
     
-    # 血糖值最大最小范围
-    min_glucose = max(0, min(3.5, df['血糖值mmol/L'].min() - 0.5))  # 确保显示完整参考区间
-    max_glucose = df['血糖值mmol/L'].max() + 3.5  # 增加一点顶部空间用于标注
-    ax.set_ylim([min_glucose, max_glucose])
+    t_start, t_end = t_start[valid], t_end[valid]
+    rows = np.nonzero(valid)[0]
+    xa, ya = x1[rows] + t_start * dx[rows], y1[rows] + t_start * dy[rows]
+    xb, yb = x1[rows] + t_end * dx[rows], y1[rows] + t_end * dy[rows]
+    segments = np.stack([np.column_stack([xa, ya]), np.column_stack([xb, yb])], axis=1)
+    
+    # 根据每段的中点判断所属区间
+    mid = (ya + yb) / 2
+    zones = np.where(mid > normal_max, 1, np.where(mid < normal_min, -1, 0))
+    return segments, zones
+
+# 绘制按参考线着色的血糖曲线，所有线段合并为一个LineCollection
+# x为matplotlib日期数值
+def draw_threshold_trace(ax, x, y):
+    import numpy as np
+    from matplotlib.collections import LineCollection
+    
+    segments, zones = split_segments_at_thresholds(x, y, NORMAL_MIN, NORMAL_MAX)
+    in_range = zones == 0
+    collection = LineCollection(
+        segments,
+        colors=np.where(in_range, NORMAL_COLOR, WARNING_COLOR),
+        linewidths=np.where(in_range, 2.0, 2.5),
+        capstyle='round'
+    )
+    ax.add_collection(collection)
+    return collection
+
+# 添加参考区间指示线和文本标注
+# 文本右对齐在x轴的23.75/24处（x轴为一整天时即23:45），x用轴坐标、y用数据坐标，更换坐标范围后无需重绘
+def draw_reference_lines(ax):
+    import matplotlib.transforms as mtransforms
     
     # 添加参考区间指示线 - 更明显的样式
-    ax.axhline(y=normal_min, color='#95a5a6', linestyle='--', linewidth=1.2, alpha=0.8)
-    ax.axhline(y=normal_max, color=warning_color, linestyle='--', linewidth=1.2, alpha=0.8)
+    ax.axhline(y=NORMAL_MIN, color='#95a5a6', linestyle='--', linewidth=1.2, alpha=0.8)
+    ax.axhline(y=NORMAL_MAX, color=WARNING_COLOR, linestyle='--', linewidth=1.2, alpha=0.8)
     
     # 添加参考区间文本标注 - 位置调整到右侧
-    ax.text(datetime.combine(date, datetime.strptime("23:45", "%H:%M").time()), 
-            normal_min - 0.2, f"{normal_min} mmol/L (下限)", 
+    blended = mtransforms.blended_transform_factory(ax.transAxes, ax.transData)
+    ax.text(23.75 / 24, NORMAL_MIN - 0.2, f"{NORMAL_MIN} mmol/L (下限)", transform=blended,
             fontsize=9, color='#555555', ha='right', va='top')
     
-    ax.text(datetime.combine(date, datetime.strptime("23:45", "%H:%M").time()), 
-            normal_max + 0.2, f"{normal_max} mmol/L (上限)", 
-            fontsize=9, color=warning_color, ha='right', va='bottom')
-    
-    # 添加图例
+    ax.text(23.75 / 24, NORMAL_MAX + 0.2, f"{NORMAL_MAX} mmol/L (上限)", transform=blended,
+            fontsize=9, color=WARNING_COLOR, ha='right', va='bottom')
+
+# 图例中正常/超标两项
+def legend_handles():
     from matplotlib.lines import Line2D
-    legend_elements = [
-        Line2D([0], [0], color=normal_color, lw=2, label='正常范围'),
-        Line2D([0], [0], color=warning_color, lw=2, label='超出正常范围')
+    return [
+        Line2D([0], [0], color=NORMAL_COLOR, lw=2, label='正常范围'),
+        Line2D([0], [0], color=WARNING_COLOR, lw=2, label='超出正常范围')
     ]
-    ax.legend(handles=legend_elements, loc='upper left', frameon=True, 
+
+# 添加图例，extra_handles会追加在正常/超标两项之后
+def draw_legend(ax, extra_handles=()):
+    ax.legend(handles=legend_handles() + list(extra_handles), loc='upper left', frameon=True, 
               facecolor='white', edgecolor='#DDDDDD', fontsize=9)
-    
-    # 美化轴和边框
+
+# 美化轴、边框、网格和刻度
+def style_axes(ax):
     for spine in ax.spines.values():
         spine.set_color('#DDDDDD')
         spine.set_linewidth(0.5)
     
-    # 测量数据点在图上的实际位置
-    trans = ax.transData
+    # 网格 - 更淡的虚线，参考图样式
+    ax.grid(True, color=GRID_COLOR, linestyle='--', linewidth=0.5, alpha=0.7)
     
-    # 获取每个时间点对应的血糖值
-    time_to_glucose = {}
-    for dt, text, y_offset in annotations:
-        if dt in df['时刻'].values:
-            idx = df[df['时刻'] == dt].index[0]
-            glucose_value = df.loc[idx, '血糖值mmol/L']
+    # 美化刻度
+    ax.tick_params(colors='#999999', labelsize=9)
+
+class GlucoseChartRenderer:
+    """
+    每日血糖曲线渲染器
+
+    坐标轴样式、参考线、图例、标签和布局只在创建时构建一次；每天只替换曲线、填充、坐标范围、标题和标注，
+    保存后移除这些动态元素，同一个渲染器可以连续渲染任意多天，内存不会增长
+    默认使用不经过pyplot的Figure和Agg画布；pyplot=True时由pyplot管理图表，以便 plt.show() 显示
+    """
+    
+    FIGSIZE = (14, 6)
+    
+    def __init__(self, pyplot=False):
+        import matplotlib.dates as mdates
+        
+        if pyplot:
+            self.fig = load_pyplot().figure(figsize=self.FIGSIZE)
         else:
-            nearest_idx = (df['时刻'] - dt).abs().idxmin()
-            glucose_value = df.loc[nearest_idx, '血糖值mmol/L']
-        time_to_glucose[dt] = glucose_value
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            load_pyplot()  # 设置中文字体
+            self.fig = Figure(figsize=self.FIGSIZE)
+            FigureCanvasAgg(self.fig)
+        
+        fig = self.fig
+        ax = self.ax = fig.add_subplot()
+        fig.patch.set_facecolor('#FFFFFF')  
+        ax.set_facecolor('#F9FBFF')  # 更淡的背景色
+        
+        # 设置坐标轴格式
+        ax.xaxis_date()
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+        ax.xaxis.set_major_locator(mdates.HourLocator(interval=6))
+        ax.xaxis.set_minor_locator(mdates.HourLocator())
+        
+        # 参考区间指示线和文本标注
+        draw_reference_lines(ax)
+        
+        # 图例和边框
+        draw_legend(ax)
+        style_axes(ax)
+        
+        # 标题和标签，标题文本每天替换
+        self.title = ax.set_title("每日血糖曲线(2000年01月01日)", fontsize=15, color="#333333", fontweight='bold')
+        ax.set_xlabel("")
+        ax.set_ylabel("mmol/L", color="#555555")
+        
+        # 布局只计算一次: 用两位数的y刻度计算边距，所有日期的坐标轴位置保持一致
+        ax.set_xlim([datetime(2000, 1, 1), datetime(2000, 1, 2)])
+        ax.set_ylim([0, 20])
+        with profiling.stage('tight_layout'):
+            fig.tight_layout()
+        
+        self.dynamic = []
+    
+    # 绘制一天的数据，替换上一次绘制的动态元素
+    # time_index: 可选的预先构建的TimeIndex（如整个导出文件的索引），用于注释定位，峰值也在它的全部数据上检测
+    # response_labels: 在每个注释后加上事件后2小时内的血糖升幅
+    def draw(self, df, annotations, date_str, show_peaks=False, peak_distance=30, peak_prominence=0.3,
+             time_index=None, response_labels=False):
+        import matplotlib.dates as mdates
+        from timeindex import TimeIndex
+        
+        times, values = glucose_arrays(df)
+        if time_index is None:
+            time_index = TimeIndex(times, values)
+        if response_labels:
+            from responses import label_responses
+            annotations = label_responses(annotations, time_index)
+        
+        self.clear()
+        ax = self.ax
+        
+        # 处理数据，确保颜色分界清晰
+        with profiling.stage('trace'):
+            self.dynamic.append(draw_threshold_trace(ax, mdates.date2num(times), values))
+        
+        # 填充背景颜色 - 使用统一的填充色
+        with profiling.stage('fill'):
+            self.dynamic.append(ax.fill_between(times, 0, values, color=FILL_COLOR, alpha=0.65))
+        
+        # 设置坐标轴范围
+        date = parse_date(date_str).date()
+        ax.set_xlim([datetime.combine(date, datetime.min.time()), 
+                     datetime.combine(date + timedelta(days=1), datetime.min.time())])
+        
+        # 血糖值最大最小范围
+        min_glucose = max(0, min(3.5, values.min() - 0.5))  # 确保显示完整参考区间
+        max_glucose = values.max() + 3.5  # 增加一点顶部空间用于标注
+        ax.set_ylim([min_glucose, max_glucose])
+        
+        with profiling.stage('labels'):
+            self._draw_annotations(date, annotations, show_peaks, peak_distance, peak_prominence, time_index)
+        
+        # 设置标题
+        self.title.set_text(f"每日血糖曲线({date.strftime('%Y年%m月%d日')})")
+        return self.fig
     
-    # 获取图表尺寸的大小，用于计算相对偏移
-    fig_width_px = fig.get_figwidth() * fig.dpi
-    fig_height_px = fig.get_figheight() * fig.dpi
+    # 移除上一次绘制的曲线、填充和标注
+    def clear(self):
+        for artist in self.dynamic:
+            artist.remove()
+        self.dynamic = []
     
-    # 只有当show_peaks为True时才添加峰值标注
-    if show_peaks:
-        # 找出局部峰值并添加到annotations列表
-        peaks = find_local_peaks(df, min_distance_minutes=peak_distance, prominence=peak_prominence)
-        peak_annotations = []
-        for peak_idx in peaks:
-            peak_time = df['时刻'].iloc[peak_idx]
-            peak_value = df['血糖值mmol/L'].iloc[peak_idx]
+    # 保存当前图表，output可以是文件路径或文件对象
+    def save(self, output, dpi=300, fmt=None):
+        with profiling.stage('savefig'):
+            self.fig.savefig(output, dpi=dpi, format=fmt, bbox_inches='tight')
+    
+    # 绘制、保存并清除一天的图表
+    def render(self, output, df, annotations, date_str, dpi=300, fmt=None, **options):
+        try:
+            with profiling.stage('plot'):
+                self.draw(df, annotations, date_str, **options)
+            self.save(output, dpi=dpi, fmt=fmt)
+        finally:
+            self.clear()
+    
+    def _draw_annotations(self, date, annotations, show_peaks, peak_distance, peak_prominence, time_index):
+        import matplotlib.dates as mdates
+        from layout import LabelPlacer, renderer_text_measurer
+        
+        fig, ax = self.fig, self.ax
+        
+        # 测量数据点在图上的实际位置
+        trans = ax.transData
+        inv_trans = ax.transData.inverted()
+        
+        labels = collect_labels(date, annotations, show_peaks, peak_distance, peak_prominence, time_index)
+        
+        # 标注布局: 使用渲染器测量文本尺寸，空间索引检测重叠，标注中心限制在图表范围内
+        placer = LabelPlacer(renderer_text_measurer(fig, fontsize=9), bounds=fig.bbox.extents)
+        to_display = lambda dt, value: trans.transform((mdates.date2num(dt), value))
+        
+        for dt, label, glucose_value, text_xy, is_peak in place_labels(labels, to_display, placer):
+            point = (mdates.date2num(dt), glucose_value)
             
-            # 只添加超过7.8 mmol/L的峰值
-            if peak_value > 7.8:
-                # 创建峰值标注文本
-                peak_text = f"血糖峰值 {peak_value:.1f} mmol/L"
-                # 使用向上的偏移以突出显示峰值
-                peak_annotations.append((peak_time, peak_text, 0.7))
-                # 添加到time_to_glucose字典
-                time_to_glucose[peak_time] = peak_value
-        
-        # 合并所有标注
-        all_annotations = annotations + peak_annotations
-    else:
-        all_annotations = annotations
+            # 转回数据坐标
+            text_point = inv_trans.transform(text_xy)
+        
+            # 计算箭头弯曲方向
+            if text_point[1] > glucose_value:
+                # 标注在血糖值上方 - 向左凹
+                arc_direction = 0.15  # 负值使箭头向左弯曲
+            else:
+                # 标注在血糖值下方 - 向右凹
+                arc_direction = 0.15   # 正值使箭头向右弯曲
+            
+            # 确定标注颜色 - 峰值标注使用不同颜色
+            current_annotation_color = PEAK_COLOR if is_peak else ANNOTATION_COLOR
+        
+            # 箭头样式 - 根据位置调整弯曲方向
+            arrow_props = dict(
+                arrowstyle='-|>',
+                shrinkA=0,  # 不减少起点
+                shrinkB=3,  # 减小终点压缩
+                color=current_annotation_color,  # 使用当前标注颜色
+                linewidth=1.2,  # 线宽
+                connectionstyle=f'arc3,rad={arc_direction}'  # 根据位置调整弯曲方向
+            )
+        
+            # 文本框样式 - 参考图样式（无边框）
+            bbox_props = dict(
+                boxstyle='round,pad=0.3',
+                fc='white',
+                ec='white',
+                alpha=0.95
+            )
+        
+            # 添加标注
+            self.dynamic.append(ax.annotate(
+                label,
+                xy=point,
+                xytext=text_point,
+                arrowprops=arrow_props,
+                ha='center',
+                va='center',
+                bbox=bbox_props,
+                color=current_annotation_color,  # 使用当前标注颜色
+                fontsize=9,
+                weight='normal'
+            ))
+
+# 一天需要显示的所有标注: 注释加上（show_peaks时）当天超过上限的峰值，按时间排序
+# 返回 [(datetime, 文本, y偏移量, 血糖值, 是否为峰值)]，血糖值为注释时刻最近的采样点或峰值本身
+def collect_labels(date, annotations, show_peaks, peak_distance, peak_prominence, time_index):
+    from peaks import peaks_between
     
-    # 按时间排序所有标注
-    all_annotations.sort(key=lambda x: x[0])
+    # 获取每个时间点对应的血糖值（最近的采样点），所有注释一次性查询
+    labels = []
+    if annotations:
+        _, glucose_values = time_index.nearest([dt for dt, _, _ in annotations])
+        labels = [(dt, text, y_offset, value, "血糖峰值" in text)
+                  for (dt, text, y_offset), value in zip(annotations, glucose_values)]
     
-    # 跟踪已经使用的区域
-    used_regions = []  # 存储 (x_min, x_max, y_min, y_max) 的元组
+    # 只有当show_peaks为True时才添加峰值标注
+    if show_peaks:
+        # 峰值在整个数据集上检测一次并缓存在时间索引上，这里只取出当天的部分
+        # 跨过午夜的峰值也按完整的曲线判断
+        with profiling.stage('peaks'):
+            day_start = datetime.combine(date, datetime.min.time())
+            peaks = peaks_between(time_index.peaks(peak_distance, peak_prominence),
+                                  day_start, day_start + timedelta(days=1))
+        peak_times = peaks['time'].astype('datetime64[us]').tolist()
+        for peak_time, peak_value in zip(peak_times, peaks['value']):
+            # 只添加超过7.8 mmol/L的峰值，使用向上的偏移以突出显示峰值
+            if peak_value > NORMAL_MAX:
+                labels.append((peak_time, f"血糖峰值 {peak_value:.1f} mmol/L", 0.7, peak_value, True))
     
+    # 按时间排序所有标注
+    labels.sort(key=lambda x: x[0])
+    return labels
+
+# 计算标注文本的位置
+# labels为collect_labels的结果; to_display(datetime, 血糖值)返回数据点的像素坐标(y轴向上);
+# placer为layout.LabelPlacer，像素坐标与to_display一致
+# scale: 偏移量（按每日图表的像素尺寸设计）的缩放比例，较小的图表（如拼图的格子）按图表高度之比缩小
+# 依次返回 (datetime, 标注文本, 血糖值, 文本中心像素坐标, 是否为峰值)，placer放不下该标注时文本坐标为None
+def place_labels(labels, to_display, placer, scale=1.0):
     # 用于存储每个时间段的标注计数
     hour_counts = {}
     
     # 处理所有标注
-    for dt, text, custom_offset in all_annotations:
-        glucose_value = time_to_glucose[dt]
-        
+    for dt, text, custom_offset, glucose_value, is_peak in labels:
         # 获取当前时间的小时
         hour = dt.hour
         if hour not in hour_counts:
             hour_counts[hour] = 0
-        
-        # 计算基础位置
-        point = (mdates.date2num(dt), glucose_value)
-        
+    
         # 决定标注方向（上/下），基于奇偶小时来保持视觉平衡
         # 但会被自定义偏移量覆盖
         if custom_offset > 0:
@@ -356,14 +696,14 @@ def plot_glucose_curve(df, annotations, date_str, show_peaks=False, peak_distanc
         else:
             # 无自定义偏移时，使用奇偶规则
             direction = 1 if hour % 2 == 0 else -1
-        
+    
         # 根据自定义偏移和时间点计算垂直偏移 - 增加基础偏移量
         base_offset = 1.5  # 增加基础偏移从1.0到1.5
-        
+    
         # 同一小时的标注数量增加，偏移量增加
         count_in_hour = hour_counts[hour]
         hour_counts[hour] += 1
-        
+    
         # 调整垂直偏移
         if custom_offset != 0:
             # 使用自定义偏移但确保最小距离
@@ -371,7 +711,7 @@ def plot_glucose_curve(df, annotations, date_str, show_peaks=False, peak_distanc
         else:
             # 根据同一小时的标注数量和方向计算偏移
             y_offset = direction * (base_offset + count_in_hour * 0.5)  # 增加梯度从0.25到0.5
-        
+    
         # 限制最大偏移
         max_offset = 10.0  # 增加最大偏移允许更多间距
         min_offset = 1.0 * direction  # 确保最小偏移
@@ -379,10 +719,10 @@ def plot_glucose_curve(df, annotations, date_str, show_peaks=False, peak_distanc
             y_offset = max(min(y_offset, max_offset), min_offset)
         else:
             y_offset = min(max(y_offset, -max_offset), min_offset)
-        
+    
         # 计算水平偏移（使用文本长度作为参考）
         text_length = len(text)
-        
+    
         # 基于文本长度的水平偏移，让长文本有更多偏移
         x_offset = 0
         if count_in_hour > 0:
@@ -391,126 +731,927 @@ def plot_glucose_curve(df, annotations, date_str, show_peaks=False, peak_distanc
                 x_offset = -0.05 * min(text_length, 15)  # 限制最大偏移
             else:
                 x_offset = 0.05 * min(text_length, 15)
+    
+        # 坐标转换，并通过空间索引寻找不与已有标注重叠的位置
+        display_point = to_display(dt, glucose_value)
+        label = f"{dt.strftime('%H:%M')} {text}"
+        text_xy = placer.place(display_point[0] + x_offset * 20 * scale,  # 水平像素偏移
+                               display_point[1] + y_offset * 40 * scale,  # 垂直像素偏移
+                               label)
+        yield dt, label, glucose_value, text_xy, is_peak
+
+# 每个进程复用同一个渲染器（批量模式和渲染服务的工作进程）
+_renderer = None
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        with profiling.stage('chrome'):
+            _renderer = GlucoseChartRenderer()
+    return _renderer
+
+# 绘制血糖曲线图，返回由pyplot管理的图表（可用 plt.show() 显示）
+# 需要连续渲染多天时直接使用 GlucoseChartRenderer
+def plot_glucose_curve(df, annotations, date_str, show_peaks=False, peak_distance=30, peak_prominence=0.3,
+                       time_index=None, response_labels=False):
+    with profiling.stage('chrome'):
+        renderer = GlucoseChartRenderer(pyplot=True)
+    with profiling.stage('plot'):
+        return renderer.draw(df, annotations, date_str, show_peaks=show_peaks, peak_distance=peak_distance,
+                             peak_prominence=peak_prominence, time_index=time_index,
+                             response_labels=response_labels)
+
+# 绘制动态血糖图谱(AGP): 多天数据折叠到24小时轴上，显示中位数和5/25/75/95百分位带
+def plot_agp(df, bin_minutes=15):
+    import numpy as np
+    import matplotlib.dates as mdates
+    from matplotlib.patches import Patch
+    import metrics
+    plt = load_pyplot()
+    
+    minutes, (p5, p25, p50, p75, p95), n_days = metrics.agp_percentiles(df, bin_minutes=bin_minutes)
+    
+    # 使用第一天作为24小时轴的参考日期，每个时间段的值画在时间段中点，首尾补齐到00:00和24:00
+    first_day = df['时刻'].min().date()
+    base = datetime.combine(first_day, datetime.min.time())
+    x = mdates.date2num(base) + (minutes + bin_minutes / 2) / (24 * 60)
+    x = np.concatenate([[mdates.date2num(base)], x, [mdates.date2num(base) + 1]])
+    p5, p25, p50, p75, p95 = [np.concatenate([[p[0]], p, [p[-1]]]) for p in (p5, p25, p50, p75, p95)]
+    
+    fig, ax = plt.subplots(figsize=(14, 6))
+    fig.patch.set_facecolor('#FFFFFF')
+    ax.set_facecolor('#F9FBFF')
+    
+    # 百分位带
+    ax.fill_between(x, p5, p95, color=FILL_COLOR, alpha=0.9, linewidth=0)
+    ax.fill_between(x, p25, p75, color=NORMAL_COLOR, alpha=0.25, linewidth=0)
+    ax.plot(x, p5, color=NORMAL_COLOR, linewidth=0.8, linestyle=':', alpha=0.8)
+    ax.plot(x, p95, color=NORMAL_COLOR, linewidth=0.8, linestyle=':', alpha=0.8)
+    
+    # 中位数使用与每日曲线相同的参考线着色
+    draw_threshold_trace(ax, x, p50)
+    
+    ax.set_xlim([mdates.date2num(base), mdates.date2num(base) + 1])
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    ax.xaxis.set_major_locator(mdates.HourLocator(interval=3))
+    ax.xaxis.set_minor_locator(mdates.HourLocator())
+    
+    min_glucose = max(0, min(3.5, np.nanmin(p5) - 0.5))
+    max_glucose = np.nanmax(p95) + 1.5
+    ax.set_ylim([min_glucose, max_glucose])
+    
+    draw_reference_lines(ax)
+    draw_legend(ax, [
+        Patch(facecolor=NORMAL_COLOR, alpha=0.25, label='25%-75%'),
+        Patch(facecolor=FILL_COLOR, alpha=0.9, label='5%-95%'),
+    ])
+    style_axes(ax)
+    
+    start = df['时刻'].min().strftime("%Y年%m月%d日")
+    end = df['时刻'].max().strftime("%Y年%m月%d日")
+    ax.set_title(f"动态血糖图谱AGP({start} - {end}, {n_days}天)", fontsize=15, color="#333333", fontweight='bold')
+    ax.set_ylabel("mmol/L", color="#555555")
+    fig.tight_layout()
+    
+    return fig
+
+# 绘制连续多天的血糖时间线，样式与每日曲线一致
+# 曲线按绘图区域的像素宽度降采样（每列像素保留首尾和最大最小值），参考线穿越点和峰值始终保留，
+# 几万个1分钟采样点与原始数据绘制效果相同，但渲染更快、SVG更小
+# dpi需与保存时一致，用于计算像素宽度
+def plot_timeline(df, dpi=300, width=14, show_peaks=False, peak_distance=30, peak_prominence=0.3):
+    import numpy as np
+    import matplotlib.dates as mdates
+    from matplotlib.lines import Line2D
+    from timeline import downsample_timeline
+    plt = load_pyplot()
+    
+    times = df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    values = df['血糖值mmol/L'].to_numpy(dtype=float)
+    
+    fig, ax = plt.subplots(figsize=(width, 6))
+    fig.patch.set_facecolor('#FFFFFF')
+    ax.set_facecolor('#F9FBFF')
+    
+    # 先确定坐标范围和布局，再按绘图区域的实际像素宽度降采样
+    start = df['时刻'].min()
+    end = df['时刻'].max()
+    ax.set_xlim([datetime.combine(start.date(), datetime.min.time()),
+                 datetime.combine(end.date() + timedelta(days=1), datetime.min.time())])
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    
+    min_glucose = max(0, min(3.5, values.min() - 0.5))
+    max_glucose = values.max() + 1.5
+    ax.set_ylim([min_glucose, max_glucose])
+    
+    peaks = np.empty(0, dtype=np.int64)
+    extra_handles = []
+    if show_peaks:
+        peaks = find_local_peaks(df, min_distance_minutes=peak_distance, prominence=peak_prominence)
+        peaks = peaks[values[peaks] > NORMAL_MAX]
+        extra_handles.append(Line2D([0], [0], color=PEAK_COLOR, marker='o', linestyle='', markersize=5,
+                                    label='血糖峰值'))
+    
+    draw_reference_lines(ax)
+    draw_legend(ax, extra_handles)
+    style_axes(ax)
+    
+    n_days = len(np.unique(times // (24 * 3600 * 10**9)))
+    ax.set_title(f"血糖时间线({start.strftime('%Y年%m月%d日')} - {end.strftime('%Y年%m月%d日')}, {n_days}天)",
+                 fontsize=15, color="#333333", fontweight='bold')
+    ax.set_ylabel("mmol/L", color="#555555")
+    fig.tight_layout()
+    
+    width_px = ax.get_position().width * fig.get_figwidth() * dpi
+    x_ns, y = downsample_timeline(times, values, width_px, peaks=peaks,
+                                  normal_min=NORMAL_MIN, normal_max=NORMAL_MAX)
+    x = mdates.date2num(x_ns.astype('datetime64[ns]'))
+    
+    draw_threshold_trace(ax, x, y)
+    ax.fill_between(x, 0, y, color=FILL_COLOR, alpha=0.65, linewidth=0)
+    if len(peaks):
+        ax.plot(mdates.date2num(times[peaks].astype('datetime64[ns]')), values[peaks], 'o',
+                color=PEAK_COLOR, markersize=4)
+    
+    return fig
+
+# 拼图的格子位置: columns为7时按星期排列（每行一周，从星期一开始），否则按顺序排列
+# 返回 (行数, [(行, 列)])，与dates一一对应
+def mosaic_grid(dates, columns=7):
+    offset = dates[0].weekday() if columns == 7 and dates else 0
+    cells = [divmod(offset + i, columns) for i in range(len(dates))]
+    rows = (offset + len(dates) + columns - 1) // columns
+    return rows, cells
+
+# 绘制多天的小图拼图: 每天一个子图，所有子图共享坐标范围、刻度、参考线样式和一个图例，整张图只保存（栅格化）一次
+# x轴为一天中的小时(0-24)，所有日期共用同一组刻度；曲线按子图像素宽度降采样（与时间线相同），每天按参考线着色的线段
+# 合并为一个LineCollection，峰值和注释标记各合并为一个散点集合
+# dates为要显示的日期（没有数据的日期显示为空格子）；annotations为 {date: [(datetime, 文本, y偏移量)]}
+# labels为False时注释只画为标记，为True时写出注释文字（与每日图表相同的布局规则，字号和偏移量较小），
+# 在格子内放不下的注释仍画为标记
+# 布局用固定边距计算一次，不调用tight_layout，保存时也不需要 bbox_inches='tight'
+def plot_mosaic(df, dates, annotations=None, columns=7, dpi=300, show_peaks=False, peak_distance=30,
+                peak_prominence=0.3, labels=False):
+    import numpy as np
+    from matplotlib.lines import Line2D
+    from matplotlib.ticker import FuncFormatter, MultipleLocator
+    from layout import LabelPlacer, renderer_text_measurer
+    from peaks import peaks_between
+    from timeindex import TimeIndex
+    from timeline import downsample_timeline
+    plt = load_pyplot()
+    
+    annotations = annotations or {}
+    days = group_by_day(df)
+    time_index = TimeIndex.from_frame(df)
+    weekdays = '一二三四五六日'
+    
+    # 固定尺寸的格子，边距以英寸计
+    cell_width, cell_height = 2.6, 1.7
+    rows, cells = mosaic_grid(dates, columns)
+    fig_width = columns * cell_width + 0.8
+    fig_height = rows * cell_height + 1.1
+    fig, axes = plt.subplots(rows, columns, sharex=True, sharey=True, squeeze=False,
+                             figsize=(fig_width, fig_height))
+    fig.patch.set_facecolor('#FFFFFF')
+    fig.subplots_adjust(left=0.6 / fig_width, right=1 - 0.2 / fig_width,
+                        bottom=0.45 / fig_height, top=1 - 0.85 / fig_height, wspace=0.06, hspace=0.3)
+    
+    # 共享的坐标范围和刻度只设置一次
+    values = time_index.values
+    first = axes[0][0]
+    first.set_xlim(0, 24)
+    first.set_ylim(max(0, min(3.5, values.min() - 0.5)), values.max() + 1.0)
+    first.xaxis.set_major_locator(MultipleLocator(6))
+    # 24:00与右侧子图的00:00重合，不标出
+    first.xaxis.set_major_formatter(FuncFormatter(lambda hour, _: f"{int(hour):02d}:00" if hour < 24 else ""))
+    first.yaxis.set_major_locator(MultipleLocator(4 if values.max() > 14 else 2))
+    
+    peaks = None
+    if show_peaks:
+        peaks = time_index.peaks(peak_distance, peak_prominence)
+    
+    # 注释和峰值标记的样式（按是否为峰值），marked记录写出文字时改画为标记的种类
+    markers = {False: dict(s=14, marker='v', color=ANNOTATION_COLOR),
+               True: dict(s=12, marker='o', color=PEAK_COLOR)}
+    marked = set()
+    
+    used = set(cells)
+    for row in range(rows):
+        for column in range(columns):
+            if (row, column) not in used:
+                axes[row][column].set_visible(False)
+    # 每列最下面、每行最左边的可见子图显示刻度（前后的空格子被隐藏）
+    bottoms, lefts = {}, {}
+    for row, column in cells:
+        bottoms[column] = max(row, bottoms.get(column, row))
+        lefts[row] = min(column, lefts.get(row, column))
+    for column, row in bottoms.items():
+        axes[row][column].xaxis.set_tick_params(labelbottom=True)
+    for row, column in lefts.items():
+        axes[row][column].yaxis.set_tick_params(labelleft=True)
+    
+    for date, (row, column) in zip(dates, cells):
+        ax = axes[row][column]
+        ax.set_facecolor('#F9FBFF')
+        style_axes(ax)
+        ax.tick_params(labelsize=7)
+        ax.axhline(y=NORMAL_MIN, color='#95a5a6', linestyle='--', linewidth=0.8, alpha=0.8)
+        ax.axhline(y=NORMAL_MAX, color=WARNING_COLOR, linestyle='--', linewidth=0.8, alpha=0.8)
+        header = ax.text(0.03, 0.95, f"{date.strftime('%m-%d')} 周{weekdays[date.weekday()]}",
+                         transform=ax.transAxes, fontsize=8, color='#333333', ha='left', va='top')
+        if date not in days:
+            ax.text(0.5, 0.5, "无数据", transform=ax.transAxes, fontsize=8, color='#999999',
+                    ha='center', va='center')
+            continue
         
-        # 计算文本长度的估计宽度（像素）
-        # 中文字符通常比英文宽，约为英文的1.7倍
-        chinese_chars = sum(1 for c in text if ord(c) > 256)
-        english_chars = len(text) - chinese_chars
-        text_width_px = (chinese_chars * 10 + english_chars * 6) * 0.9  # 估计像素宽度
-        
-        # 坐标转换与检测重叠
-        display_point = trans.transform(point)
-        
-        # 初始文本位置 - 增加垂直偏移倍数
-        text_x = display_point[0] + x_offset * 20  # 水平像素偏移
-        text_y = display_point[1] + y_offset * 40  # 增加垂直偏移像素从30到40
-        
-        # 计算文本框的估计高度（像素）
-        text_height_px = 20  # 估计高度
-        
-        # 定义文本框的边界
-        x_min = text_x - text_width_px/2 - 5  # 左边界（额外留5像素边距）
-        x_max = text_x + text_width_px/2 + 5  # 右边界
-        y_min = text_y - text_height_px/2 - 5  # 下边界
-        y_max = text_y + text_height_px/2 + 5  # 上边界
-        
-        # 检查并调整，避免与已有标注重叠
-        max_attempts = 8  # 最大尝试次数
-        attempt = 0
-        original_y = text_y  # 保存原始垂直位置
-        
-        # 定义检查重叠的函数
-        def has_overlap(region1, regions):
-            x1_min, x1_max, y1_min, y1_max = region1
-            for x2_min, x2_max, y2_min, y2_max in regions:
-                # 检查两个矩形是否重叠
-                if (x1_min < x2_max and x1_max > x2_min and
-                    y1_min < y2_max and y1_max > y2_min):
-                    return True
-            return False
-        
-        new_region = (x_min, x_max, y_min, y_max)
-        while attempt < max_attempts and has_overlap(new_region, used_regions):
-            attempt += 1
-            
-            # 尝试垂直移动
-            offset_sign = 1 if attempt % 2 == 0 else -1  # 上下交替尝试
-            offset_magnitude = (attempt // 2 + 1) * 15  # 每次增加偏移量
-            
-            # 应用新的垂直偏移
-            text_y = original_y + offset_sign * offset_magnitude
-            
-            # 更新区域边界
-            y_min = text_y - text_height_px/2 - 5
-            y_max = text_y + text_height_px/2 + 5
-            new_region = (x_min, x_max, y_min, y_max)
+        day_start = datetime.combine(date, datetime.min.time())
+        start_ns = np.datetime64(day_start, 'ns').astype(np.int64)
+        times, day_values = glucose_arrays(days[date])
+        times = times.view(np.int64)
         
-        # 添加到已使用区域
-        used_regions.append(new_region)
+        # 曲线: 按子图的像素宽度降采样，参考线穿越点始终保留
+        width_px = ax.get_position().width * fig_width * dpi
+        x_ns, y = downsample_timeline(times, day_values, width_px, normal_min=NORMAL_MIN, normal_max=NORMAL_MAX)
+        x = (x_ns - start_ns) / 3.6e12
+        trace = draw_threshold_trace(ax, x, y)
+        trace.set_linewidths(np.asarray(trace.get_linewidths()) * 0.5)
+        ax.fill_between(x, 0, y, color=FILL_COLOR, alpha=0.65, linewidth=0)
         
-        # 转回数据坐标
-        inv_trans = ax.transData.inverted()
-        text_point = inv_trans.transform((text_x, text_y))
+        day_annotations = annotations.get(date, [])
+        if labels:
+            # 注释文字: 与每日图表相同的标注规则，偏移量按格子与每日图表的高度之比缩小；
+            # 文本框必须完整地在格子内，放不下的标注改为标记
+            day_labels = collect_labels(date, day_annotations, show_peaks, peak_distance, peak_prominence,
+                                        time_index)
+            scale = ax.bbox.height / (GlucoseChartRenderer.FIGSIZE[1] * fig.dpi)
+            placer = LabelPlacer(renderer_text_measurer(fig, fontsize=6, pad=0.2), bounds=ax.bbox.extents,
+                                 step=max(15 * scale, 3), contain=True)
+            placer.reserve(*header.get_window_extent(fig.canvas.get_renderer()).extents)
+            hours = lambda dt: (dt - day_start).total_seconds() / 3600
+            to_display = lambda dt, value: ax.transData.transform((hours(dt), value))
+            inverse = ax.transData.inverted()
+            collapsed = {False: [], True: []}
+            for dt, label, value, text_xy, is_peak in place_labels(day_labels, to_display, placer, scale):
+                if text_xy is None:
+                    collapsed[is_peak].append((hours(dt), value))
+                    continue
+                color = PEAK_COLOR if is_peak else ANNOTATION_COLOR
+                ax.annotate(label, xy=(hours(dt), value), xytext=inverse.transform(text_xy),
+                            ha='center', va='center', fontsize=6, color=color,
+                            bbox=dict(boxstyle='round,pad=0.2', fc='white', ec='white', alpha=0.9),
+                            arrowprops=dict(arrowstyle='-', color=color, linewidth=0.6, shrinkA=0, shrinkB=1))
+            for is_peak, points in collapsed.items():
+                if points:
+                    x, y = zip(*points)
+                    ax.scatter(x, y, zorder=3, linewidths=0, **markers[is_peak])
+                    marked.add(is_peak)
+            continue
         
-        # 计算箭头弯曲方向
-        if text_point[1] > glucose_value:
-            # 标注在血糖值上方 - 向左凹
-            arc_direction = 0.15  # 负值使箭头向左弯曲
-        else:
-            # 标注在血糖值下方 - 向右凹
-            arc_direction = 0.15   # 正值使箭头向右弯曲
-            
-        # 确定标注颜色 - 峰值标注使用不同颜色
-        current_annotation_color = peak_color if "血糖峰值" in text else annotation_color
-        
-        # 箭头样式 - 根据位置调整弯曲方向
-        arrow_props = dict(
-            arrowstyle='-|>',
-            shrinkA=0,  # 不减少起点
-            shrinkB=3,  # 减小终点压缩
-            color=current_annotation_color,  # 使用当前标注颜色
-            linewidth=1.2,  # 线宽
-            connectionstyle=f'arc3,rad={arc_direction}'  # 根据位置调整弯曲方向
-        )
-        
-        # 文本框样式 - 参考图样式（无边框）
-        bbox_props = dict(
-            boxstyle='round,pad=0.3',
-            fc='white',
-            ec='white',
-            alpha=0.95
-        )
-        
-        # 添加标注
-        ax.annotate(
-            f"{dt.strftime('%H:%M')} {text}",
-            xy=point,
-            xytext=text_point,
-            arrowprops=arrow_props,
-            ha='center',
-            va='center',
-            bbox=bbox_props,
-            color=current_annotation_color,  # 使用当前标注颜色
-            fontsize=9,
-            weight='normal'
-        )
-    
-    # 设置标题和标签
+        # 注释和峰值只画为标记，每种一个散点集合
+        if day_annotations:
+            event_times = [dt for dt, _, _ in day_annotations]
+            _, event_values = time_index.nearest(event_times)
+            event_x = (np.asarray(event_times, dtype='datetime64[ns]').view(np.int64) - start_ns) / 3.6e12
+            ax.scatter(event_x, event_values, zorder=3, linewidths=0, **markers[False])
+        if peaks is not None:
+            day_peaks = peaks_between(peaks, day_start, day_start + timedelta(days=1))
+            day_peaks = day_peaks[day_peaks['value'] > NORMAL_MAX]
+            if len(day_peaks):
+                peak_x = (day_peaks['time'].view(np.int64) - start_ns) / 3.6e12
+                ax.scatter(peak_x, day_peaks['value'], zorder=3, linewidths=0, **markers[True])
+    
+    # 一个图例和标题
+    extra_handles = []
+    if annotations and (not labels or False in marked):
+        extra_handles.append(Line2D([0], [0], color=ANNOTATION_COLOR, marker='v', linestyle='', markersize=5,
+                                    label='注释'))
+    if show_peaks and (not labels or True in marked):
+        extra_handles.append(Line2D([0], [0], color=PEAK_COLOR, marker='o', linestyle='', markersize=5,
+                                    label='血糖峰值'))
+    fig.legend(handles=legend_handles() + extra_handles, loc='upper right', ncol=4, frameon=False, fontsize=9,
+               bbox_to_anchor=(1 - 0.2 / fig_width, 1 - 0.3 / fig_height))
+    fig.suptitle(f"血糖拼图({dates[0].strftime('%Y年%m月%d日')} - {dates[-1].strftime('%Y年%m月%d日')}, "
+                 f"{len(dates)}天)", x=0.6 / fig_width, y=1 - 0.2 / fig_height, ha='left', va='top',
+                 fontsize=15, color="#333333", fontweight='bold')
+    fig.supylabel("mmol/L", x=0.1 / fig_width, fontsize=9, color="#555555")
+    return fig
+
+# 默认输出文件名: 血糖曲线_YYYY年MM月DD日.png
+def default_output_name(date):
     formatted_date = date.strftime("%Y年%m月%d日")
-    plt.title(f"每日血糖曲线({formatted_date})", fontsize=15, color="#333333", fontweight='bold')
-    plt.xlabel("")
-    plt.ylabel("mmol/L", color="#555555")
+    return f'血糖曲线_{formatted_date}.png'
+
+# 查找某天对应的注释文件 annotations-YYYYMMDD.csv，不存在时使用fallback
+def find_annotations_file(annotations_dir, date, fallback=None):
+    annotation_file = os.path.join(annotations_dir, f"annotations-{date.strftime('%Y%m%d')}.csv")
+    if os.path.exists(annotation_file):
+        return annotation_file
+    return fallback
+
+# 渲染并保存单日图表，批量模式下在工作进程中执行
+# profile不为None时为Profiler的参数，在当前进程中单独记录这一天各阶段的耗时
+# annotations为 (datetime, 文本, y偏移量) 列表，由主进程从注释索引中取出
+# 返回 (日期, 输出路径, 错误信息, 性能记录)，成功时错误信息为None，未启用性能分析时性能记录为None
+def render_day(df, date_str, annotations, output_path,
+               show_peaks=False, peak_distance=30, peak_prominence=0.3, time_index=None, dpi=300,
+               response_labels=False, profile=None):
+    previous = profiling.active()
+    profiler = profiling.Profiler(**profile) if profile is not None else None
+    if profiler is not None:
+        profiling.enable(profiler)
+    try:
+        with profiling.scope(date_str):
+            get_renderer().render(output_path, df, annotations, date_str, dpi=dpi,
+                                  show_peaks=show_peaks,
+                                  peak_distance=peak_distance,
+                                  peak_prominence=peak_prominence,
+                                  time_index=time_index,
+                                  response_labels=response_labels)
+        error = None
+    except Exception as e:
+        error = str(e)
+    finally:
+        if profiler is not None:
+            profiling.enable(previous)
+    records = profiler.scope_records(date_str) if profiler is not None else None
+    return date_str, output_path, error, records
+
+# 渲染单日图表并返回图像字节，供渲染服务的工作进程调用
+# annotations为 (datetime, 文本, y偏移量) 列表
+def render_image(df, annotations, date_str, fmt='png', dpi=100,
+                 show_peaks=False, peak_distance=30, peak_prominence=0.3, time_index=None,
+                 response_labels=False):
+    import io
     
-    # 网格 - 更淡的虚线，参考图样式
-    plt.grid(True, color=grid_color, linestyle='--', linewidth=0.5, alpha=0.7)
+    buffer = io.BytesIO()
+    get_renderer().render(buffer, df, annotations, date_str, dpi=dpi, fmt=fmt,
+                          show_peaks=show_peaks,
+                          peak_distance=peak_distance,
+                          peak_prominence=peak_prominence,
+                          time_index=time_index,
+                          response_labels=response_labels)
+    return buffer.getvalue()
+
+# 列出数据中的所有日期及每天的数据条数
+# 只需要numpy: 优先从列式缓存读取，缓存无效时流式解析xlsx并重建缓存
+def run_list_dates(args):
+    import numpy as np
+    import cgm_cache
     
-    # 美化刻度
-    ax.tick_params(colors='#999999', labelsize=9)
+    # 导出目录: 按分组分别列出
+    if args.data_dir:
+        for name, series in load_groups(args).items():
+            print(f"[{name}]")
+            print_dates(series.times_ns())
+        return
     
-    # 自动调整布局
-    plt.tight_layout()
+    if not os.path.exists(args.file):
+        print(f"错误: 找不到文件 '{args.file}'")
+        sys.exit(1)
     
-    return fig
+    arrays = None
+    if not args.no_cache and not args.rebuild_cache:
+        arrays = cgm_cache.load_cache_arrays(args.file)
+    if arrays is None:
+        if os.path.splitext(args.file)[1].lower() in ('.xlsx', '.xlsm'):
+            from xlsx_reader import read_glucose_columns
+            arrays = read_glucose_columns(args.file)
+            if not args.no_cache:
+                cgm_cache.save_cache_arrays(args.file, *arrays)
+        else:
+            df = read_glucose_export(args.file, use_cache=not args.no_cache,
+                                     rebuild_cache=args.rebuild_cache)
+            arrays = (df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64), None)
+    
+    print_dates(arrays[0])
+
+# 输出int64纳秒时间数组中的每个日期及其数据条数
+def print_dates(times):
+    import numpy as np
+    
+    days, counts = np.unique(times // (86400 * 10**9), return_counts=True)
+    for day, count in zip(days, counts):
+        date = datetime(1970, 1, 1) + timedelta(days=int(day))
+        print(f"{date.strftime('%Y/%m/%d')}  {count} 条数据")
+
+# 读取 --start/--end 范围内的数据，未指定时返回全部数据
+def load_glucose_range(args):
+    df = load_export(args)
+    
+    # 只在指定了范围时筛选
+    if args.start:
+        df = df[df['时刻'] >= datetime.combine(parse_date(args.start).date(), datetime.min.time())]
+    if args.end:
+        df = df[df['时刻'] < datetime.combine(parse_date(args.end).date() + timedelta(days=1), datetime.min.time())]
+    if df.empty:
+        print("错误: 指定范围内没有数据")
+        sys.exit(1)
+    
+    return df
+
+# 指标模式: 计算每天及整个范围的TIR/TAR/TBR、均值、SD、CV、GMI和MAGE
+def run_metrics(args):
+    import metrics
+    
+    df = load_glucose_range(args)
+    
+    result = metrics.compute_metrics(df, normal_min=NORMAL_MIN, normal_max=NORMAL_MAX)
+    metrics.write_metrics(result, fmt=args.metrics_format, output=args.metrics_output)
+
+# 血糖反应模式: 对 --start/--end 范围内（默认全部数据）的每个注释事件计算基线、峰值升幅、达峰时间、
+# 2小时增量曲线下面积和回到基线的时间，输出为一张表
+def run_responses(args):
+    import responses
+    from timeindex import TimeIndex
+    
+    df = load_glucose_range(args)
+    time_index = TimeIndex.from_frame(df)
+    
+    # 注释来自注释目录中的所有注释文件和 -a 指定的文件
+    store = AnnotationStore(args.annotations_dir, args.annotations)
+    days = sorted(set(df['时刻'].dt.date))
+    annotations = [annotation for day in days for annotation in store.annotations(day)]
+    if not annotations:
+        print("错误: 指定范围内没有注释")
+        sys.exit(1)
+    
+    table = responses.response_table(time_index, annotations)
+    responses.write_responses(table, output=args.responses_output)
+
+# AGP模式: 将 --start/--end 范围内（默认全部数据）的多天数据绘制为一张AGP图
+def run_agp(args):
+    df = load_glucose_range(args)
+    
+    plt = load_pyplot()
+    fig = plot_agp(df, bin_minutes=args.agp_bin)
+    
+    os.makedirs(args.image_dir, exist_ok=True)
+    if args.output:
+        output_file = args.output
+    else:
+        start = df['时刻'].min().strftime("%Y年%m月%d日")
+        end = df['时刻'].max().strftime("%Y年%m月%d日")
+        output_file = f'AGP_{start}-{end}.png'
+    output_path = os.path.join(args.image_dir, output_file)
+    
+    fig.savefig(output_path, dpi=args.dpi, bbox_inches='tight')
+    print(f"图表已保存为: {output_path}")
+    
+    if args.show:
+        plt.show()
+    plt.close(fig)
+
+# 时间线模式: 绘制 --start/--end 范围内（默认全部数据）的连续血糖曲线
+def run_timeline(args):
+    df = load_glucose_range(args)
+    
+    plt = load_pyplot()
+    fig = plot_timeline(df, dpi=args.dpi, width=args.timeline_width, show_peaks=args.peaks,
+                        peak_distance=args.peak_distance, peak_prominence=args.peak_prominence)
+    
+    os.makedirs(args.image_dir, exist_ok=True)
+    if args.output:
+        output_file = args.output
+    else:
+        start = df['时刻'].min().strftime("%Y年%m月%d日")
+        end = df['时刻'].max().strftime("%Y年%m月%d日")
+        output_file = f'时间线_{start}-{end}.png'
+    output_path = os.path.join(args.image_dir, output_file)
+    
+    fig.savefig(output_path, dpi=args.dpi, bbox_inches='tight')
+    print(f"图表已保存为: {output_path}")
+    
+    if args.show:
+        plt.show()
+    plt.close(fig)
+
+# 批量模式的日期范围: --all-dates 为数据中的所有日期，否则为 --start 到 --end（默认数据的第一天和最后一天）的每一天
+# days为按天分组的数据 {date: ...}
+def batch_dates(args, days):
+    if args.all_dates:
+        return sorted(days)
+    start = parse_date(args.start).date() if args.start else min(days)
+    end = parse_date(args.end).date() if args.end else max(days)
+    if start > end:
+        print(f"错误: 开始日期 {start} 晚于结束日期 {end}")
+        sys.exit(1)
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+# 拼图模式: --start/--end 范围内（默认全部数据）每天一个小图，排列在一张图中
+def run_mosaic(args):
+    df = load_export(args)
+    days = group_by_day(df)
+    if not days:
+        print(f"错误: '{args.data_dir or args.file}' 中没有数据")
+        sys.exit(1)
+    dates = batch_dates(args, days)
+    
+    # 注释来自注释目录中的所有注释文件和 -a 指定的文件
+    annotation_store = AnnotationStore(args.annotations_dir, args.annotations)
+    annotations = {date: annotation_store.annotations(date) for date in dates}
+    if args.response_labels:
+        from responses import label_responses
+        from timeindex import TimeIndex
+        time_index = TimeIndex.from_frame(df)
+        annotations = {date: label_responses(items, time_index) for date, items in annotations.items()}
+    
+    plt = load_pyplot()
+    with profiling.stage('plot'):
+        fig = plot_mosaic(df, dates, annotations, columns=args.mosaic_columns, dpi=args.dpi,
+                          show_peaks=args.peaks, peak_distance=args.peak_distance,
+                          peak_prominence=args.peak_prominence, labels=args.mosaic_labels)
+    
+    os.makedirs(args.image_dir, exist_ok=True)
+    if args.output:
+        output_file = args.output
+    else:
+        output_file = f"拼图_{dates[0].strftime('%Y年%m月%d日')}-{dates[-1].strftime('%Y年%m月%d日')}.png"
+    output_path = os.path.join(args.image_dir, output_file)
+    
+    with profiling.stage('savefig'):
+        fig.savefig(output_path, dpi=args.dpi)
+    print(f"图表已保存为: {output_path}")
+    
+    if args.show:
+        plt.show()
+    plt.close(fig)
+
+# HTML模式: 把单日（-d）或批量范围内每天的曲线、参考线交点、峰值和排好位置的标注写为紧凑JSON，
+# 连同一个canvas绘图脚本嵌入一个离线HTML文件；不导入matplotlib，也不生成位图
+def run_html(args):
+    import html_export
+    from timeindex import TimeIndex
+    
+    df = load_export(args)
+    days = group_by_day(df)
+    if not days:
+        print(f"错误: '{args.data_dir or args.file}' 中没有数据")
+        sys.exit(1)
+    if args.start or args.end or args.all_dates:
+        dates = batch_dates(args, days)
+    else:
+        dates = [parse_date(args.date).date()]
+    
+    time_index = TimeIndex.from_frame(df)
+    annotation_store = AnnotationStore(args.annotations_dir, args.annotations)
+    scale = html_export.value_scale(time_index.values)
+    
+    payloads = []
+    rendered = []
+    for date in dates:
+        date_str = date.strftime("%Y/%m/%d")
+        if date not in days:
+            print(f"跳过 {date_str}: 没有数据")
+            continue
+        rendered.append(date)
+        annotations = annotation_store.annotations(date) or create_annotations(date_str)
+        if args.response_labels:
+            from responses import label_responses
+            annotations = label_responses(annotations, time_index)
+        times, values = glucose_arrays(days[date])
+        with profiling.stage('html_payload'):
+            payloads.append(html_export.day_payload(date, times, values, annotations, time_index, scale,
+                                                    show_peaks=args.peaks,
+                                                    peak_distance=args.peak_distance,
+                                                    peak_prominence=args.peak_prominence))
+    if not payloads:
+        print("错误: 指定范围内没有数据")
+        sys.exit(1)
+    
+    span = rendered[0].strftime('%Y年%m月%d日')
+    if len(rendered) > 1:
+        span += f"-{rendered[-1].strftime('%Y年%m月%d日')}"
+    output_file = args.output or f'血糖曲线_{span}.html'
+    os.makedirs(args.image_dir, exist_ok=True)
+    output_path = os.path.join(args.image_dir, output_file)
+    
+    title = f"每日血糖曲线 {span}"
+    with profiling.stage('write_html'):
+        html_export.write_html(output_path, title, payloads, scale)
+    print(f"已生成 {len(payloads)} 天的HTML图表: {output_path} ({os.path.getsize(output_path) / 1024:.1f} KB)")
+
+# 渲染清单中记录的渲染选项（批量模式和监视模式一致，两者生成的图表可以互相跳过）
+def render_options(args):
+    return {
+        'peaks': args.peaks,
+        'peak_distance': args.peak_distance,
+        'peak_prominence': args.peak_prominence,
+        'dpi': args.dpi,
+        'response_labels': args.response_labels,
+    }
+
+# 渲染某一天时使用的时间索引: 整个数据集（TimeIndex或GlucoseSeries）在当天前后DAY_CONTEXT范围内的部分，已检测的峰值一并截取
+# 交给工作进程的只有这一小段数据（一年的1分钟数据约为1/100），而不是整个数据集的索引
+def day_context(time_index, date):
+    day_start = datetime.combine(date, datetime.min.time())
+    return time_index.window(day_start - DAY_CONTEXT, day_start + timedelta(days=1) + DAY_CONTEXT)
+
+# 某一天的渲染指纹（批量模式和监视模式共用，两者生成的图表可以互相跳过）
+# 启用峰值时记录当天的峰值（在整个数据集上检测，受相邻日期影响）；启用血糖反应标注时，
+# 当天注释的基线和反应窗口会读到前一天最后BASELINE_MINUTES和后一天开头WINDOW_MINUTES的读数，一并记录
+def day_fingerprint(date, day_data, time_index, annotations_file, options):
+    from manifest import render_fingerprint
+    from peaks import peaks_between
+    from responses import BASELINE_MINUTES, WINDOW_MINUTES
+    
+    day_start = datetime.combine(date, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    day_peaks = None
+    if options['peaks']:
+        day_peaks = peaks_between(time_index.peaks(options['peak_distance'], options['peak_prominence']),
+                                  day_start, day_end)
+    context = None
+    if options['response_labels']:
+        window = time_index.window(day_start - timedelta(minutes=BASELINE_MINUTES),
+                                   day_end + timedelta(minutes=WINDOW_MINUTES))
+        context = (window.times, window.values)
+    return render_fingerprint(day_data, annotations_file, options, day_peaks, context)
+
+# 批量模式: 只读取一次数据，按天切片后在进程池中渲染所有日期
+# series为已读取的GlucoseSeries（多患者批量时由调用方传入），为None时按命令行参数读取；
+# 每天交给渲染器的是series的视图，不复制数据
+def run_batch(args, series=None):
+    from manifest import RenderManifest
+    
+    if series is None:
+        series = load_series(args)
+    with profiling.stage('group_by_day'):
+        days = dict(series.iter_days())
+    if not days:
+        print(f"错误: '{args.data_dir or args.file}' 中没有数据")
+        sys.exit(1)
+    
+    dates = batch_dates(args, days)
+    
+    os.makedirs(args.image_dir, exist_ok=True)
+    
+    # 峰值在整个数据集上检测一次，结果缓存在series上；不构建整个数据集的时间索引，
+    # 每天只把当天前后的一段转换为时间索引（连同截取的峰值）随任务传给工作进程
+    if args.peaks:
+        with profiling.stage('peaks'):
+            series.peaks(args.peak_distance, args.peak_prominence)
+    
+    # 一次读取注释目录中的所有注释文件和 -a 指定的（可以是多日合并的）注释文件，之后每天只查字典
+    with profiling.stage('annotations_index'):
+        annotation_store = AnnotationStore(args.annotations_dir, args.annotations)
+    
+    # 渲染清单: 数据、注释和渲染选项都没有变化的日期直接跳过
+    render_manifest = RenderManifest(args.image_dir)
+    options = render_options(args)
+    
+    # 性能分析: 每一天在渲染它的进程中单独记录，完成后合并
+    profiler = profiling.active()
+    profile_options = None
+    if profiler is not None:
+        profile_options = {'trace_memory': profiler.trace_memory, 'cprofile_dir': profiler.cprofile_dir}
+    
+    results = {}  # 日期 -> (状态, 输出路径或错误信息)
+    tasks = []
+    fingerprints = {}
+    for date in dates:
+        date_str = date.strftime("%Y/%m/%d")
+        if date not in days:
+            results[date_str] = ('失败', "没有数据")
+            continue
+        annotations_file = find_annotations_file(args.annotations_dir, date, args.annotations)
+        output_path = os.path.join(args.image_dir, default_output_name(date))
+        fingerprint = day_fingerprint(date, days[date], series, annotations_file, options)
+        if not args.force and render_manifest.is_current(output_path, fingerprint):
+            results[date_str] = ('跳过', output_path)
+            continue
+        fingerprints[date_str] = fingerprint
+        # 没有注释的日期使用预设注释（与单日模式一致）
+        annotations = annotation_store.annotations(date) or create_annotations(date_str)
+        tasks.append((days[date], date_str, annotations, output_path,
+                      args.peaks, args.peak_distance, args.peak_prominence,
+                      day_context(series, date), args.dpi, args.response_labels, profile_options))
+    
+    def record(result):
+        date_str, output_path, error, profile_records = result
+        if profiler is not None and profile_records is not None:
+            profiler.merge(date_str, profile_records)
+        if error is None:
+            results[date_str] = ('成功', output_path)
+            render_manifest.record(output_path, fingerprints[date_str])
+            print(f"已生成 {date_str} 的血糖曲线图表: {output_path}")
+        else:
+            results[date_str] = ('失败', error)
+            print(f"生成 {date_str} 的血糖曲线图表失败: {error}")
+    
+    jobs = min(args.jobs or os.cpu_count() or 1, max(len(tasks), 1))
+    try:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(render_day, *task) for task in tasks]
+                for future in as_completed(futures):
+                    record(future.result())
+        else:
+            for task in tasks:
+                record(render_day(*task))
+    finally:
+        # 即使中途中断，也保留已完成日期的记录
+        render_manifest.save()
+    
+    # 输出汇总
+    counts = {status: 0 for status in ('成功', '跳过', '失败')}
+    for status, _ in results.values():
+        counts[status] += 1
+    print("------------------------")
+    print(f"批量生成完成: 渲染 {counts['成功']} 天, 跳过(未变化) {counts['跳过']} 天, 失败 {counts['失败']} 天")
+    for date_str in sorted(results):
+        status, detail = results[date_str]
+        print(f"  {date_str}  {status}  {detail}")
+    
+    if counts['失败']:
+        sys.exit(1)
+
+# 导出目录的批量模式: 所有患者的数据并行读取一次，每个患者的图表保存在图像目录下以患者命名的子目录中
+# 注释目录中存在以患者命名的子目录时使用该子目录
+# 所有患者以紧凑的GlucoseSeries保存，渲染时直接使用按天切片的视图
+def run_batch_patients(args):
+    import copy
+    
+    patients = load_groups(args)
+    if len(patients) == 1:
+        run_batch(args, next(iter(patients.values())))
+        return
+    
+    failed = []
+    for name, series in patients.items():
+        print(f"========== {name} ==========")
+        patient_args = copy.copy(args)
+        patient_args.image_dir = os.path.join(args.image_dir, name)
+        if os.path.isdir(os.path.join(args.annotations_dir, name)):
+            patient_args.annotations_dir = os.path.join(args.annotations_dir, name)
+        try:
+            run_batch(patient_args, series)
+        except SystemExit as e:
+            if e.code:
+                failed.append(name)
+    
+    if failed:
+        print(f"以下分组有日期生成失败: {', '.join(failed)}")
+        sys.exit(1)
+
+# 渲染服务模式: 常驻进程，通过HTTP或Unix套接字接收渲染请求
+def run_serve(args):
+    from server import RenderService, serve
+    
+    # --data-dir 指定请求中的 file 可以使用的导出文件目录，未指定时只能使用 -f 的导出文件
+    if args.data_dir and not os.path.isdir(args.data_dir):
+        print(f"错误: 找不到目录 '{args.data_dir}'")
+        sys.exit(1)
+    if not os.path.exists(args.file):
+        print(f"错误: 找不到文件 '{args.file}'")
+        sys.exit(1)
+    
+    service = RenderService(args.file, annotations_dir=args.annotations_dir, jobs=args.jobs,
+                            cache_size=args.serve_cache, use_cache=not args.no_cache, data_dir=args.data_dir)
+    # 启动时预先加载数据并启动工作进程，第一次请求不需要等待解析和导入matplotlib
+    service.dataset(args.file).dates()
+    service.warm()
+    serve(service, host=args.host, port=args.port, socket_path=args.socket)
+
+# 监视模式: 读取一次全部数据后常驻，监视导出文件（或导出目录）和注释目录，
+# 有新数据或注释变化时只读入新的行，并只重新渲染受影响的日期
+def run_watch(args):
+    import watch
+    
+    series = load_series(args)
+    sources = [] if args.data_dir else [args.file]
+    
+    os.makedirs(args.image_dir, exist_ok=True)
+    session = watch.WatchSession(args, watch.LiveSeries(series.times_ns(), series.values64()), sources)
+    
+    # 启动时先刷新最新一天的图表（没有变化时跳过）
+    latest = session.latest_date()
+    if latest is not None:
+        session.render(latest, force=args.force)
+    
+    watcher = watch.create_watcher(session.directories(), interval=args.watch_interval,
+                                   polling=args.watch_poll)
+    method = 'inotify' if isinstance(watcher, watch.InotifyWatcher) else f'每{args.watch_interval:g}秒轮询'
+    print(f"正在监视 ({method}): {', '.join(session.directories())}，按 Ctrl+C 停止")
+    watch.watch(session, watcher, debounce=args.watch_debounce)
+    print("已停止监视")
+
+# 单日模式: 绘制并保存一天的图表
+def run_single_day(args):
+    # 解析日期
+    target_date = parse_date(args.date)
+    date_str = target_date.strftime("%Y/%m/%d")
+    
+    # 检查文件是否存在
+    if not args.data_dir and not os.path.exists(args.file):
+        print(f"错误: 找不到文件 '{args.file}'")
+        sys.exit(1)
+    
+    # 确保输出目录存在
+    os.makedirs(args.image_dir, exist_ok=True)
+    
+    # 设置输出文件名
+    if args.output:
+        output_file = args.output
+    else:
+        output_file = default_output_name(target_date)
+    
+    # 将输出文件路径与指定目录结合
+    output_path = os.path.join(args.image_dir, output_file)
+    
+    with profiling.scope(date_str):
+        # 加载数据，时间索引包含当天以外的数据
+        df, time_index = load_day_with_context(args, target_date)
+        
+        # 创建注释
+        annotations = create_annotations(date_str, annotations_file=args.annotations)
+        
+        # 绘制图表
+        fig = plot_glucose_curve(df, annotations, date_str, 
+                                show_peaks=args.peaks,
+                                peak_distance=args.peak_distance,
+                                peak_prominence=args.peak_prominence,
+                                time_index=time_index,
+                                response_labels=args.response_labels)
+        
+        # 保存图表
+        with profiling.stage('savefig'):
+            fig.savefig(output_path, dpi=args.dpi, bbox_inches='tight')
+    print(f"图表已保存为: {output_path}")
+    
+    # 显示图表
+    if args.show:
+        load_pyplot().show()
+
+# 按命令行参数选择运行模式
+def run(args):
+    # 列出可用日期
+    if args.list_dates:
+        run_list_dates(args)
+        return
+    
+    # 渲染服务模式
+    if args.serve:
+        run_serve(args)
+        return
+    
+    # 监视模式
+    if args.watch:
+        run_watch(args)
+        return
+    
+    # 指标模式
+    if args.metrics:
+        run_metrics(args)
+        return
+    
+    # 血糖反应模式
+    if args.responses:
+        run_responses(args)
+        return
+    
+    # AGP模式
+    if args.agp:
+        run_agp(args)
+        return
+    
+    # 时间线模式
+    if args.timeline:
+        run_timeline(args)
+        return
+    
+    # 拼图模式
+    if args.mosaic:
+        run_mosaic(args)
+        return
+    
+    # HTML模式
+    if args.html:
+        run_html(args)
+        return
+    
+    # 批量模式，导出目录中有多个患者时逐个渲染
+    if args.start or args.end or args.all_dates:
+        if args.data_dir and not args.patient:
+            run_batch_patients(args)
+        else:
+            run_batch(args)
+        return
+    
+    run_single_day(args)
+
+# 命令行中的正整数参数（argparse的type），0或负数时给出用法错误
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"应为正整数，收到 '{value}'")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"应为正整数，收到 '{value}'")
+    return number
 
 def main():
     # 设置命令行参数
@@ -535,6 +1676,86 @@ def main():
                       help='峰值之间的最小时间间隔(分钟) (默认: 30)')
     parser.add_argument('--peak-prominence', type=float, default=0.3,
                       help='峰值的最小突出度(mmol/L) (默认: 0.3)')
+    parser.add_argument('--start', type=str, default=None,
+                        help='批量模式开始日期 (默认: 数据中的第一天)')
+    parser.add_argument('--end', type=str, default=None,
+                        help='批量模式结束日期 (默认: 数据中的最后一天)')
+    parser.add_argument('--all-dates', action='store_true',
+                        help='批量生成数据中所有日期的图表')
+    parser.add_argument('--annotations-dir', type=str, default='annotations',
+                        help='批量模式下按日期查找 annotations-YYYYMMDD.csv 的目录 (默认: annotations)')
+    parser.add_argument('--data-dir', type=str, default=None,
+                        help='读取目录中所有的 OttaiCGM_*.xlsx 导出文件，按患者（一级子目录）合并去重，代替 -f')
+    parser.add_argument('--patient', type=str, default=None,
+                        help='--data-dir 中只使用此患者（或传感器）的数据 (默认: 只有一个分组时使用该分组，批量模式下处理全部分组)')
+    parser.add_argument('--group-by', choices=['patient', 'sensor'], default='patient',
+                        help='--data-dir 中导出文件的分组方式 (默认: patient)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='批量模式的并行进程数 (默认: CPU核心数)')
+    parser.add_argument('--force', action='store_true',
+                        help='批量模式下忽略渲染清单，重新生成所有日期的图表')
+    parser.add_argument('--dpi', type=int, default=300,
+                        help='输出图像的分辨率 (默认: 300)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不读取也不写入解析缓存，直接解析Excel文件')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                        help='忽略已有缓存，重新解析Excel文件并重建缓存')
+    parser.add_argument('--list-dates', action='store_true',
+                        help='列出数据中的所有日期及每天的数据条数')
+    parser.add_argument('--metrics', action='store_true',
+                        help='计算每天及整个范围的血糖指标 (TIR/TAR/TBR、均值、SD、CV、GMI、MAGE)，不绘图')
+    parser.add_argument('--metrics-format', choices=['csv', 'json'], default='csv',
+                        help='指标输出格式 (默认: csv)')
+    parser.add_argument('--metrics-output', type=str, default=None,
+                        help='指标输出文件 (默认: 输出到标准输出)')
+    parser.add_argument('--responses', action='store_true',
+                        help='计算 --start/--end 范围内（默认全部数据）每个注释事件后的血糖反应（基线、升幅、达峰时间、iAUC、回落时间），不绘图')
+    parser.add_argument('--responses-output', type=str, default=None,
+                        help='血糖反应表CSV文件 (默认: 输出到标准输出)')
+    parser.add_argument('--response-labels', action='store_true',
+                        help='在图表的每个注释后标出事件后2小时内的血糖升幅')
+    parser.add_argument('--agp', action='store_true',
+                        help='绘制 --start/--end 范围内（默认全部数据）的动态血糖图谱(AGP)')
+    parser.add_argument('--agp-bin', type=int, default=15,
+                        help='AGP时间段长度(分钟) (默认: 15)')
+    parser.add_argument('--timeline', action='store_true',
+                        help='绘制 --start/--end 范围内（默认全部数据）的连续血糖时间线')
+    parser.add_argument('--timeline-width', type=float, default=14,
+                        help='时间线图表宽度(英寸) (默认: 14)')
+    parser.add_argument('--mosaic', action='store_true',
+                        help='把 --start/--end 范围内（默认全部数据）的每一天画成小图，排列在一张图中')
+    parser.add_argument('--mosaic-columns', type=positive_int, default=7,
+                        help='拼图每行的天数，为7时按星期排列 (默认: 7)')
+    parser.add_argument('--mosaic-labels', action='store_true',
+                        help='拼图中写出注释文字 (默认: 只画标记)')
+    parser.add_argument('--html', action='store_true',
+                        help='输出为离线HTML文件（canvas绘制，不生成PNG），配合 --start/--end/--all-dates 时多天写入同一个文件')
+    parser.add_argument('--profile', action='store_true',
+                        help='记录各阶段耗时，输出性能报告')
+    parser.add_argument('--profile-output', type=str, default='profile.json',
+                        help='性能报告文件，扩展名为.csv时输出CSV (默认: profile.json)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='性能分析时用tracemalloc记录各阶段的内存峰值（会拖慢运行）')
+    parser.add_argument('--profile-cprofile', type=str, default=None,
+                        help='性能分析时用cProfile采集调用信息，每天保存为此目录下的 YYYYMMDD.prof')
+    parser.add_argument('--watch', action='store_true',
+                        help='监视导出文件（或 --data-dir）和注释目录，有新数据或注释变化时只重新渲染受影响的日期')
+    parser.add_argument('--watch-interval', type=float, default=2.0,
+                        help='无法使用inotify时轮询文件修改时间的间隔(秒) (默认: 2)')
+    parser.add_argument('--watch-debounce', type=float, default=1.0,
+                        help='文件变化后等待多少秒没有新的变化再处理 (默认: 1)')
+    parser.add_argument('--watch-poll', action='store_true',
+                        help='不使用inotify，始终按修改时间轮询（如网络文件系统）')
+    parser.add_argument('--serve', action='store_true',
+                        help='启动常驻渲染服务，通过HTTP接口按请求渲染图表')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='渲染服务监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='渲染服务监听端口 (默认: 8765)')
+    parser.add_argument('--socket', type=str, default=None,
+                        help='渲染服务改为监听此Unix套接字路径')
+    parser.add_argument('--serve-cache', type=int, default=64,
+                        help='渲染服务缓存的最近图像数量 (默认: 64)')
     
     args = parser.parse_args()
     
@@ -544,47 +1765,18 @@ def main():
         if not args.annotations:
             args.annotations = "sample_annotations.csv"
     
-    # 解析日期
-    target_date = parse_date(args.date)
-    date_str = target_date.strftime("%Y/%m/%d")
-    
-    # 检查文件是否存在
-    if not os.path.exists(args.file):
-        print(f"错误: 找不到文件 '{args.file}'")
-        sys.exit(1)
-    
-    # 加载数据
-    df = load_glucose_data(args.file, target_date)
-    
-    # 创建注释
-    annotations = create_annotations(date_str, annotations_file=args.annotations)
-    
-    # 绘制图表
-    fig = plot_glucose_curve(df, annotations, date_str, 
-                            show_peaks=args.peaks,
-                            peak_distance=args.peak_distance,
-                            peak_prominence=args.peak_prominence)
-    
-    # 确保输出目录存在
-    os.makedirs(args.image_dir, exist_ok=True)
-    
-    # 设置输出文件名
-    if args.output:
-        output_file = args.output
-    else:
-        formatted_date = target_date.strftime("%Y年%m月%d日")
-        output_file = f'血糖曲线_{formatted_date}.png'
-    
-    # 将输出文件路径与指定目录结合
-    output_path = os.path.join(args.image_dir, output_file)
-    
-    # 保存图表
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    print(f"图表已保存为: {output_path}")
+    # 性能分析: 记录各阶段耗时，结束时（包括出错退出时）写出报告
+    if args.profile:
+        profiler = profiling.Profiler(trace_memory=args.profile_memory, cprofile_dir=args.profile_cprofile)
+        profiling.enable(profiler)
+        try:
+            run(args)
+        finally:
+            profiling.disable()
+            profiling.write_report(profiler, args.profile_output)
+        return
     
-    # 显示图表
-    if args.show:
-        plt.show()
+    run(args)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,380 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+NS_PER_DAY = 24 * 3600 * 10**9
+
+# inotify事件: 写入完成、修改、创建、删除、移入/移出（导出工具和编辑器常用先写临时文件再改名的方式保存）
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event: wd, mask, cookie, len，之后是len字节的文件名
+_EVENT_HEADER = struct.Struct('iIII')
+
+# int64纳秒时间转换为datetime
+def _to_datetime(ns):
+    return datetime(1970, 1, 1) + timedelta(microseconds=int(ns) // 1000)
+
+class InotifyWatcher:
+    """用Linux inotify监视一组目录，只在目录中的文件发生变化时唤醒"""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(errno, f"无法监视目录 '{directory}'")
+            self.directories[wd] = directory
+
+    # 等待最多timeout秒（None为一直等待），返回有变化的文件路径集合，超时时为空集合
+    def poll(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name and wd in self.directories:
+                changed.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """没有inotify时的后备方案: 每隔interval秒比较目录中文件的大小和修改时间"""
+
+    def __init__(self, directories, interval=2.0):
+        self.directories = list(directories)
+        self.interval = interval
+        self.state = self._scan()
+
+    def _scan(self):
+        state = {}
+        for directory in self.directories:
+            try:
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            state[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                    except OSError:
+                        continue
+        return state
+
+    def poll(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.monotonic(), 0))
+            time.sleep(wait)
+            state = self._scan()
+            changed = {path for path in state.keys() | self.state.keys()
+                       if state.get(path) != self.state.get(path)}
+            self.state = state
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+# 优先使用inotify（Linux），不可用或polling为True时按修改时间轮询
+def create_watcher(directories, interval=2.0, polling=False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directories, interval)
+
+# 等待下一批变化并去抖: 收到第一个变化后继续收集，直到debounce秒内没有新的变化
+# 导出或保存一个文件通常会触发一连串事件，合并后只处理一次
+def wait_for_changes(watcher, debounce=1.0):
+    changed = set()
+    while not changed:
+        changed = watcher.poll(None)
+    while True:
+        more = watcher.poll(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+class LiveSeries:
+    """
+    监视模式下常驻内存的血糖序列
+
+    时间（int64纳秒，升序）和血糖值保存在按倍数扩容的数组中，新数据追加在末尾，
+    每次追加的均摊代价与新数据量成正比，与已有历史的长度无关
+    """
+
+    def __init__(self, times, values):
+        self.length = len(times)
+        capacity = max(self.length * 2, 1024)
+        self._times = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty(capacity, dtype=np.float64)
+        self._times[:self.length] = times
+        self._values[:self.length] = values
+
+    @property
+    def times(self):
+        return self._times[:self.length]
+
+    @property
+    def values(self):
+        return self._values[:self.length]
+
+    # 最后一个采样点的时刻（int64纳秒），没有数据时为None
+    def last_time(self):
+        return int(self._times[self.length - 1]) if self.length else None
+
+    def _reserve(self, length):
+        if length <= len(self._times):
+            return
+        capacity = max(length, len(self._times) * 2)
+        for name in ('_times', '_values'):
+            old = getattr(self, name)
+            grown = np.empty(capacity, dtype=old.dtype)
+            grown[:self.length] = old[:self.length]
+            setattr(self, name, grown)
+
+    # 合并新读取的数据（升序），与已有时刻重复时以新值为准
+    # 只有从第一个重叠时刻开始的尾部参与合并，其余部分不动
+    # 返回新增或值发生变化的最早时刻（int64纳秒），没有变化时为None
+    def ingest(self, new_times, new_values):
+        from dataset import _unique_sorted, merge_sorted
+
+        new_times, new_values = _unique_sorted(np.asarray(new_times, dtype=np.int64),
+                                               np.asarray(new_values, dtype=np.float64))
+        if len(new_times) == 0:
+            return None
+        start = int(np.searchsorted(self.times, new_times[0]))
+        old_times, old_values = self.times[start:], self.values[start:]
+        merged_times, merged_values = merge_sorted(old_times, old_values, new_times, new_values)
+
+        # 第一个与原数据不同的位置
+        common = min(len(old_times), len(merged_times))
+        differs = np.flatnonzero((old_times[:common] != merged_times[:common]) |
+                                 (old_values[:common] != merged_values[:common]))
+        if len(differs):
+            first = int(differs[0])
+        elif len(merged_times) > common:
+            first = common
+        else:
+            return None
+
+        merged_times, merged_values = merged_times.copy(), merged_values.copy()
+        self._reserve(start + len(merged_times))
+        self._times[start:start + len(merged_times)] = merged_times
+        self._values[start:start + len(merged_values)] = merged_values
+        self.length = start + len(merged_times)
+        return int(merged_times[first])
+
+    # 时间在 [start_ns, end_ns) 范围内的部分（视图）
+    def window(self, start_ns, end_ns):
+        first, last = np.searchsorted(self.times, [start_ns, end_ns])
+        return self.times[first:last], self.values[first:last]
+
+class WatchSession:
+    """
+    监视模式: 导出文件或导出目录中有新数据、或注释文件变化时，只读入新数据并重新渲染受影响的日期
+
+    - 导出文件只读取最后一个时刻之后的行（欧态导出按时间倒序，流式读取越过该时刻一天后停止）
+    - 峰值与批量模式一样在整个数据集上检测，缓存在时间索引上；有新数据时只重新检测最后一个分段，指标只计算受影响的日期
+    - 图表由同一个渲染器在当前进程中渲染，并与批量模式共用渲染清单和渲染指纹，两者生成的图表可以互相跳过
+    """
+
+    def __init__(self, args, series, sources):
+        from annotation_store import AnnotationStore
+        from manifest import RenderManifest
+        import visualizer
+
+        self.args = args
+        self.series = series
+        self.sources = set(os.path.abspath(path) for path in sources)
+        if args.data_dir:
+            self.sources = self._export_paths()
+        self.annotations = AnnotationStore(args.annotations_dir, args.annotations)
+        self.manifest = RenderManifest(args.image_dir)
+        self.options = visualizer.render_options(args)
+        self._time_index = None
+
+    # 需要监视的目录: 导出文件所在目录（新导出可能以新文件出现）和注释目录
+    def directories(self):
+        directories = {os.path.dirname(path) for path in self.sources}
+        if self.args.data_dir:
+            directories.add(os.path.abspath(self.args.data_dir))
+        if self.args.annotations_dir and os.path.isdir(self.args.annotations_dir):
+            directories.add(os.path.abspath(self.args.annotations_dir))
+        if self.args.annotations and os.path.exists(self.args.annotations):
+            directories.add(os.path.dirname(os.path.abspath(self.args.annotations)))
+        return sorted(directories)
+
+    # 导出目录中属于当前分组的导出文件（包括监视开始后新出现的文件）
+    def _export_paths(self):
+        from dataset import group_exports, scan_exports
+
+        if not self.args.data_dir:
+            return self.sources
+        groups = group_exports(scan_exports(self.args.data_dir), self.args.group_by)
+        name = self.args.patient or (next(iter(groups)) if len(groups) == 1 else None)
+        return set(os.path.abspath(path) for path in groups.get(name, []))
+
+    # 从一个导出文件读入最后一个时刻（含）之后的数据，返回新增或变化的最早时刻
+    def _ingest(self, path):
+        import visualizer
+
+        last = self.series.last_time()
+        start = None if last is None else _to_datetime(last)
+        try:
+            df = visualizer.parse_glucose_export(path, start=start)
+        except Exception as e:
+            # 导出文件可能仍在写入，等待下一次变化
+            print(f"警告: 暂时无法读取 '{path}': {e}")
+            return None
+        times = df['时刻'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        return self.series.ingest(times, df['血糖值mmol/L'].to_numpy(dtype=float))
+
+    # 处理一批变化的文件，返回需要重新渲染的日期集合
+    def update(self, changed):
+        changed = set(os.path.abspath(path) for path in changed)
+        affected = set()
+
+        exports = self._export_paths()
+        earliest = None
+        for path in sorted(changed & exports):
+            if not os.path.exists(path):
+                continue
+            self.sources.add(path)
+            first = self._ingest(path)
+            if first is not None:
+                earliest = first if earliest is None else min(earliest, first)
+        if earliest is not None:
+            affected |= self._dates_between(earliest, self.series.last_time())
+            # 前一天的跨午夜峰值和血糖反应窗口会读到午夜之后的数据
+            day = _to_datetime(earliest).date()
+            if _to_datetime(earliest) - datetime.combine(day, datetime.min.time()) < self._context_after_midnight():
+                affected.add(day - timedelta(days=1))
+            if self._time_index is not None:
+                self._time_index.update_tail(self.series.times.view('datetime64[ns]'), self.series.values,
+                                             int(np.searchsorted(self.series.times, earliest)))
+
+        for path in sorted(changed - exports):
+            for date in self.annotations.reload_file(path):
+                # 没有日期的注释适用于每一天，只刷新最新的一天
+                affected.add(date if date is not None else self.latest_date())
+        return {date for date in affected if date is not None}
+
+    def _dates_between(self, start_ns, end_ns):
+        first = _to_datetime(start_ns).date()
+        return {first + timedelta(days=i) for i in range((_to_datetime(end_ns).date() - first).days + 1)}
+
+    # 前一天的图表会用到的午夜之后的数据范围: 血糖反应窗口和峰值间隔中较长的一个
+    def _context_after_midnight(self):
+        from responses import WINDOW_MINUTES
+
+        minutes = WINDOW_MINUTES if self.args.response_labels else 0
+        if self.args.peaks:
+            minutes = max(minutes, self.args.peak_distance)
+        return timedelta(minutes=minutes)
+
+    # 整个数据集的时间索引，只构建一次（直接使用常驻序列的数组，不复制），数据变化后由update()更新；
+    # 启用峰值时检测结果缓存在索引上，所有日期共用
+    def time_index(self):
+        from timeindex import TimeIndex
+
+        if self._time_index is None:
+            self._time_index = TimeIndex(self.series.times.view('datetime64[ns]'), self.series.values)
+            if self.args.peaks:
+                self._time_index.peaks(self.args.peak_distance, self.args.peak_prominence)
+        return self._time_index
+
+    def latest_date(self):
+        last = self.series.last_time()
+        if last is None:
+            return None
+        return _to_datetime(last).date()
+
+    # 重新渲染一天的图表并输出当天的指标，force为False且输入没有变化时跳过
+    def render(self, date, force=True):
+        import pandas as pd
+        import metrics
+        import visualizer
+
+        args = self.args
+        date_str = date.strftime("%Y/%m/%d")
+        day_start = datetime.combine(date, datetime.min.time())
+        start_ns = int(np.datetime64(day_start, 'ns').astype(np.int64))
+        times, values = self.series.window(start_ns, start_ns + NS_PER_DAY)
+        if len(times) == 0:
+            return
+        df = pd.DataFrame({'时刻': times.view('datetime64[ns]'), '血糖值mmol/L': values})
+
+        # 指纹和峰值与批量模式相同（整个数据集上检测），渲染时只截取当天前后的部分
+        time_index = self.time_index()
+        output_path = os.path.join(args.image_dir, visualizer.default_output_name(date))
+        annotations_file = visualizer.find_annotations_file(args.annotations_dir, date, args.annotations)
+        fingerprint = visualizer.day_fingerprint(date, df, time_index, annotations_file, self.options)
+        if not force and self.manifest.is_current(output_path, fingerprint):
+            print(f"{date_str} 的图表没有变化: {output_path}")
+            return
+
+        annotations = self.annotations.annotations(date) or visualizer.create_annotations(date_str)
+        _, output_path, error, _ = visualizer.render_day(df, date_str, annotations, output_path,
+                                                         args.peaks, args.peak_distance, args.peak_prominence,
+                                                         visualizer.day_context(time_index, date),
+                                                         args.dpi, args.response_labels)
+        if error is not None:
+            print(f"生成 {date_str} 的血糖曲线图表失败: {error}")
+            return
+        self.manifest.record(output_path, fingerprint)
+        self.manifest.save()
+
+        summary = metrics.compute_metrics(df, normal_min=visualizer.NORMAL_MIN,
+                                          normal_max=visualizer.NORMAL_MAX).iloc[0]
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 已更新 {date_str}: {output_path}  "
+              f"最新 {values[-1]:.1f} mmol/L ({_to_datetime(times[-1]).strftime('%H:%M')}), "
+              f"均值 {summary['mean']:.1f}, TIR {summary['tir']:.0f}%, TAR {summary['tar']:.0f}%, "
+              f"TBR {summary['tbr']:.0f}%")
+
+# 监视循环，直到Ctrl+C
+def watch(session, watcher, debounce=1.0):
+    try:
+        while True:
+            changed = wait_for_changes(watcher, debounce)
+            for date in sorted(session.update(changed)):
+                session.render(date)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
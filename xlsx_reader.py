@@ -0,0 +1,109 @@
+import re
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+TIME_COLUMN = '时刻'
+VALUE_COLUMN = '血糖值mmol/L'
+
+_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+# 越过读取范围后继续检查排序的时长: 范围外的行在这段时间内一直保持原来的排序方向才提前停止读取；
+# 期间出现倒退的行（如多个传感器的数据拼接在一起）时不再提前停止，范围外的行只跳过
+EARLY_STOP_MARGIN_NS = 24 * 3600 * 10**9
+
+# 欧态导出的时间文本，如 "2025.3.20 01:45"、"2025/03/20 01:45:00"、"2025-3-20 1:45"
+_TIME_PATTERN = re.compile(r'(\d{4})[./-](\d{1,2})[./-](\d{1,2})[ T]+(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?\s*$')
+
+# datetime -> 纳秒时间戳（不做时区转换）
+def _datetime_ns(dt):
+    return (dt - _EPOCH) // _ONE_MICROSECOND * 1000
+
+# 将单元格的值解析为纳秒时间戳，无法解析时返回None
+def parse_time_cell(value):
+    if isinstance(value, datetime):
+        return _datetime_ns(value)
+    if value is None:
+        return None
+
+    text = str(value).strip()
+    match = _TIME_PATTERN.match(text)
+    if match:
+        year, month, day, hour, minute, second = match.groups()
+        return _datetime_ns(datetime(int(year), int(month), int(day),
+                                     int(hour), int(minute), int(second or 0)))
+
+    # 其他格式交给pandas解析
+    import pandas as pd
+    try:
+        return pd.Timestamp(text).as_unit('ns').value
+    except (ValueError, TypeError):
+        return None
+
+# 以只读模式流式读取导出文件，只保留时间和血糖值两列
+# start/end为datetime（或None），只保留 start <= 时刻 < end 的行
+# 导出文件按时间排序（欧态导出为倒序）时，越过范围EARLY_STOP_MARGIN_NS后停止读取；
+# 每一行都检查排序方向，时刻出现倒退后不再提前停止，之后范围外的行只跳过
+# 返回按时间升序排列的 (int64纳秒时间数组, float64血糖值数组)
+def read_glucose_columns(file_path, start=None, end=None):
+    from openpyxl import load_workbook
+
+    start_ns = _datetime_ns(start) if start is not None else None
+    end_ns = _datetime_ns(end) if end is not None else None
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        # 继续使用同一个行迭代器，避免openpyxl为计算表格尺寸而额外扫描整张表
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        if TIME_COLUMN not in header or VALUE_COLUMN not in header:
+            raise ValueError(f"文件 '{file_path}' 缺少 '{TIME_COLUMN}' 或 '{VALUE_COLUMN}' 列")
+        time_col = header.index(TIME_COLUMN)
+        value_col = header.index(VALUE_COLUMN)
+
+        times = array('q')
+        values = array('d')
+        previous = None
+        direction = 0  # 1: 升序, -1: 降序, None: 无序（不能提前停止）
+        needed = max(time_col, value_col)
+        for row in rows:
+            if len(row) <= needed:
+                continue
+            t = parse_time_cell(row[time_col])
+            value = row[value_col]
+            if t is None or value is None or value == '':
+                continue
+
+            # 跟踪排序方向
+            if previous is not None and direction is not None and t != previous:
+                step = 1 if t > previous else -1
+                if direction == 0:
+                    direction = step
+                elif step != direction:
+                    direction = None
+            previous = t
+
+            if start_ns is not None and t < start_ns:
+                if direction == -1 and t < start_ns - EARLY_STOP_MARGIN_NS:
+                    break
+                continue
+            if end_ns is not None and t >= end_ns:
+                if direction == 1 and t >= end_ns + EARLY_STOP_MARGIN_NS:
+                    break
+                continue
+
+            try:
+                values.append(float(value))
+            except (TypeError, ValueError):
+                continue
+            times.append(t)
+    finally:
+        workbook.close()
+
+    times = np.frombuffer(times, dtype=np.int64) if len(times) else np.empty(0, dtype=np.int64)
+    values = np.frombuffer(values, dtype=np.float64) if len(values) else np.empty(0, dtype=np.float64)
+    order = np.argsort(times, kind='stable')
+    return times[order], values[order]